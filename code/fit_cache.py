@@ -0,0 +1,310 @@
+# -*- coding: utf-8 -*-
+"""
+Persistent cache for SpecParam fit results.
+
+Fit results are stored in a content-addressed cache, one entry for each power
+spectrum: each entry is keyed by a hash of the power spectrum, frequency
+vector, frequency range, SpecParam settings (including aperiodic mode), check
+modes, model class (cache_tag) and SpecParam version. Fits of the same spectrum
+are therefore shared across scripts and groups, e.g. when a subset of the
+channels of step4 is refit in the multiverse analysis. For sequential models
+(fits depend on the previous spectra, e.g. WarmStartGroupModel), the key of
+each spectrum also includes the key of the previous spectrum.
+
+Entries are stored as numpy arrays in subdirectories named by the first two
+characters of the key, and written to a temporary file first, so that
+concurrent readers and writers never see a partially written entry. The cache
+is bounded in size (least recently used entries are evicted first).
+
+Entry layout: number of aperiodic parameters, number of peaks, aperiodic
+parameters, r-squared, error, then peak and gaussian parameters.
+"""
+
+# Imports
+import os
+import hashlib
+import tempfile
+import numpy as np
+from parallel_fit import fit_group, _scatter_results
+
+
+def fit_group_cached(sgm, freqs, spectra, freq_range=None, n_jobs=1,
+                     cache_dir=None, max_size=None, backend='shared_memory',
+                     exclude=None):
+    """
+    Fit a SpectralGroupModel, loading results from the cache if available.
+    Only spectra without a cache entry are fit (sequential models are refit
+    entirely if any entry is missing). Excluded spectra are not fit; their
+    results are set to NaN (see parallel_fit.fit_group), and are not cached.
+
+    Parameters
+    ----------
+    sgm : SpectralGroupModel object
+        Model object, initialized with the desired settings (and check modes).
+    freqs : 1d array
+        Frequency values.
+    spectra : 2d array
+        Power spectra, of shape (n_spectra, n_freqs).
+    freq_range : list of [float, float], optional
+        Frequency range to fit. If None, the full range is used.
+    n_jobs : int, optional, default: 1
+        Number of jobs to run in parallel (if fitting is required).
+    cache_dir : str, optional
+        Cache directory. If None, the model is fit without caching.
+    max_size : float, optional
+        Maximum size of the cache (bytes). If None, the cache is not bounded.
+    backend : {'shared_memory', 'specparam'}, optional
+        Parallel backend for fitting (see parallel_fit.fit_group).
+    exclude : 1d array of bool, optional
+        Spectra to skip (e.g. channels rejected in step3).
+
+    Returns
+    -------
+    sgm : SpectralGroupModel object
+        Fit model object (same object as the input).
+    """
+
+    # fit without cache
+    if cache_dir is None:
+        fit_group(sgm, freqs, spectra, freq_range=freq_range, n_jobs=n_jobs,
+                  backend=backend, exclude=exclude)
+        return sgm
+
+    # load results of included spectra from cache, if available (unreadable
+    # entries are missing; for sequential models, keys are chained over the
+    # included spectra, as they are fit)
+    spectra = np.asarray(spectra)
+    if exclude is None:
+        exclude = np.zeros(len(spectra), dtype=bool)
+    exclude = np.asarray(exclude, dtype=bool)
+    included = np.flatnonzero(~exclude)
+    keys = compute_cache_keys(sgm, freqs, spectra[included], freq_range)
+    fnames = [_get_entry_fname(cache_dir, key) for key in keys]
+    results = [_load_entry(fname) for fname in fnames]
+    missing = [ii for ii, res in enumerate(results) if res is None]
+    if missing and getattr(sgm, 'sequential', False):
+        missing = list(range(len(results)))
+
+    # fit missing spectra, then add data and results of all spectra
+    if len(missing) == len(results):
+        fit_group(sgm, freqs, spectra, freq_range=freq_range, n_jobs=n_jobs,
+                  backend=backend, exclude=exclude)
+        results = [sgm.group_results[ii] for ii in included]
+    else:
+        if missing:
+            fit_group(sgm, freqs, spectra[included[missing]],
+                      freq_range=freq_range, n_jobs=n_jobs, backend=backend)
+            for ii, res in zip(missing, sgm.get_results()):
+                results[ii] = res
+        sgm.add_data(freqs, spectra[included], freq_range)
+        sgm.group_results = results
+        if np.any(exclude):
+            _scatter_results(sgm, freqs, spectra, freq_range,
+                             np.where(exclude, 'excluded', 'valid'))
+
+    # mark entries as recently used, and store new results
+    missing = set(missing)
+    for ii, fname in enumerate(fnames):
+        if ii in missing:
+            _save_entry(fname, results[ii])
+        else:
+            try:
+                os.utime(fname)
+            except FileNotFoundError: # evicted by another process
+                _save_entry(fname, results[ii])
+    if max_size is not None and missing:
+        evict_cache(cache_dir, max_size)
+
+    return sgm
+
+
+def fit_models_3d_cached(sgm, freqs, spectra, freq_range=None, n_jobs=1,
+                         cache_dir=None, max_size=None, backend='shared_memory',
+                         exclude=None):
+    """
+    Fit a 3d array of power spectra (see specparam.fit_models_3d), loading
+    results from the cache if available.
+
+    Parameters
+    ----------
+    sgm : SpectralGroupModel object
+        Model object, initialized with the desired settings (and check modes).
+    freqs : 1d array
+        Frequency values.
+    spectra : 3d array
+        Power spectra, of shape (n_conditions, n_spectra, n_freqs).
+    freq_range, n_jobs, cache_dir, max_size, backend : optional
+        See fit_group_cached.
+    exclude : array of bool, optional
+        Spectra to skip, broadcastable to (n_conditions, n_spectra), e.g. a
+        channel mask of shape (n_spectra,) applied to all conditions.
+
+    Returns
+    -------
+    models : list of SpectralGroupModel
+        Fit model objects, one for each condition (first dimension).
+    """
+
+    # reshape to 2d and fit
+    shape = np.shape(spectra)
+    spectra_2d = np.reshape(spectra, (shape[0] * shape[1], shape[2]))
+    if exclude is not None:
+        exclude = np.broadcast_to(exclude, shape[:2]).ravel()
+    fit_group_cached(sgm, freqs, spectra_2d, freq_range=freq_range,
+                     n_jobs=n_jobs, cache_dir=cache_dir, max_size=max_size,
+                     backend=backend, exclude=exclude)
+
+    # reorganize results to reflect original shape
+    models = [sgm.get_group(range(ii * shape[1], (ii + 1) * shape[1]))
+              for ii in range(shape[0])]
+
+    return models
+
+
+def compute_cache_keys(sgm, freqs, spectra, freq_range=None):
+    """
+    Compute the cache key of each power spectrum: a hash of the power spectrum,
+    frequency vector, frequency range, SpecParam settings, check modes,
+    cache_tag of the model class (if any), and SpecParam version. For
+    sequential models, the key of the previous spectrum is included.
+
+    Parameters
+    ----------
+    sgm : SpectralModel or SpectralGroupModel object
+        Model object, initialized with the desired settings.
+    freqs : 1d array
+        Frequency values.
+    spectra : 1d or 2d array
+        Power spectra, of shape (n_spectra, n_freqs).
+    freq_range : list of [float, float], optional
+        Frequency range to fit.
+
+    Returns
+    -------
+    keys : list of str
+        Cache key (hex digest) of each spectrum.
+    """
+
+    # imports
+    from specparam import __version__
+
+    # hash frequencies and settings (shared by all spectra)
+    hasher = hashlib.sha256()
+    freqs = np.ascontiguousarray(freqs, dtype=float)
+    hasher.update(repr(freqs.shape).encode())
+    hasher.update(freqs.tobytes())
+    settings = [tuple(np.ravel(value).tolist()) for value in sgm.get_settings()]
+    check_modes = (sgm._check_freqs, sgm._check_data)
+    if freq_range is not None:
+        freq_range = tuple(np.ravel(freq_range).astype(float).tolist())
+    hasher.update(repr((settings, check_modes, freq_range, __version__,
+                        getattr(sgm, 'cache_tag', None))).encode())
+
+    # hash each spectrum (and the previous key, for sequential models)
+    keys = []
+    sequential = getattr(sgm, 'sequential', False)
+    for spectrum in np.atleast_2d(np.asarray(spectra, dtype=float)):
+        hasher_i = hasher.copy()
+        hasher_i.update(np.ascontiguousarray(spectrum).tobytes())
+        if sequential and keys:
+            hasher_i.update(keys[-1].encode())
+        keys.append(hasher_i.hexdigest())
+
+    return keys
+
+
+def evict_cache(cache_dir, max_size):
+    """
+    Remove least recently used entries until the cache is below max_size.
+
+    Parameters
+    ----------
+    cache_dir : str
+        Cache directory.
+    max_size : float
+        Maximum size of the cache (bytes).
+    """
+
+    # get entries, sorted from least to most recently used
+    entries = []
+    for path, _, files in os.walk(cache_dir):
+        for fname in files:
+            if not fname.endswith('.npy'):
+                continue
+            fname = os.path.join(path, fname)
+            try:
+                stat = os.stat(fname)
+            except FileNotFoundError: # removed by another process
+                continue
+            entries.append((stat.st_mtime, stat.st_size, fname))
+    entries = sorted(entries)
+
+    # remove entries until cache is below max size
+    total_size = sum([size for _, size, _ in entries])
+    for _, size, fname in entries[:-1]: # always keep most recent entry
+        if total_size <= max_size:
+            break
+        total_size -= size
+        try:
+            os.remove(fname)
+        except FileNotFoundError: # removed by another process
+            continue
+
+
+def _get_entry_fname(cache_dir, key):
+    """Filename of the cache entry for a key."""
+
+    return os.path.join(cache_dir, key[:2], f"{key}.npy")
+
+
+def _save_entry(fname, result):
+    """
+    Save FitResults of one spectrum. The entry is written to a unique
+    temporary file, then moved into place.
+    """
+
+    # flatten results (see module docstring for layout)
+    peak_params = np.reshape(result.peak_params, [-1, 3])
+    gaussian_params = np.reshape(result.gaussian_params, [-1, 3])
+    entry = np.concatenate([[len(result.aperiodic_params), len(peak_params)],
+                            result.aperiodic_params,
+                            [result.r_squared, result.error],
+                            peak_params.ravel(), gaussian_params.ravel()])
+
+    # write to temporary file, then move into place
+    path = os.path.dirname(fname)
+    os.makedirs(path, exist_ok=True)
+    fd, fname_temp = tempfile.mkstemp(dir=path, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, entry.astype(float))
+        os.replace(fname_temp, fname)
+    except BaseException:
+        os.remove(fname_temp)
+        raise
+
+
+def _load_entry(fname):
+    """
+    Load FitResults of one spectrum saved with _save_entry. Returns None if the
+    entry is missing or cannot be read.
+    """
+
+    # imports
+    from specparam.data import FitResults
+
+    # load entry
+    try:
+        entry = np.load(fname)
+        n_ap, n_peaks = int(entry[0]), int(entry[1])
+    except (OSError, ValueError, EOFError, IndexError):
+        return None
+    if entry.ndim != 1 or len(entry) != 4 + n_ap + 6 * n_peaks:
+        return None
+
+    # create FitResults
+    peaks = entry[4 + n_ap:].reshape([2, n_peaks, 3])
+    result = FitResults(entry[2:2 + n_ap], peaks[0], entry[2 + n_ap],
+                        entry[3 + n_ap], peaks[1])
+
+    return result
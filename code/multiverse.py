@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""
+Multiverse analysis engine.
+
+A multiverse analysis runs the same analysis for many combinations of
+settings (branches). The analysis is defined as a chain of stages, e.g.
+PSD -> fit -> band power -> statistics, where each stage depends on a subset
+of the settings. Branches that agree on the settings of a stage and of all
+upstream stages share its result: each distinct intermediate result (node) is
+computed only once, and the distinct nodes of each stage are computed in
+parallel. Node results are stored on disk and workers are sent only the file
+names, so that large upstream results (e.g. all power spectra) are not
+pickled for each node.
+"""
+
+# Imports
+import os
+import shutil
+import itertools
+import tempfile
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed, dump, load
+
+
+def expand_grid(grid, defaults=None, one_at_a_time=False):
+    """
+    Expand a grid of settings into a list of branches.
+
+    Parameters
+    ----------
+    grid : dict
+        Values of each setting, e.g. {'ap_mode' : ['fixed', 'knee']}.
+    defaults : dict, optional
+        Default value of each setting. Required if one_at_a_time is True;
+        settings that are not in the grid are added to each branch.
+    one_at_a_time : bool, optional, default: False
+        If False, all combinations of settings are returned. If True, one
+        setting is varied at a time, with all other settings at their default
+        values.
+
+    Returns
+    -------
+    branches : list of dict
+        Settings of each branch (duplicates are removed).
+    """
+
+    defaults = dict() if defaults is None else defaults
+
+    # create branches
+    if one_at_a_time:
+        branches = [{**defaults, setting : value}
+                    for setting, values in grid.items() for value in values]
+    else:
+        branches = [{**defaults, **dict(zip(grid.keys(), values))}
+                    for values in itertools.product(*grid.values())]
+
+    # remove duplicate branches
+    unique = dict()
+    for branch in branches:
+        unique.setdefault(_freeze(branch), branch)
+
+    return list(unique.values())
+
+
+def run_multiverse(stages, branches, data=None, n_jobs=1, dir_store=None):
+    """
+    Run a multiverse analysis. Each distinct node (stage result for a
+    combination of the settings of the stage and all upstream stages) is
+    computed once.
+
+    Parameters
+    ----------
+    stages : list of (str, callable, list of str)
+        Stages of the analysis, in order, as (name, func, settings). Each
+        stage is called as func(upstream, **settings), where upstream is the
+        result of the previous stage (data for the first stage), and must be
+        picklable (defined at module level).
+    branches : list of dict
+        Settings of each branch (see expand_grid). Must include the settings
+        of all stages.
+    data : object, optional
+        Input data, passed to the first stage.
+    n_jobs : int, optional, default: 1
+        Number of nodes to compute in parallel. -1 uses all available cores.
+    dir_store : str, optional
+        Directory to store node results in (removed when done). If None, a
+        temporary directory is used.
+
+    Returns
+    -------
+    results : list
+        Result of the last stage for each branch.
+    """
+
+    # init: all branches share the input data
+    dir_store = tempfile.mkdtemp() if dir_store is None else dir_store
+    os.makedirs(dir_store, exist_ok=True)
+    keys = [tuple() for _ in branches]
+    fnames = {tuple() : os.path.join(dir_store, 'data.pkl')}
+    dump(data, fnames[tuple()])
+
+    try:
+        for name, func, settings in stages:
+            # identify distinct nodes of stage (same upstream and stage settings)
+            nodes = dict()
+            for i_branch, branch in enumerate(branches):
+                key = keys[i_branch] + tuple(_freeze(branch[setting])
+                                             for setting in settings)
+                if key not in nodes:
+                    nodes[key] = (keys[i_branch],
+                                  {setting : branch[setting] for setting in settings})
+                keys[i_branch] = key
+            print(f"Stage '{name}': {len(nodes)} nodes for {len(branches)} "
+                  f"branches")
+
+            # compute nodes in parallel (results are passed through dir_store)
+            fnames_out = {key : os.path.join(dir_store, f"{name}_{i_node}.pkl")
+                          for i_node, key in enumerate(nodes)}
+            Parallel(n_jobs=n_jobs)(
+                delayed(_run_node)(func, fnames[upstream], fnames_out[key],
+                                   kwargs)
+                for key, (upstream, kwargs) in nodes.items())
+
+            # remove results of previous stage
+            for fname in fnames.values():
+                os.remove(fname)
+            fnames = fnames_out
+
+        # load results of last stage
+        results = {key : load(fname) for key, fname in fnames.items()}
+    finally:
+        shutil.rmtree(dir_store, ignore_errors=True)
+
+    return [results[key] for key in keys]
+
+
+def _run_node(func, fname_upstream, fname_out, kwargs):
+    """
+    Compute a node from the upstream result stored in fname_upstream, and
+    store the result in fname_out. Arrays of the upstream result are
+    memory-mapped (copy-on-write), so nodes sharing an upstream result share
+    its memory.
+    """
+
+    output = func(load(fname_upstream, mmap_mode='c'), **kwargs)
+    dump(output, fname_out)
+
+
+def collect_results(branches, results, settings=None):
+    """
+    Combine the results of a multiverse analysis into a single table, with
+    the settings of each branch as columns.
+
+    Parameters
+    ----------
+    branches : list of dict
+        Settings of each branch.
+    results : list of pd.DataFrame
+        Result of each branch (see run_multiverse).
+    settings : list of str, optional
+        Settings to add as columns. If None, all settings are added.
+
+    Returns
+    -------
+    df : pd.DataFrame
+        Combined results.
+    """
+
+    df_list = []
+    for i_branch, (branch, df) in enumerate(zip(branches, results)):
+        df = df.copy()
+        columns = ['branch'] + list(branch.keys() if settings is None
+                                    else settings)
+        values = [i_branch] + [branch[setting] for setting in columns[1:]]
+        for ii, (column, value) in enumerate(zip(columns, values)):
+            # (list-valued settings, e.g. frequency ranges, are stored as is)
+            df.insert(ii, column, [value] * len(df))
+        df_list.append(df)
+
+    return pd.concat(df_list, ignore_index=True)
+
+
+def _freeze(value):
+    """Convert a setting value to a hashable representation."""
+
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(val)) for key, val in value.items()))
+    elif isinstance(value, (list, tuple, np.ndarray)):
+        return tuple(_freeze(val) for val in value)
+    else:
+        return value
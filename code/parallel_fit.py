@@ -0,0 +1,295 @@
+# -*- coding: utf-8 -*-
+"""
+Process-parallel fitting of SpecParam models using shared memory.
+
+SpectralGroupModel.fit(n_jobs > 1) pickles the model object, including all
+power spectra, to send to the workers. Here, the (log-transformed) power
+spectra are placed in shared memory once; workers are sent only the model
+settings and an index range, and write their results to a shared output
+buffer (peak parameters, which vary in number, are returned by the workers).
+"""
+
+# Imports
+import numpy as np
+from multiprocessing import shared_memory, resource_tracker
+from joblib import Parallel, delayed, cpu_count
+
+
+def fit_group(sgm, freqs, spectra, freq_range=None, n_jobs=1,
+              backend='shared_memory', triage=True, exclude=None):
+    """
+    Fit a SpectralGroupModel, with the selected parallel backend.
+
+    If triage is True, spectra that cannot be fit (see
+    specparam_utils.triage_spectra) are not sent to the fitter; their results
+    are set to NaN, as for a failed fit.
+
+    Sequential models (fits depend on the previous spectra, e.g.
+    specparam_utils.TrackingGroupModel) are always fit serially.
+
+    Parameters
+    ----------
+    sgm : SpectralGroupModel object
+        Model object, initialized with the desired settings (and check modes).
+    freqs : 1d array
+        Frequency values.
+    spectra : 2d array
+        Power spectra, of shape (n_spectra, n_freqs).
+    freq_range : list of [float, float], optional
+        Frequency range to fit. If None, the full range is used.
+    n_jobs : int, optional, default: 1
+        Number of jobs to run in parallel. -1 uses all available cores.
+    backend : {'shared_memory', 'specparam'}, optional
+        Parallel backend. 'shared_memory': see fit_group_shared. 'specparam':
+        SpectralGroupModel.fit (model and spectra are pickled for workers).
+    triage : bool, optional, default: True
+        Whether to skip spectra that cannot be fit.
+    exclude : 1d array of bool, optional
+        Spectra to skip (e.g. channels rejected in step3). Requires triage.
+
+    Returns
+    -------
+    sgm : SpectralGroupModel object
+        Fit model object (same object as the input).
+    """
+
+    # imports
+    from specparam_utils import triage_spectra
+
+    if backend not in ['shared_memory', 'specparam']:
+        raise ValueError(f"Invalid backend: {backend}")
+    if getattr(sgm, 'sequential', False):
+        n_jobs = 1
+
+    # fit all spectra, if there is nothing to skip
+    labels = None
+    if triage:
+        labels = triage_spectra(freqs, spectra, freq_range, exclude)
+    if labels is None or np.all(labels == 'valid'):
+        _fit_backend(sgm, freqs, spectra, freq_range, n_jobs, backend)
+        return sgm
+
+    # fit valid spectra only
+    spectra = np.asarray(spectra)
+    valid = labels == 'valid'
+    if np.any(valid):
+        _fit_backend(sgm, freqs, spectra[valid], freq_range, n_jobs, backend)
+    _scatter_results(sgm, freqs, spectra, freq_range, labels)
+
+    return sgm
+
+
+def _fit_backend(sgm, freqs, spectra, freq_range, n_jobs, backend):
+    """Fit a SpectralGroupModel with the selected parallel backend."""
+
+    if backend == 'shared_memory':
+        fit_group_shared(sgm, freqs, spectra, freq_range=freq_range,
+                         n_jobs=n_jobs)
+    else:
+        sgm.fit(freqs, spectra, n_jobs=n_jobs, freq_range=freq_range)
+
+
+def _scatter_results(sgm, freqs, spectra, freq_range, labels):
+    """
+    Expand the data and results of a model fit to the valid spectra only, to
+    all spectra. Skipped spectra are given NaN results (as for a failed fit),
+    and fit statistics (if recorded) with the triage label as outcome.
+    """
+
+    # imports
+    from specparam.data import FitResults
+    from specparam.utils import trim_spectrum
+    from specparam_utils import FitInstrumentation
+
+    # add data for all spectra (log-transformed, as in add_data)
+    valid = labels == 'valid'
+    freqs, spectra = trim_spectrum(freqs, spectra, freq_range) \
+        if freq_range is not None else (freqs, spectra)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        power_spectra = np.log10(spectra)
+    if np.any(valid):
+        power_spectra[valid] = sgm.power_spectra
+    sgm.freqs = freqs
+    sgm.freq_range = [freqs.min(), freqs.max()]
+    sgm.freq_res = freqs[1] - freqs[0]
+    sgm.power_spectra = power_spectra
+
+    # add NaN results for skipped spectra
+    n_ap = 3 if sgm.aperiodic_mode == 'knee' else 2
+    results = iter(sgm.group_results if np.any(valid) else [])
+    sgm.group_results = [next(results) if is_valid else
+                         FitResults(np.full(n_ap, np.nan), np.empty([0, 3]),
+                                    np.nan, np.nan, np.empty([0, 3]))
+                         for is_valid in valid]
+
+    # add fit statistics for skipped spectra
+    if isinstance(sgm, FitInstrumentation) and \
+            len(getattr(sgm, 'fit_stats_', [])) == np.sum(valid):
+        stats = iter(getattr(sgm, 'fit_stats_', []))
+        sgm.fit_stats_ = [next(stats) if label == 'valid' else
+                          {'time' : 0., 'n_optimizer_calls' : 0, 'n_fev' : 0,
+                           'n_peaks_attempted' : 0, 'n_peaks' : 0,
+                           'outcome' : label} for label in labels]
+        for ind, stat in enumerate(sgm.fit_stats_):
+            stat['index'] = ind
+
+
+def fit_group_shared(sgm, freqs, spectra, freq_range=None, n_jobs=-1,
+                     n_chunks=None):
+    """
+    Fit a SpectralGroupModel in parallel, sharing the power spectra and the
+    results with the worker processes through shared memory.
+
+    Parameters
+    ----------
+    sgm : SpectralGroupModel object
+        Model object, initialized with the desired settings (and check modes).
+    freqs : 1d array
+        Frequency values.
+    spectra : 2d array
+        Power spectra, of shape (n_spectra, n_freqs).
+    freq_range : list of [float, float], optional
+        Frequency range to fit. If None, the full range is used.
+    n_jobs : int, optional, default: -1
+        Number of jobs to run in parallel. -1 uses all available cores.
+    n_chunks : int, optional
+        Number of index ranges to split the spectra into. If None, 4 chunks per
+        job are used (for load balancing). Sequential models are fit serially
+        (splitting would break the chain of fits at chunk boundaries).
+
+    Returns
+    -------
+    sgm : SpectralGroupModel object
+        Fit model object (same object as the input).
+    """
+
+    # imports
+    from specparam.data import FitResults
+    from specparam_utils import FitInstrumentation
+
+    # fit serially if parallel processing is not requested (or not possible)
+    if n_jobs == 1 or getattr(sgm, 'sequential', False):
+        sgm.fit(freqs, spectra, freq_range=freq_range)
+        return sgm
+
+    # add data (checks, trimming, and log-transform)
+    sgm.add_data(freqs, spectra, freq_range)
+    n_spectra, n_freqs = sgm.power_spectra.shape
+    n_jobs = cpu_count() if n_jobs == -1 else n_jobs
+    if n_chunks is None:
+        n_chunks = 4 * n_jobs
+    chunks = np.array_split(np.arange(n_spectra), min(n_chunks, n_spectra))
+
+    # output layout: aperiodic params, r-squared, error
+    n_ap = 3 if sgm.aperiodic_mode == 'knee' else 2
+    n_out = n_ap + 2
+
+    # place spectra and output buffer in shared memory
+    shm_in = shared_memory.SharedMemory(create=True,
+                                        size=sgm.power_spectra.nbytes)
+    shm_out = shared_memory.SharedMemory(create=True,
+                                         size=n_spectra * n_out * 8)
+    power_spectra = sgm.power_spectra
+    try:
+        np.ndarray(power_spectra.shape, dtype=float, buffer=shm_in.buf)[:] = \
+            power_spectra
+
+        # send model without data to workers
+        sgm.power_spectra = None
+        outputs = Parallel(n_jobs=n_jobs)(
+            delayed(_fit_chunk)(sgm, shm_in.name, shm_out.name,
+                                (n_spectra, n_freqs), n_out, chunk[0],
+                                chunk[-1] + 1) for chunk in chunks)
+
+        # collect results
+        out = np.ndarray((n_spectra, n_out), dtype=float, buffer=shm_out.buf)
+        out = out.copy()
+    finally:
+        sgm.power_spectra = power_spectra
+        for shm in [shm_in, shm_out]:
+            # restore registration, in case workers sharing the resource
+            # tracker removed it (see _attach)
+            resource_tracker.register(shm._name, 'shared_memory')
+            shm.close()
+            shm.unlink()
+
+    # create FitResults for each spectrum
+    peaks = [peaks_ii for peaks_chunk, _ in outputs for peaks_ii in peaks_chunk]
+    sgm.group_results = [FitResults(out[ii, :n_ap], peaks[ii][0],
+                                    out[ii, n_ap], out[ii, n_ap + 1],
+                                    peaks[ii][1])
+                         for ii in range(n_spectra)]
+
+    # collect fit statistics (instrumented models)
+    if isinstance(sgm, FitInstrumentation):
+        sgm.fit_stats_ = [stat for _, stats in outputs for stat in stats]
+
+    # clear the individual power spectrum and fit results, as in fit()
+    sgm._reset_data_results(clear_spectrum=True, clear_results=True)
+
+    return sgm
+
+
+def _fit_chunk(sgm, name_in, name_out, shape, n_out, start, stop):
+    """
+    Fit spectra [start, stop) from shared memory and write results to the
+    shared output buffer. Returns the peak and gaussian parameters of each
+    spectrum, and the fit statistics (instrumented models; empty otherwise).
+    """
+
+    # imports
+    from specparam_utils import FitInstrumentation
+
+    # sequential models must see all spectra in order (see fit_group_shared)
+    if getattr(sgm, 'sequential', False):
+        raise ValueError(f"{type(sgm).__name__} cannot be fit in chunks.")
+
+    # attach to shared memory
+    shm_in, shm_out = _attach(name_in), _attach(name_out)
+    power_spectra = np.ndarray(shape, dtype=float, buffer=shm_in.buf)
+    out = np.ndarray((shape[0], n_out), dtype=float, buffer=shm_out.buf)
+
+    # fit each spectrum (as in SpectralGroupModel.fit)
+    sgm.power_spectra = power_spectra[start:stop].copy()
+    if isinstance(sgm, FitInstrumentation):
+        sgm.fit_stats_ = []
+    peaks = []
+    for ind, power_spectrum in enumerate(sgm.power_spectra, start):
+        sgm._fit(power_spectrum=power_spectrum)
+        results = sgm._get_results()
+
+        # write results
+        out[ind] = np.concatenate([results.aperiodic_params,
+                                   [results.r_squared, results.error]])
+        peaks.append((results.peak_params, results.gaussian_params))
+
+    # release shared memory
+    del power_spectra, out
+    shm_in.close()
+    shm_out.close()
+
+    # fit statistics, indexed from start of chunk
+    fit_stats = getattr(sgm, 'fit_stats_', [])
+    for stat in fit_stats:
+        stat['index'] += start
+
+    return peaks, fit_stats
+
+
+def _attach(name):
+    """
+    Attach to an existing shared memory block, without tracking it (the parent
+    process owns and unlinks it). Before python 3.13, attaching always
+    registers the block with the resource tracker, which would unlink it (and
+    warn of a leak) when the worker exits, so the registration is removed
+    explicitly. If the worker shares the tracker of the parent process (as
+    joblib workers do), this also removes the parent's registration, which
+    fit_group_shared restores before unlinking the block.
+    """
+
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError: # python < 3.13
+        shm = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
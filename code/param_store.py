@@ -0,0 +1,315 @@
+# -*- coding: utf-8 -*-
+"""
+Columnar binary store for SpecParam results.
+
+A parameter store holds the results of a set of SpectralGroupModel fits (e.g.
+one per trial) in a single file: aperiodic parameters, peak tables, and
+goodness-of-fit metrics for each spectrum, and, optionally, the power spectra.
+Each array is stored contiguously after a JSON header, so that the file can be
+memory-mapped and individual models rebuilt on demand.
+
+File layout: magic string (8 bytes), header length (8 bytes, little-endian),
+JSON header (array dtypes, shapes and offsets; SpecParam settings and meta
+data), then the raw arrays, each aligned to 64 bytes.
+"""
+
+# Imports
+import os
+import json
+import numpy as np
+
+# store format
+MAGIC = b'PSTORE01'
+ALIGN = 64
+
+
+def save_param_store(fname, models, freqs=None, spectra=None, freq_range=None):
+    """
+    Save a list of SpectralGroupModel objects (same settings and shape) to a
+    parameter store.
+
+    Parameters
+    ----------
+    fname : str
+        Filename for the store.
+    models : list of SpectralGroupModel
+        Fit model objects, e.g. one for each trial.
+    freqs : 1d array, optional
+        Frequency values of the spectra.
+    spectra : 3d array, optional
+        Power spectra, of shape (n_models, n_spectra, n_freqs). If provided, the
+        spectra are trimmed to freq_range and stored.
+    freq_range : list of [float, float], optional
+        Frequency range used for fitting.
+    """
+
+    # imports
+    from specparam.utils import trim_spectrum
+
+    # collect results
+    n_models, n_spectra = len(models), len(models[0])
+    results = [res for sgm in models for res in sgm.get_results()]
+    n_peaks = np.array([len(res.peak_params) for res in results])
+    arrays = {
+        'aperiodic_params' : np.array([res.aperiodic_params for res in results]
+                                      ).reshape([n_models, n_spectra, -1]),
+        'r_squared' : np.array([res.r_squared for res in results]
+                               ).reshape([n_models, n_spectra]),
+        'error' : np.array([res.error for res in results]
+                           ).reshape([n_models, n_spectra]),
+        'peak_index' : np.concatenate([[0], np.cumsum(n_peaks)]).astype(np.int64),
+        'peak_params' : np.concatenate([np.reshape(res.peak_params, [-1, 3])
+                                        for res in results]),
+        'gaussian_params' : np.concatenate([np.reshape(res.gaussian_params, [-1, 3])
+                                            for res in results]),
+    }
+
+    # add spectra
+    if spectra is not None:
+        spectra = np.reshape(spectra, [-1, np.shape(spectra)[-1]])
+        freqs, spectra = trim_spectrum(freqs, spectra, freq_range) \
+            if freq_range is not None else (freqs, spectra)
+        arrays['freqs'] = np.asarray(freqs, dtype=float)
+        arrays['spectra'] = np.reshape(spectra, [n_models, n_spectra, -1])
+
+    # create header
+    header = {
+        'settings' : {key : np.ravel(value).tolist() if key == 'peak_width_limits'
+                      else value for key, value in
+                      models[0].get_settings()._asdict().items()},
+        'meta_data' : {key : np.ravel(value).tolist() if key == 'freq_range'
+                       else float(value) for key, value in
+                       models[0].get_meta_data()._asdict().items()},
+        'arrays' : {},
+    }
+    arrays = {key : np.ascontiguousarray(value) for key, value in arrays.items()}
+    offsets = {}
+    offset = 0
+    for key, value in arrays.items():
+        offsets[key] = offset
+        header['arrays'][key] = {'dtype' : value.dtype.str,
+                                 'shape' : list(value.shape),
+                                 'offset' : offset}
+        offset += _pad(value.nbytes)
+    header = json.dumps(header).encode()
+    start = _pad(len(MAGIC) + 8 + len(header))
+
+    # write to temporary file, then move into place
+    fname_temp = f"{fname}.tmp"
+    with open(fname_temp, 'wb') as f:
+        f.write(MAGIC)
+        f.write(len(header).to_bytes(8, 'little'))
+        f.write(header)
+        for key, value in arrays.items():
+            f.seek(start + offsets[key])
+            f.write(value.tobytes())
+        f.truncate(start + offset)
+    os.replace(fname_temp, fname)
+
+
+class ParamStore():
+    """
+    Memory-mapped parameter store, saved with save_param_store().
+
+    Parameters
+    ----------
+    fname : str
+        Filename of the store.
+
+    Attributes
+    ----------
+    settings : dict
+        SpecParam settings.
+    meta_data : dict
+        SpecParam meta data (freq_range, freq_res).
+    aperiodic_params : 3d array
+        Aperiodic parameters, of shape (n_models, n_spectra, n_params).
+    r_squared, error : 2d array
+        Goodness-of-fit metrics, of shape (n_models, n_spectra).
+    n_peaks : 2d array
+        Number of peaks, of shape (n_models, n_spectra).
+    peak_params, gaussian_params : 2d array
+        Peak tables for all spectra, of shape (n_peaks_total, 3).
+    peak_index : 1d array
+        Start index of the peaks of each spectrum (flattened) in the peak
+        tables (cumulative number of peaks, starting at 0).
+    freqs, spectra : array or None
+        Frequency values and power spectra (if stored).
+
+    Examples
+    --------
+    >>> store = ParamStore(fname) # doctest:+SKIP
+    >>> sgm = store.get_group(i_trial) # doctest:+SKIP
+    >>> df = store.to_df() # doctest:+SKIP
+    """
+
+    def __init__(self, fname):
+        self.fname = fname
+
+        # read header
+        with open(fname, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"Not a parameter store: {fname}")
+            n_bytes = int.from_bytes(f.read(8), 'little')
+            header = json.loads(f.read(n_bytes))
+        start = _pad(len(MAGIC) + 8 + n_bytes)
+        self.settings = header['settings']
+        self.meta_data = header['meta_data']
+
+        # memory-map arrays
+        self.freqs, self.spectra = None, None
+        for key, info in header['arrays'].items():
+            if np.prod(info['shape']) == 0:
+                value = np.zeros(info['shape'], dtype=info['dtype'])
+            else:
+                value = np.memmap(fname, dtype=info['dtype'], mode='r',
+                                  offset=start + info['offset'],
+                                  shape=tuple(info['shape']))
+            setattr(self, key, value)
+        self.n_peaks = np.diff(self.peak_index).reshape(self.r_squared.shape)
+
+
+    def __len__(self):
+        return self.r_squared.shape[0]
+
+
+    def get_freqs(self):
+        """
+        Get the frequency values of the models: the stored frequencies (if
+        spectra are stored), otherwise regenerated from the meta data, as in
+        get_group().
+
+        Returns
+        -------
+        freqs : 1d array
+            Frequency values.
+        """
+
+        # imports
+        from specparam.sim.gen import gen_freqs
+
+        if self.freqs is not None:
+            return np.array(self.freqs)
+        return gen_freqs(self.meta_data['freq_range'], self.meta_data['freq_res'])
+
+
+    def get_results(self, ind):
+        """
+        Get the fit results of one model.
+
+        Parameters
+        ----------
+        ind : int
+            Model index (e.g. trial).
+
+        Returns
+        -------
+        results : list of FitResults
+            Fit results of each spectrum in the model.
+        """
+
+        # imports
+        from specparam.data import FitResults
+
+        # create FitResults for each spectrum
+        n_spectra = self.r_squared.shape[1]
+        results = []
+        for ii in range(ind * n_spectra, (ind + 1) * n_spectra):
+            peaks = slice(self.peak_index[ii], self.peak_index[ii + 1])
+            i_model, i_spectrum = divmod(ii, n_spectra)
+            results.append(FitResults(
+                np.array(self.aperiodic_params[i_model, i_spectrum]),
+                np.array(self.peak_params[peaks]),
+                float(self.r_squared[i_model, i_spectrum]),
+                float(self.error[i_model, i_spectrum]),
+                np.array(self.gaussian_params[peaks])))
+
+        return results
+
+
+    def get_group(self, ind, add_data=True):
+        """
+        Rebuild the SpectralGroupModel of one model.
+
+        Parameters
+        ----------
+        ind : int
+            Model index (e.g. trial).
+        add_data : bool, optional, default: True
+            Whether to add the power spectra to the model (if stored).
+
+        Returns
+        -------
+        sgm : SpectralGroupModel object
+            Model object with the stored settings and results.
+        """
+
+        # imports
+        from specparam import SpectralGroupModel
+        from specparam.data import SpectrumMetaData
+
+        # initialize model
+        settings = dict(self.settings)
+        settings['peak_width_limits'] = tuple(settings['peak_width_limits'])
+        sgm = SpectralGroupModel(**settings, verbose=False)
+
+        # add data or meta data
+        if add_data and self.spectra is not None:
+            sgm.set_check_modes(check_freqs=False, check_data=False)
+            sgm.add_data(np.array(self.freqs), np.array(self.spectra[ind]))
+        else:
+            sgm.add_meta_data(SpectrumMetaData(**self.meta_data))
+
+        # add results
+        sgm.group_results = self.get_results(ind)
+
+        return sgm
+
+
+    def to_df(self, peak_org=0):
+        """
+        Convert results to a dataframe (equivalent to concatenating
+        SpectralGroupModel.to_df(peak_org) across models).
+
+        Parameters
+        ----------
+        peak_org : int, optional, default: 0
+            Number of peaks to extract for each spectrum.
+
+        Returns
+        -------
+        df : pd.DataFrame
+            Results, one row for each spectrum (model-major order).
+        """
+
+        # imports
+        import pandas as pd
+        from specparam.core.info import get_ap_indices, get_peak_indices
+
+        # aperiodic parameters
+        n_spectra = self.r_squared.size
+        aperiodic_params = np.reshape(self.aperiodic_params, [n_spectra, -1])
+        data = {label : aperiodic_params[:, index] for label, index in
+                get_ap_indices(self.settings['aperiodic_mode']).items()}
+
+        # first n peaks
+        peak_index = self.peak_index[:-1]
+        n_peaks = np.ravel(self.n_peaks)
+        for i_peak in range(peak_org):
+            has_peak = n_peaks > i_peak
+            for label, index in get_peak_indices().items():
+                values = np.full(n_spectra, np.nan)
+                values[has_peak] = self.peak_params[peak_index[has_peak] + i_peak, index]
+                data[f"{label.lower()}_{i_peak}"] = values
+
+        # goodness-of-fit metrics
+        data['error'] = np.ravel(self.error)
+        data['r_squared'] = np.ravel(self.r_squared)
+
+        return pd.DataFrame(data)
+
+
+def _pad(n_bytes):
+    """Round number of bytes up to alignment."""
+
+    return int(np.ceil(n_bytes / ALIGN) * ALIGN)
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""
+Partitioned storage for tabular results.
+
+Results are written incrementally, as each input file is analyzed, to a
+directory tree partitioned by the values of one or more columns (e.g.
+patient/material/memory), with one CSV file for each part:
+
+    {dir_output}/patient=pat02/material=words/memory=hit/{part}.csv
+
+Partitions can be read back lazily, with column selection and filtering on
+the partition values, or combined into a single CSV file without loading the
+full table into memory.
+"""
+
+# Imports
+import os
+from glob import glob
+import pandas as pd
+
+# default partitioning of the trial-level results
+PARTITION_COLS = ['patient', 'material', 'memory']
+
+
+def write_partition(dir_output, df, part, partition_cols=PARTITION_COLS):
+    """
+    Write a dataframe to partitioned storage. Each partition of the dataframe
+    is saved as '{part}.csv' in its partition directory; existing files for
+    the same part are overwritten.
+
+    Parameters
+    ----------
+    dir_output : str
+        Root directory of the partitioned results.
+    df : pd.DataFrame
+        Results to write.
+    part : str
+        Name of the part (e.g. the input filename, without extension).
+    partition_cols : list of str, optional
+        Columns to partition by.
+
+    Returns
+    -------
+    fnames : list of str
+        Filenames of the written parts.
+    """
+
+    fnames = []
+    for values, df_part in df.groupby(partition_cols, sort=False):
+        # create partition directory
+        values = values if isinstance(values, tuple) else (values,)
+        path = os.path.join(dir_output, *[f"{col}={value}" for col, value
+                                          in zip(partition_cols, values)])
+        if not os.path.exists(path):
+            os.makedirs(path, exist_ok=True)
+
+        # write to temporary file, then move into place
+        fname = os.path.join(path, f"{part}.csv")
+        df_part.to_csv(f"{fname}.tmp", index=False)
+        os.replace(f"{fname}.tmp", fname)
+        fnames.append(fname)
+
+    return fnames
+
+
+def list_partitions(dir_input, filters=None):
+    """
+    List the parts in partitioned storage, optionally filtered by partition
+    values.
+
+    Parameters
+    ----------
+    dir_input : str
+        Root directory of the partitioned results.
+    filters : dict, optional
+        Partition values to select, e.g. {'patient' : 'pat02'} or
+        {'memory' : ['hit', 'miss']}.
+
+    Returns
+    -------
+    fnames : list of str
+        Filenames of the selected parts (sorted).
+    """
+
+    fnames = []
+    for fname in sorted(glob(os.path.join(dir_input, '**', '*.csv'),
+                             recursive=True)):
+        # get partition values from path
+        dirs = os.path.relpath(os.path.dirname(fname), dir_input).split(os.sep)
+        values = dict([d.split('=', 1) for d in dirs if '=' in d])
+
+        # apply filters
+        if filters is not None and not all(
+                values.get(col) in ([value] if isinstance(value, str) else value)
+                for col, value in filters.items()):
+            continue
+        fnames.append(fname)
+
+    return fnames
+
+
+def iter_partitions(dir_input, columns=None, filters=None):
+    """
+    Lazily read partitioned results, one part at a time.
+
+    Parameters
+    ----------
+    dir_input : str
+        Root directory of the partitioned results.
+    columns : list of str, optional
+        Columns to read. If None, all columns are read.
+    filters : dict, optional
+        Partition values to select (see list_partitions).
+
+    Yields
+    ------
+    df : pd.DataFrame
+        Results of one part.
+    """
+
+    # read parts (round-trip float parsing, so that combined results are
+    # identical to the written results)
+    for fname in list_partitions(dir_input, filters):
+        df = pd.read_csv(fname, usecols=columns, float_precision='round_trip')
+        yield df[columns] if columns is not None else df
+
+
+def read_partitioned(dir_input, columns=None, filters=None):
+    """
+    Read partitioned results into a single dataframe.
+
+    Parameters
+    ----------
+    dir_input : str
+        Root directory of the partitioned results.
+    columns : list of str, optional
+        Columns to read. If None, all columns are read.
+    filters : dict, optional
+        Partition values to select (see list_partitions).
+
+    Returns
+    -------
+    df : pd.DataFrame
+        Combined results.
+    """
+
+    return pd.concat(iter_partitions(dir_input, columns, filters),
+                     ignore_index=True)
+
+
+def combine_partitions(dir_input, fname_out, columns=None, filters=None):
+    """
+    Combine partitioned results into a single CSV file, one part at a time
+    (without loading the full table into memory).
+
+    Parameters
+    ----------
+    dir_input : str
+        Root directory of the partitioned results.
+    fname_out : str
+        Filename of the combined CSV file.
+    columns, filters : optional
+        See iter_partitions.
+    """
+
+    # write to temporary file, then move into place
+    header = True
+    with open(f"{fname_out}.tmp", 'w', newline='') as f:
+        for df in iter_partitions(dir_input, columns, filters):
+            df.to_csv(f, index=False, header=header)
+            header = False
+    os.replace(f"{fname_out}.tmp", fname_out)
@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+"""
+Utility functions for generating SpecParam reports outside of the fitting loop
+"""
+
+# Imports
+import os
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+
+class ReportPool():
+    """
+    Render SpectralGroupModel reports in background worker processes.
+
+    Reports are queued with submit() and rendered by a pool of worker
+    processes, so that fitting can continue while reports are generated. Only
+    the model results and settings are sent to the workers (not the data).
+    The number of queued reports is bounded; submit() blocks while the queue
+    is full.
+
+    Parameters
+    ----------
+    mode : {'background', 'sync', 'on_demand'}, optional, default: 'background'
+        Report mode. 'background': render reports in worker processes. 'sync':
+        render reports immediately (blocking). 'on_demand': do not render
+        reports; render from saved results with render_report() when needed.
+    n_workers : int, optional, default: 1
+        Number of worker processes.
+    max_queue : int, optional, default: 100
+        Maximum number of reports queued or in progress.
+
+    Examples
+    --------
+    >>> with ReportPool('background', n_workers=2) as pool: # doctest:+SKIP
+    ...     pool.submit(sgm, f"{dir_output}/reports/{fname_out}")
+    """
+
+    def __init__(self, mode='background', n_workers=1, max_queue=100):
+        if mode not in ['background', 'sync', 'on_demand']:
+            raise ValueError(f"Invalid report mode: {mode}")
+        self.mode = mode
+        self.max_queue = max_queue
+        self._futures = set()
+        self._executor = None
+        if mode == 'background':
+            self._executor = ProcessPoolExecutor(max_workers=n_workers,
+                                                 initializer=_init_worker)
+
+
+    def submit(self, sgm, file_name):
+        """
+        Queue a report for rendering.
+
+        Parameters
+        ----------
+        sgm : SpectralGroupModel object
+            Fit model object.
+        file_name : str
+            Filename for the report.
+        """
+
+        # render immediately or skip, if not running in background
+        if self.mode == 'sync':
+            _save_report(sgm, file_name)
+            return
+        elif self.mode == 'on_demand':
+            return
+
+        # wait for space in queue
+        while len(self._futures) >= self.max_queue:
+            done, self._futures = wait(self._futures, return_when=FIRST_COMPLETED)
+            self._check_errors(done)
+
+        # queue report
+        future = self._executor.submit(_save_report, strip_data(sgm), file_name)
+        self._futures.add(future)
+
+
+    def close(self):
+        """
+        Wait for all queued reports to be rendered and shut down the pool.
+        """
+
+        if self._executor is None:
+            return
+        done, self._futures = wait(self._futures)
+        self._executor.shutdown()
+        self._executor = None
+        self._check_errors(done)
+
+
+    def _check_errors(self, futures):
+        """Raise any error that occurred while rendering a report."""
+
+        for future in futures:
+            future.result()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def strip_data(sgm):
+    """
+    Copy a SpectralGroupModel without its data (results and settings only).
+
+    Parameters
+    ----------
+    sgm : SpectralGroupModel object
+        Fit model object.
+
+    Returns
+    -------
+    sgm_results : SpectralGroupModel object
+        Model object containing the settings, meta data and results of sgm.
+    """
+
+    # imports
+    from specparam import SpectralGroupModel
+
+    # copy settings, meta data, and results
+    sgm_results = SpectralGroupModel(*sgm.get_settings(), verbose=False)
+    sgm_results.add_meta_data(sgm.get_meta_data())
+    sgm_results.group_results = sgm.group_results
+
+    return sgm_results
+
+
+def render_report(fname_params, fname_report=None, overwrite=False):
+    """
+    Render the report for saved SpectralGroupModel results (on-demand
+    alternative to calling save_report during fitting).
+
+    Parameters
+    ----------
+    fname_params : str
+        Filename of the saved model results (.json).
+    fname_report : str, optional
+        Filename for the report. If None, the report is saved next to the
+        results file, in a 'reports' subdirectory.
+    overwrite : bool, optional, default: False
+        Whether to re-render the report if it already exists.
+
+    Returns
+    -------
+    fname_report : str
+        Filename of the report.
+    """
+
+    # imports
+    from specparam import SpectralGroupModel
+
+    # set report filename
+    if fname_report is None:
+        path, fname = os.path.split(fname_params)
+        fname_report = os.path.join(path, 'reports', fname.replace('.json', ''))
+    if os.path.exists(f"{fname_report}.pdf") and not overwrite:
+        return fname_report
+
+    # load results and save report
+    sgm = SpectralGroupModel()
+    sgm.load(fname_params)
+    _save_report(sgm, fname_report)
+
+    return fname_report
+
+
+def render_store_reports(fname_store, dir_report=None, overwrite=False):
+    """
+    Render the reports for each model in a parameter store (see param_store).
+
+    Parameters
+    ----------
+    fname_store : str
+        Filename of the parameter store (.pstore).
+    dir_report : str, optional
+        Directory for the reports. If None, the reports are saved next to the
+        store, in a 'reports' subdirectory.
+    overwrite : bool, optional, default: False
+        Whether to re-render reports that already exist.
+
+    Returns
+    -------
+    fnames_report : list of str
+        Filenames of the reports (one for each model, e.g. trial).
+    """
+
+    # imports
+    from param_store import ParamStore
+
+    # set report directory
+    path, fname = os.path.split(fname_store)
+    if dir_report is None:
+        dir_report = os.path.join(path, 'reports')
+
+    # render reports for each model
+    store = ParamStore(fname_store)
+    fnames_report = []
+    for ind in range(len(store)):
+        fname_report = os.path.join(dir_report,
+                                    f"{fname.replace('.pstore', '')}_{ind}")
+        if overwrite or not os.path.exists(f"{fname_report}.pdf"):
+            _save_report(store.get_group(ind), fname_report)
+        fnames_report.append(fname_report)
+
+    return fnames_report
+
+
+def _init_worker():
+    """Use non-interactive matplotlib backend in worker processes."""
+
+    import matplotlib
+    matplotlib.use('Agg')
+
+
+def _save_report(sgm, file_name):
+    """Save report and close figure."""
+
+    import matplotlib.pyplot as plt
+
+    # create report directory if needed
+    path = os.path.dirname(file_name)
+    if path and not os.path.exists(path):
+        os.makedirs(path, exist_ok=True)
+
+    sgm.save_report(file_name)
+    plt.close('all')
@@ -31,6 +31,14 @@ SPEC_PARAM_SETTINGS = {
     'peak_threshold'    :   3 # default : 2.0
 }
 AP_MODE = 'knee'
+JOINT_AP_FIT = False # fit 'knee' using the peaks of the 'fixed' fit as peak guesses
+LOG_FREQ_POINTS = None # fit spectra resampled to n log-spaced frequencies; results are saved and evaluated on the native grid (None: fit at native resolution)
+FIT_CACHE_SIZE = 2e9 # maximum size of the SpecParam fit cache (bytes)
+FIT_INSTRUMENTATION = False # record per-spectrum fit statistics (time, optimizer calls, outcome); bypasses the fit cache
+EXCLUDE_CHANNELS = None # fit only channels selected by this column of results/ieeg_modulated_channels.csv (e.g. 'sig_all'; excluded channels get NaN results); None: fit all channels
+FIT_BACKEND = 'shared_memory' # parallel SpecParam fitting: 'shared_memory' or 'specparam'
+REPORT_MODE = 'background' # SpecParam reports: 'background', 'sync', or 'on_demand'
+N_REPORT_WORKERS = 2 # number of processes for rendering reports in background
 
 # Plotting
 COLORS = {
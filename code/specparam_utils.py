@@ -4,8 +4,10 @@ Utility functions for working with specparam results/objects
 """
 
 # Imports
+import threading
 import numpy as np
 from specparam import SpectralModel, SpectralGroupModel
+from specparam.core.errors import FitError
 
 
 def compute_band_power(freq, spectra, band, method='mean', log_power=False):
@@ -59,6 +61,319 @@ def compute_band_power(freq, spectra, band, method='mean', log_power=False):
     return power
 
 
+def compute_power_index(freq, spectra):
+    """
+    Precompute cumulative power along the frequency axis of a spectra array.
+    The resulting index can be used to compute the band power for any 
+    frequency band in constant time (see compute_indexed_band_power).
+
+    Parameters
+    ----------
+    freq : 1d array
+        Frequency values.
+    spectra : nd array
+        Power spectra. Frequency must be the last dimension.
+
+    Returns
+    -------
+    index : dict
+        Cumulative sum of power ('linear', 'log') and cumulative count of 
+        finite values ('n_linear', 'n_log') along the frequency axis, for 
+        linear and log-transformed power. A leading zero is prepended to the 
+        frequency axis.
+    """
+
+    # init
+    spectra = np.asarray(spectra, dtype=float)
+    index = {'freq' : np.asarray(freq)}
+
+    # compute cumulative power and number of finite values for each domain
+    with np.errstate(divide='ignore', invalid='ignore'):
+        domains = {'linear' : spectra, 'log' : np.log10(spectra)}
+    for domain, power in domains.items():
+        finite = np.isfinite(power)
+        pad = [(0, 0)] * (power.ndim - 1) + [(1, 0)]
+        index[domain] = np.pad(np.cumsum(np.where(finite, power, 0), axis=-1),
+                               pad)
+        index[f'n_{domain}'] = np.pad(np.cumsum(finite, axis=-1), pad)
+
+    return index
+
+
+def compute_indexed_band_power(index, band, method='mean', log_power=False,
+                               skip_nan=False):
+    """
+    Compute band power for a given band from a precomputed power index. By 
+    default, band power is NaN if any value within the band is not finite 
+    (as for np.mean / np.sum of the trimmed spectra). If skip_nan is True, 
+    non-finite values are ignored (as for np.nanmean / np.nansum).
+
+    Parameters
+    ----------
+    index : dict
+        Power index returned by compute_power_index.
+    band : list of [float, float]
+        Frequency band of interest. [f_low, f_high] (inclusive).
+    method : {'mean', 'sum'}, optional, default: 'mean'
+        Method to compute band power.
+    log_power : bool, optional, default: False
+        Whether to compute band power on log-transformed power spectra.
+    skip_nan : bool, optional, default: False
+        Whether to ignore non-finite values within the band.
+
+    Returns
+    -------
+    power : float or array
+        Band power values (shape of spectra without the frequency dimension).
+    """
+
+    # get index of band edges
+    i_low = np.searchsorted(index['freq'], band[0], side='left')
+    i_high = np.searchsorted(index['freq'], band[1], side='right')
+
+    # compute total power and number of values within band
+    domain = 'log' if log_power else 'linear'
+    total = index[domain][..., i_high] - index[domain][..., i_low]
+    count = index[f'n_{domain}'][..., i_high] - index[f'n_{domain}'][..., i_low]
+    valid = count > 0 if skip_nan else (count > 0) & (count == i_high - i_low)
+
+    # compute band power
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if method == 'mean':
+            power = np.where(valid, total / count, np.nan)
+        elif method == 'sum':
+            power = np.where(valid, total, np.nan)
+        else:
+            raise ValueError('Invalid method specified. Must be "mean" or "sum".')
+
+    return power[()]
+
+
+def compute_indexed_band_powers(index, bands, method='mean', log_power=False,
+                                skip_nan=False):
+    """
+    Compute band power for multiple bands from a precomputed power index.
+
+    Parameters
+    ----------
+    index : dict
+        Power index returned by compute_power_index.
+    bands : dict
+        Frequency bands of interest, e.g. {'alpha' : [f_low, f_high]}.
+    method : {'mean', 'sum'}, optional, default: 'mean'
+        Method to compute band power.
+    log_power : bool, optional, default: False
+        Whether to compute band power on log-transformed power spectra.
+    skip_nan : bool, optional, default: False
+        Whether to ignore non-finite values within each band.
+
+    Returns
+    -------
+    powers : dict
+        Band power values for each band.
+    """
+
+    powers = {band : compute_indexed_band_power(index, f_range, method=method, 
+                                                log_power=log_power,
+                                                skip_nan=skip_nan) 
+              for band, f_range in bands.items()}
+    
+    return powers
+
+
+def triage_spectra(freq, spectra, freq_range=None, exclude=None):
+    """
+    Classify power spectra before fitting, to skip spectra that cannot be 
+    parameterized.
+
+    Labels (in order of precedence):
+        'excluded' : excluded by the user (e.g. channels rejected in step3).
+        'empty' : no data (all values are NaN or zero).
+        'non_finite' : some values are NaN, infinite, or not positive (the 
+            log-transformed spectrum is not finite).
+        'degenerate' : finite, but flat (no variance in log-power) or too few 
+            frequency values to fit.
+        'valid' : all other spectra.
+
+    Parameters
+    ----------
+    freq : 1d array
+        Frequency values.
+    spectra : 1d or 2d array
+        Power spectra, of shape (n_spectra, n_freqs).
+    freq_range : list of [float, float], optional
+        Frequency range to fit. If None, the full range is used.
+    exclude : 1d array of bool, optional
+        Spectra to exclude.
+
+    Returns
+    -------
+    labels : 1d array of str
+        Label for each spectrum.
+    """
+
+    # imports
+    from specparam.utils import trim_spectrum
+
+    # trim to frequency range
+    spectra = np.atleast_2d(spectra)
+    if freq_range is not None:
+        _, spectra = trim_spectrum(freq, spectra, freq_range)
+
+    # check data
+    finite = np.isfinite(spectra) & (spectra > 0)
+    log_spectra = np.log10(np.where(finite, spectra, 1))
+    empty = ~np.any(np.isfinite(spectra) & (spectra != 0), axis=1)
+    non_finite = ~np.all(finite, axis=1)
+    degenerate = (np.ptp(log_spectra, axis=1) <= 1e-12) | (spectra.shape[1] < 4)
+
+    # label spectra
+    labels = np.full(len(spectra), 'valid', dtype='<U10')
+    labels[degenerate] = 'degenerate'
+    labels[non_finite] = 'non_finite'
+    labels[empty] = 'empty'
+    if exclude is not None:
+        labels[np.asarray(exclude, dtype=bool)] = 'excluded'
+
+    return labels
+
+
+def resample_log_freq(freq, spectra, n_freqs, freq_range=None):
+    """
+    Resample power spectra onto a log-spaced frequency grid, to reduce the 
+    number of frequency values to fit (linearly spaced spectra oversample high 
+    frequencies in log-log space).
+
+    The frequency range is divided into n_freqs log-spaced bins. Bins that 
+    contain frequency values of the original spectra are averaged (in log-
+    power, at the mean log-frequency of the values in the bin); empty bins (at 
+    low frequencies) are interpolated in log-log space, at the bin center.
+
+    Parameters
+    ----------
+    freq : 1d array
+        Frequency values (linearly spaced).
+    spectra : array
+        Power spectra, of shape (..., n_freqs).
+    n_freqs : int
+        Number of frequency values after resampling.
+    freq_range : list of [float, float], optional
+        Frequency range to resample. If None, the full range is used.
+
+    Returns
+    -------
+    freq_log : 1d array
+        Resampled frequency values.
+    spectra_log : array
+        Resampled power spectra, of shape (..., n_freqs).
+
+    Notes
+    -----
+    SpectralModel estimates initial peak widths from the frequency resolution 
+    (freqs[1] - freqs[0]), so frequency checks must be disabled and peak 
+    estimates are less accurate than aperiodic estimates. See 
+    scripts/analysis/benchmark_log_freq_resampling.py for the error relative 
+    to fitting at full resolution.
+    """
+
+    # trim to frequency range
+    freq = np.asarray(freq, dtype=float)
+    if freq_range is None:
+        freq_range = [freq[0], freq[-1]]
+    mask = (freq >= freq_range[0]) & (freq <= freq_range[1])
+    freq = freq[mask]
+    log_freq = np.log10(freq)
+
+    # assign frequency values to log-spaced bins
+    edges = np.linspace(log_freq[0], log_freq[-1], n_freqs + 1)
+    bins = np.clip(np.searchsorted(edges, log_freq, side='right') - 1, 0, 
+                   n_freqs - 1)
+    counts = np.bincount(bins, minlength=n_freqs)
+    filled = counts > 0
+
+    # weight matrix: average within filled bins...
+    weights = np.zeros([n_freqs, len(freq)])
+    weights[bins, np.arange(len(freq))] = 1 / counts[bins]
+    log_freq_new = (edges[:-1] + edges[1:]) / 2
+    log_freq_new[filled] = weights[filled] @ log_freq
+
+    # ...and interpolate empty bins linearly between neighboring values
+    for i_bin in np.where(~filled)[0]:
+        i_hi = min(np.searchsorted(log_freq, log_freq_new[i_bin]), len(freq) - 1)
+        i_lo = max(i_hi - 1, 0)
+        frac = (log_freq_new[i_bin] - log_freq[i_lo]) / \
+            (log_freq[i_hi] - log_freq[i_lo]) if i_hi > i_lo else 0
+        weights[i_bin, [i_lo, i_hi]] = [1 - frac, frac]
+
+    # resample log-power
+    log_spectra = np.log10(np.asarray(spectra)[..., mask])
+    spectra_log = np.power(10, log_spectra @ weights.T)
+
+    return np.power(10, log_freq_new), spectra_log
+
+
+def set_group_data(sgm, freqs, spectra, freq_range=None):
+    """
+    Replace the data of a fit SpectralGroupModel with power spectra on another
+    frequency grid, keeping the fit parameters, e.g. to evaluate fits of
+    spectra resampled with resample_log_freq on the native grid. The
+    r-squared and error of each fit are recomputed on the new data, so that
+    the model can be saved, reloaded and compared as if it had been fit on
+    that grid.
+
+    Parameters
+    ----------
+    sgm : SpectralGroupModel object
+        Fit model object.
+    freqs : 1d array
+        Frequency values.
+    spectra : 2d array
+        Power spectra, of shape (n_spectra, n_freqs), in the same order as the
+        fit spectra.
+    freq_range : list of [float, float], optional
+        Frequency range. If None, the full range is used.
+
+    Returns
+    -------
+    sgm : SpectralGroupModel object
+        Model object (same object as the input).
+    """
+
+    # add data (resets results)
+    results = sgm.get_results()
+    sgm.add_data(freqs, spectra, freq_range)
+    sgm.group_results = results
+
+    # compute model fit on new grid
+    ap_params, gaussian_params = get_group_params(sgm)
+    model = np.sum(gen_model_batch(sgm.freqs, ap_params, gaussian_params),
+                   axis=0)
+
+    # recompute r-squared (see SpectralModel._calc_r_squared)
+    data_c = sgm.power_spectra - np.mean(sgm.power_spectra, axis=1, keepdims=True)
+    model_c = model - np.mean(model, axis=1, keepdims=True)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r_squared = (np.sum(data_c * model_c, axis=1) ** 2 /
+                     (np.sum(data_c ** 2, axis=1) * np.sum(model_c ** 2, axis=1)))
+
+    # recompute error (see SpectralModel._calc_error)
+    residual = sgm.power_spectra - model
+    if sgm._error_metric == 'MAE':
+        error = np.mean(np.abs(residual), axis=1)
+    elif sgm._error_metric == 'MSE':
+        error = np.mean(residual ** 2, axis=1)
+    elif sgm._error_metric == 'RMSE':
+        error = np.sqrt(np.mean(residual ** 2, axis=1))
+    else:
+        raise ValueError(f"Error metric '{sgm._error_metric}' not understood.")
+
+    # update results
+    sgm.group_results = [res._replace(r_squared=r2, error=err) for res, r2, err
+                         in zip(results, r_squared, error)]
+
+    return sgm
+
+
 def compute_adjusted_band_power(params, band, method='mean', log_power=False):
     """
     Compute band power for a given band, adjusting for aperiodic component.
@@ -75,18 +390,18 @@ def compute_adjusted_band_power(params, band, method='mean', log_power=False):
         Whether to compute band power on log-transformed power spectra.
     """
     # compute aperiodic component and subtract from spectra
-    if type(params) == SpectralModel:
-        spec_ap = params_to_spectrum(params, component='aperiodic')
-        if log_power:
-            spec_adjusted = params.power_spectrum - np.log10(spec_ap)
-        else:
-            spec_adjusted = 10**params.power_spectrum - spec_ap
-    elif type(params) == SpectralGroupModel:
+    if isinstance(params, SpectralGroupModel):
         spec_ap = params_to_spectra(params, component='aperiodic')
         if log_power:
             spec_adjusted = params.power_spectra - np.log10(spec_ap)
         else:
             spec_adjusted = 10**params.power_spectra - spec_ap
+    elif isinstance(params, SpectralModel):
+        spec_ap = params_to_spectrum(params, component='aperiodic')
+        if log_power:
+            spec_adjusted = params.power_spectrum - np.log10(spec_ap)
+        else:
+            spec_adjusted = 10**params.power_spectrum - spec_ap
 
     # compute band power
     power = compute_band_power(params.freqs, spec_adjusted, band, method=method)
@@ -137,6 +452,100 @@ def _compute_adjusted_band_power(freq, spectra, params, band, method='mean',
     return power
 
 
+def compute_group_band_powers(params, bands, freq=None, spectra=None, 
+                              method='mean', log_power=False):
+    """
+    Compute total and aperiodic-adjusted band power for multiple bands, for 
+    all spectra of a SpectralGroupModel. The aperiodic component is generated 
+    once and shared across bands. Values are equal to those of 
+    compute_band_power and compute_adjusted_band_power (up to floating point 
+    rounding), except that the check for empty bands is applied to each 
+    spectrum: spectra with no values (all NaN or all zero) within a band are 
+    NaN.
+
+    Parameters
+    ----------
+    params : SpectralGroupModel object
+        SpectralGroupModel object. Must contain data (freqs, power_spectra).
+    bands : dict
+        Frequency bands of interest, e.g. {'alpha' : [f_low, f_high]}.
+    freq, spectra : 1d and 2d array, optional
+        Frequency values and power spectra (n_spectra, n_freqs) for total band 
+        power, e.g. at the original frequency resolution. If None, the data of 
+        the model object are used.
+    method : {'mean', 'max', 'sum'}, optional, default: 'mean'
+        Method to compute band power.
+    log_power : bool, optional, default: False
+        Whether to compute band power on log-transformed power spectra.
+
+    Returns
+    -------
+    powers : dict
+        Total ('{band}') and adjusted ('{band}_adj') band power for each band.
+    """
+
+    # total power: use model data if spectra are not given
+    if spectra is None:
+        freq, spectra = params.freqs, 10**params.power_spectra
+
+    # compute aperiodic component and subtract from spectra
+    spec_ap = params_to_spectra(params, component='aperiodic')
+    if log_power:
+        spec_adjusted = params.power_spectra - np.log10(spec_ap)
+    else:
+        spec_adjusted = 10**params.power_spectra - spec_ap
+
+    # compute band power for each band
+    powers = dict()
+    for band, f_range in bands.items():
+        powers[band] = _compute_band_power_rows(freq, spectra, f_range, 
+                                                method, log_power)
+        powers[f"{band}_adj"] = _compute_band_power_rows(
+            params.freqs, spec_adjusted, f_range, method)
+
+    return powers
+
+
+def _compute_band_power_rows(freq, spectra, band, method='mean', 
+                             log_power=False):
+    """
+    Compute band power for a given band (see compute_band_power), for each 
+    row of a 2d array of power spectra. Rows with no values (all NaN or all 
+    zero) within the band are NaN.
+    """
+
+    # imports
+    import warnings
+
+    # get band of interest
+    f_mask = np.logical_and(freq >= band[0], freq <= band[1])
+    band = np.atleast_2d(spectra)[:, f_mask]
+
+    # check if band is all nan or empty
+    empty = np.all(np.isnan(band), axis=1) | ~np.any(band, axis=1)
+
+    # log-transform power
+    if log_power:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            band = np.log10(band)
+
+    # compute band power (empty rows are set to NaN)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        if method == 'mean':
+            power = np.nanmean(band, axis=-1)
+        elif method == 'max':
+            power = np.nanmax(band, axis=-1)
+        elif method == 'sum':
+            power = np.nansum(band, axis=-1)
+        else:
+            raise ValueError('Invalid method specified. Must be "mean", '
+                             '"max", or "sum".')
+    power[empty] = np.nan
+
+    return power
+
+
 def knee_freq(knee, exponent):
     """
     Convert specparam knee parameter to Hz.
@@ -213,242 +622,1500 @@ def load_ap_params(fname):
     return extract_ap_params(params)
 
 
-def params_to_spectra(params, component='both'):
+def gen_aperiodic_batch(freq, ap_params):
     """
-    Simulate aperiodic power spectra from SpectralGroupModel object.
+    Generate aperiodic components (log10 power) for multiple sets of 
+    parameters at once.
 
     Parameters
     ----------
-    params : SpectralGroupModel object
-        SpectralGroupModel object containing aperiodic parameters.
-    component : str
-        Component to simulate ('both', 'aperiodic', or 'peak'). Default: 'both'.
+    freq : 1d array
+        Frequency values.
+    ap_params : 2d array
+        Aperiodic parameters of shape (n_spectra, 2) for 'fixed' mode 
+        ([offset, exponent]) or (n_spectra, 3) for 'knee' mode ([offset, knee, 
+        exponent]), in specparam format.
 
     Returns
     -------
-    spectra: array
-        Aperiodic power spectra.
-
+    ap_fit : 2d array
+        Aperiodic components (log10 power) of shape (n_spectra, n_freqs).
     """
-    # imports
-    from specparam.sim import sim_power_spectrum
 
-    # init
-    spectra = np.zeros([len(params), len(params.freqs)])
-    
-    # simulate aperiodic spectra for each
-    if component == 'both':
-        for ii in range(len(params)):
-            _, spectra[ii] = sim_power_spectrum([params.freqs[0], 
-                                                params.freqs[-1]],
-                                                params[ii].aperiodic_params, 
-                                                params[ii].peak_params, 
-                                                freq_res=params.freq_res, nlv=0)
-    elif component == 'aperiodic':
-        for ii in range(len(params)):
-            _, spectra[ii] = sim_power_spectrum([params.freqs[0], 
-                                                 params.freqs[-1]],
-                                                params[ii].aperiodic_params, [], 
-                                                freq_res=params.freq_res, nlv=0)
-    # simulate aperiodic spectra for each
-    elif component == 'peak':
-        for ii in range(len(params)):
-            _, spectra[ii] = sim_power_spectrum([params.freqs[0], 
-                                                 params.freqs[-1]],
-                                                [], params[ii].peak_params, 
-                                                freq_res=params.freq_res, nlv=0)
-    else:
-        raise ValueError('Invalid component specified. Must be "both", \
-                         "aperiodic", or "peak".')
-    
-    return spectra
+    # unpack parameters
+    ap_params = np.atleast_2d(ap_params)
+    offset = ap_params[:, [0]]
+    exponent = ap_params[:, [-1]]
+    knee = ap_params[:, [1]] if ap_params.shape[1] == 3 else 0
 
+    # compute aperiodic component
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ap_fit = offset - np.log10(knee + freq**exponent)
 
-def params_to_spectrum(params, component='both'):
+    return ap_fit
+
+
+def gen_periodic_batch(freq, gaussian_params):
     """
-    Simulate aperiodic power spectra from SpectralModel object.
+    Generate periodic components (log10 power) for multiple sets of peak 
+    parameters at once.
 
     Parameters
     ----------
-    params : SpectralModel object
-        SpectralModel object containing aperiodic parameters.
-    component : str
-        Component to simulate ('both', 'aperiodic', or 'peak'). Default: 'both'.
+    freq : 1d array
+        Frequency values.
+    gaussian_params : 3d array
+        Gaussian parameters ([center, height, standard deviation]) of shape 
+        (n_spectra, n_peaks, 3). Spectra with fewer peaks are padded with NaN 
+        (see get_group_params).
 
     Returns
     -------
-    spectra: array
-        Aperiodic power spectra.
-
+    pe_fit : 2d array
+        Periodic components (log10 power) of shape (n_spectra, n_freqs).
     """
-    # imports
-    from specparam.sim import sim_power_spectrum
 
-    # simulate aperiodic spectra for each
-    if component == 'both':
-        _, spectrum = sim_power_spectrum([params.freqs[0], params.freqs[-1]],
-                                            params.get_params('aperiodic'),
-                                            params.get_params('peak'),
-                                            freq_res=params.freq_res, nlv=0)
-    elif component == 'aperiodic':
-        _, spectrum = sim_power_spectrum([params.freqs[0], params.freqs[-1]],
-                                            params.get_params('aperiodic'), [], 
-                                            freq_res=params.freq_res, nlv=0)
-    # simulate aperiodic spectra for each
-    elif component == 'peak':
-        _, spectrum = sim_power_spectrum([params.freqs[0], params.freqs[-1]],
-                                            [], params.get_params('peak'), 
-                                            freq_res=params.freq_res, nlv=0)
-    else:
-        raise ValueError('Invalid component specified. Must be "both", \
-                         "aperiodic", or "peak".')
-    
-    return spectrum
+    # unpack parameters
+    gaussian_params = np.reshape(gaussian_params, [len(gaussian_params), -1, 3])
+    ctr, hgt, wid = [gaussian_params[:, :, [ii]] for ii in range(3)]
 
+    # compute gaussians and sum across peaks (ignoring padding)
+    gaussians = hgt * np.exp(-(freq - ctr)**2 / (2 * wid**2))
+    pe_fit = np.nansum(gaussians, axis=1)
+
+    return pe_fit
+
+
+def gen_model_batch(freq, ap_params, gaussian_params):
+    """
+    Generate the aperiodic and periodic components (log10 power) of multiple 
+    model spectra at once. The full model is the sum of the components.
 
-def compute_adj_r2(params):
-    """Calculate the adjusted r-squared for an existing SpectralModel.
-    
     Parameters
     ----------
-    params : SpectralModel object
-        SpectralModel object that has been fit to data.
+    freq : 1d array
+        Frequency values.
+    ap_params : 2d array
+        Aperiodic parameters of shape (n_spectra, 2) or (n_spectra, 3) (see 
+        gen_aperiodic_batch).
+    gaussian_params : 3d array
+        Gaussian parameters of shape (n_spectra, n_peaks, 3), padded with NaN 
+        (see gen_periodic_batch).
 
     Returns
     -------
-    adj_r2 : float
-        Adjusted r-squared value.
+    ap_fit, pe_fit : 2d array
+        Aperiodic and periodic components (log10 power) of shape 
+        (n_spectra, n_freqs).
     """
-    # imports
-    from utils import adjust_r_squared
-    
-    # compute adjusted r-squared
-    n_samples = len(params.freqs) # number of data points
-    n_params = len(params.peak_params_) * 3 + len(params.aperiodic_params_) # number of parameters
-    r_squared = params.get_params('r_squared')
-    adj_r2 = adjust_r_squared(r_squared, n_params, n_samples)
 
-    return adj_r2
+    ap_fit = gen_aperiodic_batch(freq, ap_params)
+    pe_fit = gen_periodic_batch(freq, gaussian_params)
 
+    return ap_fit, pe_fit
 
-def compute_intersection(params_0, params_1, return_spectra=False):
-    """ 
-    Calculate intersection of two spectra from SpectralModel objects.
+
+def get_group_params(params):
+    """
+    Get the aperiodic and gaussian parameters of a model fit as arrays, with 
+    the gaussian parameters padded with NaN to the maximum number of peaks.
 
     Parameters
     ----------
-    params_0, params_1 : SpectralModel
-        SpectralModel objects containing power spectra.
-    return_spectra : bool, optional, default: False
-        Whether to return the power spectra.    
+    params : SpectralModel or SpectralGroupModel object
+        Fit model object.
 
     Returns
     -------
-    intersection : 1d array
-        intersection frequency
-    intersection_idx : 1d array
-        index of intersection frequency
-    spectra_0, spectra_1 : 1d array
-        Power spectra from each model, if requested.
-
+    ap_params : 2d array
+        Aperiodic parameters of shape (n_spectra, n_ap).
+    gaussian_params : 3d array
+        Gaussian parameters of shape (n_spectra, max_n_peaks, 3).
     """
 
-    # sim spectra from parameters
-    spectra_0 = params_to_spectrum(params_0, component='aperiodic')
-    spectra_1 = params_to_spectrum(params_1, component='aperiodic')
-
-    # calc intersect of aperiodic spectra
-    idx = np.argwhere(np.diff(np.sign(spectra_1 - spectra_0))).flatten()
+    # get parameters of each spectrum
+    if isinstance(params, SpectralGroupModel):
+        ap_params = np.array([res.aperiodic_params 
+                              for res in params.group_results])
+        gaussians = [res.gaussian_params for res in params.group_results]
+    else:
+        ap_params = np.atleast_2d(params.aperiodic_params_)
+        gaussians = [params.gaussian_params_]
 
-    # account for no intersection or multiple intersections
-    if not idx.any(): 
-        intersection = np.nan
-        intersection_idx = np.nan
-    elif len(idx)==1: 
-        intersection = params_0.freqs[np.squeeze(idx)]
-        intersection_idx = np.squeeze(idx)
-    else: 
-        intersection = np.nan
-        intersection_idx = np.nan
+    # pad gaussian parameters
+    gaussians = [np.reshape(gaussian, [-1, 3]) for gaussian in gaussians]
+    max_n_peaks = max([len(gaussian) for gaussian in gaussians], default=0)
+    gaussian_params = np.full([len(gaussians), max_n_peaks, 3], np.nan)
+    for ii, gaussian in enumerate(gaussians):
+        gaussian_params[ii, :len(gaussian)] = gaussian
 
-    if return_spectra:
-        return intersection, intersection_idx, spectra_0, spectra_1
-    else:
-        return intersection, intersection_idx
+    return ap_params, gaussian_params
 
 
-def compute_intersections(params_0, params_1, return_spectra=False):
-    """ 
-    Calculate intersection of two spectra from SpectralGroupModel objects.
+def fit_aperiodic_batch(freq, spectra, freq_range=None, ap_mode='fixed', 
+                        robust=True, n_iter=100, tol=1e-10, 
+                        return_params=False):
+    """
+    Fit the aperiodic component of many power spectra at once. 
+    
+    The 'fixed' model is solved in closed form (weighted linear least squares
+    in log-log space); the 'knee' model is solved with vectorized 
+    Levenberg-Marquardt steps, initialized from the 'fixed' solution. If 
+    robust is True, the fit is repeated on the frequencies that fall below 
+    the initial fit, as in the specparam robust aperiodic fit. No peaks are 
+    fit.
 
     Parameters
     ----------
-    params_0, params_1 : SpectralModel or SpectralGroupModel
-        SpectralModel or SpectralGroupModel objects. Must have data.
-    return_spectra : bool, optional, default: False
-        Whether to return the power spectra.    
+    freq : 1d array
+        Frequency values.
+    spectra : 2d array
+        Power spectra (linear power), of shape (n_spectra, n_freqs).
+    freq_range : list of [float, float], optional
+        Frequency range to fit. If None, the full range is used.
+    ap_mode : {'fixed', 'knee'}, optional, default: 'fixed'
+        Aperiodic mode.
+    robust : bool, optional, default: True
+        Whether to refit the aperiodic component, excluding outliers.
+    n_iter : int, optional, default: 100
+        Maximum number of Levenberg-Marquardt iterations ('knee' mode).
+    tol : float, optional, default: 1e-10
+        Relative change in error at which Levenberg-Marquardt iterations stop.
+    return_params : bool, optional, default: False
+        Whether to also return aperiodic parameters in specparam format.
 
     Returns
     -------
-    intersection : 1d array
-        intersection frequency
-    intersection_idx : 1d array
-        index of intersection frequency
-    spectra_0, spectra_1 : 1d array
-        Power spectra from each model, if requested.
-
+    offset, knee, exponent : 1D array
+        Offset, knee (Hz), and exponent parameters (as returned by 
+        extract_ap_params). Knee is nan for 'fixed' mode. Spectra containing 
+        non-finite values return nan.
+    ap_params : 2d array
+        Aperiodic parameters in specparam format, if requested.
     """
-    
-    # Run analysis for SpectralModel input
-    if (type(params_0) == SpectralModel) and (type(params_1) == SpectralModel):
-        results = compute_intersection(params_0, params_1, return_spectra)
-        intersection, intersection_idx = results[:2]
-        if return_spectra:
-            spectra_0 = results[2]
-            spectra_1 = results[3]
-
-    # Run analysis for SpectralGroupModel input
-    elif (type(params_0) == SpectralGroupModel) and (type(params_1) == SpectralGroupModel):
-
-        # check if input is same size
-        if len(params_0) != len(params_1):
-            raise ValueError('Input must be same size.')
-
-        # initiate variables
-        intersection = np.zeros([len(params_0)]) * np.nan
-        intersection_idx = intersection.copy()
-        spectra_0 = np.zeros([len(params_0), len(params_0.freqs)])
-        spectra_1 = spectra_0.copy()
-
-        # compute intersection for each channel
-        for i_chan in range(len(params_0)):
-            try:
-                # get model parameters for channel
-                params_0_i = params_0.get_model(i_chan)
-                params_1_i = params_1.get_model(i_chan)
-
-                # compute intersection
-                results = compute_intersection(params_0_i, params_1_i, return_spectra)
-                intersection[i_chan], intersection_idx[i_chan] = results[:2]
-                if return_spectra:
-                    spectra_0[i_chan] = results[2]
-                    spectra_1[i_chan] = results[3]
-
-            # return nan if no model parameters are available
-            except:
-                intersection[i_chan], intersection_idx[i_chan] = np.nan, np.nan
-                if return_spectra:
-                    spectra_0[i_chan] = [np.nan] * len(params_0.freqs)
-                    spectra_1[i_chan] = [np.nan] * len(params_0.freqs)
-                continue
+
+    # imports
+    from specparam.utils import trim_spectrum
+
+    # trim spectra and log-transform power
+    spectra = np.atleast_2d(spectra)
+    if freq_range is not None:
+        freq, spectra = trim_spectrum(freq, spectra, freq_range)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        log_spectra = np.log10(spectra)
+    valid = np.all(np.isfinite(log_spectra), axis=1)
+    log_spectra = np.where(valid[:, None], log_spectra, 0)
+
+    # fit aperiodic component
+    weights = np.ones_like(log_spectra)
+    ap_params = _fit_aperiodic_weighted(freq, log_spectra, weights, ap_mode, 
+                                        n_iter, tol)
+
+    # refit, excluding points above initial fit (see SpectralModel._robust_ap_fit)
+    if robust:
+        flatspec = log_spectra - gen_aperiodic_batch(freq, ap_params)
+        flatspec[flatspec < 0] = 0
+        perc_thresh = np.percentile(flatspec, 0.025, axis=1)
+        weights = (flatspec <= perc_thresh[:, None]).astype(float)
+        ap_params = _fit_aperiodic_weighted(freq, log_spectra, weights, 
+                                            ap_mode, n_iter, tol, ap_params)
+    ap_params[~valid] = np.nan
+
+    # unpack parameters
+    offset = ap_params[:, 0]
+    exponent = ap_params[:, -1]
+    if ap_mode == 'knee':
+        with np.errstate(invalid='ignore', divide='ignore'):
+            knee = ap_params[:, 1] ** (1 / exponent)
     else:
-        raise ValueError('Input must both be SpectralModel or SpectralGroupModel.')
+        knee = np.full(len(offset), np.nan)
 
-    # return results
-    if return_spectra:
-        return intersection, intersection_idx, spectra_0, spectra_1
+    if return_params:
+        return offset, knee, exponent, ap_params
     else:
-        return intersection, intersection_idx
+        return offset, knee, exponent
+
+
+def _fit_aperiodic_weighted(freq, log_spectra, weights, ap_mode, n_iter, tol,
+                            guess=None):
+    """
+    Weighted least-squares fit of the aperiodic component for many spectra 
+    (see fit_aperiodic_batch).
+    """
+
+    # fit 'fixed' model (linear in log-log space): y = offset - exp * log10(f)
+    if (ap_mode == 'fixed') or (guess is None):
+        design = np.stack([np.ones_like(freq), -np.log10(freq)], axis=1)
+        lhs = np.einsum('nf,fi,fj->nij', weights, design, design)
+        rhs = np.einsum('nf,fi,nf->ni', weights, design, log_spectra)
+        params = np.linalg.solve(lhs + 1e-12 * np.eye(2), rhs[..., None])[..., 0]
+        if ap_mode == 'fixed':
+            return params
+        guess = np.insert(params, 1, 0, axis=1)
+    elif ap_mode != 'knee':
+        raise ValueError('Invalid aperiodic mode. Must be "fixed" or "knee".')
+    
+    # fit 'knee' model with Levenberg-Marquardt
+    params = guess.copy()
+    damping = np.full(len(params), 1e-3)
+    converged = np.zeros(len(params), dtype=bool)
+
+    def _cost(params):
+        residuals = log_spectra - gen_aperiodic_batch(freq, params)
+        cost = np.sum(weights * residuals**2, axis=1)
+        return np.where(np.isfinite(cost), cost, np.inf), residuals
+
+    cost, residuals = _cost(params)
+    for _ in range(n_iter):
+        # compute jacobian of model w.r.t. offset, knee, and exponent
+        freq_exp = freq ** params[:, [2]]
+        denom = (params[:, [1]] + freq_exp) * np.log(10)
+        jacobian = np.stack([np.ones_like(freq_exp), -1 / denom, 
+                             -freq_exp * np.log(freq) / denom], axis=2)
+
+        # compute damped Gauss-Newton step
+        jtj = np.einsum('nf,nfi,nfj->nij', weights, jacobian, jacobian)
+        jtr = np.einsum('nf,nfi,nf->ni', weights, jacobian, residuals)
+        diag = np.einsum('nii->ni', jtj)
+        lhs = jtj + (damping[:, None] * diag)[:, :, None] * np.eye(3)
+        with np.errstate(invalid='ignore'):
+            step = np.linalg.solve(lhs + 1e-12 * np.eye(3), jtr[..., None])[..., 0]
+
+        # accept steps that reduce error, adjust damping
+        cost_new, residuals_new = _cost(params + step)
+        improved = cost_new < cost
+        params[improved] += step[improved]
+        residuals[improved] = residuals_new[improved]
+        converged |= improved & (cost - cost_new <= tol * cost)
+        converged |= damping > 1e10
+        cost[improved] = cost_new[improved]
+        damping = np.where(improved, damping / 10, damping * 10)
+        if np.all(converged):
+            break
+    
+    return params
+
+
+class WarmStartGroupModel(SpectralGroupModel):
+    """
+    SpectralGroupModel that fits power spectra sequentially, initializing each 
+    fit from the solution of the previous spectrum. Intended for highly 
+    correlated spectra, e.g. adjacent time bins of a TFR.
+
+    The aperiodic guess (initial parameters of specparam's aperiodic fits) 
+    is set to the previous aperiodic parameters; the robust aperiodic fit is 
+    otherwise unchanged. The iterative peak search is replaced by a fit of 
+    the previous gaussians to the flattened spectrum. The search is run only 
+    if this fit fails, if a fitted peak falls below the peak thresholds, or 
+    if the residual contains a new candidate peak above the thresholds of the 
+    flattened spectrum (i.e. the number of peaks changes). If a warm-started fit fails, the spectrum is refit from the 
+    default (cold) initialization. Fits are always run serially.
+
+    Attributes
+    ----------
+    n_cold_ : int
+        Number of spectra that fell back to a cold fit.
+    n_search_ : int
+        Number of spectra for which the peak search was run.
+    """
+
+    # results differ from SpectralGroupModel and depend on the previous 
+    # spectra (see fit_cache.compute_cache_keys)
+    cache_tag = 'warm_start'
+    sequential = True
+
+    def __init__(self, *args, **kwargs):
+        """Initialize object with desired settings."""
+
+        super().__init__(*args, **kwargs)
+        self.n_cold_ = 0
+        self.n_search_ = 0
+        self._reset_warm_start()
+
+
+    def fit(self, freqs=None, power_spectra=None, freq_range=None, n_jobs=1, 
+            progress=None):
+        """Fit a group of power spectra, sequentially (n_jobs is ignored)."""
+
+        self._reset_warm_start()
+        self.n_cold_ = 0
+        self.n_search_ = 0
+        super().fit(freqs, power_spectra, freq_range, n_jobs=1, 
+                    progress=progress)
+        self._reset_warm_start()
+
+
+    def _reset_warm_start(self):
+        """Clear the stored solution (next fit is cold)."""
+
+        self._ap_guess = (None, 0, None)
+        self._warm_aperiodic_params = None
+        self._warm_gaussian_params = None
+
+
+    def _fit(self, *args, **kwargs):
+        """Fit power spectrum from previous solution, falling back to a cold fit."""
+
+        # warm-started fit
+        super()._fit(*args, **kwargs)
+
+        # refit from default initialization if fit failed
+        warm = self._warm_aperiodic_params is not None
+        if np.isnan(self.aperiodic_params_[0]) and warm:
+            self.n_cold_ += 1
+            self._reset_warm_start()
+            super()._fit(*args, **kwargs)
+
+        # store solution for next fit
+        if np.isnan(self.aperiodic_params_[0]):
+            self._reset_warm_start()
+        else:
+            ap_params = self.aperiodic_params_
+            self._ap_guess = (ap_params[0], ap_params[1], ap_params[-1]) \
+                if self.aperiodic_mode == 'knee' else \
+                    (ap_params[0], 0, ap_params[-1])
+            self._warm_aperiodic_params = ap_params
+            self._warm_gaussian_params = self.gaussian_params_
+
+
+    def _fit_peaks(self, flat_iter):
+        """Fit peaks from the previous gaussians, falling back to the search."""
+
+        # cold start - run peak search
+        prev = self._warm_gaussian_params
+        if prev is None:
+            self.n_search_ += 1
+            return super()._fit_peaks(flat_iter)
+
+        # use previous gaussians as guess (std within limits, and dropping 
+        # peaks that violate the edge and overlap criteria of the search)
+        guess = np.copy(prev)
+        guess[:, 2] = np.clip(guess[:, 2], *self._gauss_std_limits)
+        guess = self._drop_peak_overlap(self._drop_peak_cf(guess))
+        try:
+            gaussian_params = self._fit_peak_guess(guess) if len(guess) \
+                else np.empty([0, 3])
+        except FitError:
+            gaussian_params = None
+
+        # accept if the search would have found the same peaks
+        if gaussian_params is not None and \
+                self._check_peaks(flat_iter, gaussian_params):
+            return gaussian_params[gaussian_params[:, 0].argsort()]
+        self.n_search_ += 1
+
+        return super()._fit_peaks(flat_iter)
+
+
+    def _check_peaks(self, flat_spectrum, gaussian_params):
+        """
+        Check peaks fit from the previous solution against the peak search 
+        (see SpectralModel._fit_peaks): each peak must exceed the relative 
+        (peak_threshold) and absolute (min_peak_height) thresholds in the 
+        spectrum without the other peaks, and the search must not find a 
+        further peak in the residual.
+        """
+
+        # imports
+        from specparam.core.funcs import gaussian_function
+
+        # check thresholds of each peak
+        peaks = [gaussian_function(self.freqs, *params) 
+                 for params in gaussian_params]
+        residual = flat_spectrum - np.sum(peaks, axis=0)
+        for params, peak in zip(gaussian_params, peaks):
+            spectrum_i = residual + peak
+            if params[1] <= self.peak_threshold * np.std(spectrum_i) or \
+                    params[1] <= self.min_peak_height:
+                return False
+
+        return not self._find_new_peak(residual, gaussian_params, 
+                                       np.std(flat_spectrum))
+
+
+    def _find_new_peak(self, residual, gaussian_params, flat_std):
+        """
+        Run the peak search (see SpectralModel._fit_peaks) on the residual of 
+        the peak fit. Returns whether a candidate peak is found that is not 
+        dropped by the edge (_drop_peak_cf) or overlap (_drop_peak_overlap) 
+        criteria. The relative height threshold uses the standard deviation 
+        of the flattened spectrum (flat_std), as for the first peak of the 
+        search; the residual of fitted peaks is smaller than that of the 
+        search guesses, and would otherwise admit noise peaks.
+        """
+
+        # imports
+        from specparam.core.funcs import gaussian_function
+        from specparam.utils.params import compute_gauss_std
+
+        n_max = min(self.max_n_peaks, len(residual)) - len(gaussian_params)
+        for _ in range(int(max(n_max, 0))):
+            # find candidate peak, stopping at the height thresholds
+            max_ind = np.argmax(residual)
+            max_height = residual[max_ind]
+            if max_height <= self.peak_threshold * flat_std or \
+                    max_height <= self.min_peak_height:
+                return False
+
+            # guess standard deviation from shortest side of half-height width
+            below = np.flatnonzero(residual <= 0.5 * max_height)
+            sides = [max_ind - below[(below > 0) & (below < max_ind)].max()
+                     if np.any((below > 0) & (below < max_ind)) else None,
+                     below[below > max_ind].min() - max_ind
+                     if np.any(below > max_ind) else None]
+            sides = [side for side in sides if side is not None]
+            guess_std = compute_gauss_std(min(sides) * 2 * self.freq_res) \
+                if sides else np.mean(self.peak_width_limits)
+            guess_std = np.clip(guess_std, *self._gauss_std_limits)
+            candidate = np.array([self.freqs[max_ind], max_height, guess_std])
+
+            # new peak if candidate passes the edge and overlap criteria
+            if len(self._drop_peak_cf(candidate[np.newaxis])):
+                kept = self._drop_peak_overlap(
+                    np.vstack([gaussian_params, candidate]))
+                if any(np.array_equal(peak, candidate) for peak in kept):
+                    return True
+
+            residual = residual - gaussian_function(self.freqs, *candidate)
+
+        return False
+
+
+class TrackingGroupModel(SpectralGroupModel):
+    """
+    SpectralGroupModel that tracks the model parameters across a sequence of 
+    power spectra, e.g. adjacent time bins of a TFR. Each spectrum is first fit 
+    by a cheap local update of the previous solution, which repeats the last 
+    two stages of SpectralModel.fit starting from the previous parameters (and 
+    with the number of peaks fixed): gaussians are refit to the spectrum 
+    flattened by the previous aperiodic fit, then the aperiodic component is 
+    refit to the peak-removed spectrum. A full fit is run only if the update 
+    fails, if its error exceeds max_error_ratio times the error of the last 
+    full fit, or if the aperiodic offset or exponent differ from the last full 
+    fit by more than max_ap_change. Fits are always run serially.
+
+    Parameters
+    ----------
+    max_error_ratio : float, optional, default: 1.25
+        Maximum error of a local update, relative to the last full fit.
+    max_ap_change : float, optional, default: 0.1
+        Maximum absolute change of the aperiodic offset and exponent in a 
+        local update, compared to the last full fit.
+    n_iter : int, optional, default: 3
+        Number of Gauss-Newton iterations of each stage of a local update.
+    *args, **kwargs
+        Settings passed to SpectralGroupModel.
+
+    Attributes
+    ----------
+    refit_mask_ : 1d array of bool
+        Whether each spectrum was fit with a full fit (True) or a local update 
+        (False).
+    """
+
+    # fits depend on the previous spectra (see fit_cache.compute_cache_keys)
+    sequential = True
+
+    def __init__(self, *args, max_error_ratio=1.25, max_ap_change=0.1, 
+                 n_iter=3, **kwargs):
+        """Initialize object with desired settings."""
+
+        super().__init__(*args, **kwargs)
+        self.max_error_ratio = max_error_ratio
+        self.max_ap_change = max_ap_change
+        self.n_iter = n_iter
+        self._refits = []
+        self.refit_mask_ = np.array([], dtype=bool)
+        self._reset_tracking()
+
+
+    @property
+    def cache_tag(self):
+        """Results differ from SpectralGroupModel, and depend on the tracking
+        settings (see fit_cache.compute_cache_keys)."""
+
+        return f"tracking_{self.max_error_ratio}_{self.max_ap_change}_{self.n_iter}"
+
+
+    def fit(self, freqs=None, power_spectra=None, freq_range=None, n_jobs=1, 
+            progress=None):
+        """Fit a group of power spectra, sequentially (n_jobs is ignored)."""
+
+        self._reset_tracking()
+        self._refits = []
+        super().fit(freqs, power_spectra, freq_range, n_jobs=1, 
+                    progress=progress)
+        self.refit_mask_ = np.array(self._refits, dtype=bool)
+        self._reset_tracking()
+
+
+    def _reset_tracking(self):
+        """Clear the tracked solution (next fit is a full fit)."""
+
+        self._track_aperiodic_params = None
+        self._track_gaussian_params = None
+        self._full_aperiodic_params = None
+        self._track_error = None
+
+
+    def _fit(self, *args, **kwargs):
+        """Update the previous solution, falling back to a full fit."""
+
+        # local update
+        power_spectrum = kwargs.get('power_spectrum')
+        if self._track_aperiodic_params is not None and \
+                power_spectrum is not None:
+            self.power_spectrum = power_spectrum
+            if self._update_fit():
+                self._refits.append(False)
+                self._track_aperiodic_params = self.aperiodic_params_
+                self._track_gaussian_params = self.gaussian_params_
+                return
+
+        # full fit (reference for the following local updates)
+        super()._fit(*args, **kwargs)
+        self._refits.append(True)
+        if np.isnan(self.aperiodic_params_[0]):
+            self._reset_tracking()
+        else:
+            self._track_aperiodic_params = self.aperiodic_params_
+            self._track_gaussian_params = self.gaussian_params_
+            self._full_aperiodic_params = self.aperiodic_params_
+            self._track_error = self.error_
+
+
+    def _update_fit(self):
+        """
+        Update the tracked solution with a few Gauss-Newton iterations. 
+        Returns whether the update was accepted (model results are set if so).
+        """
+
+        # imports
+        from specparam.sim.gen import gen_aperiodic, gen_periodic
+
+        # bounds of gaussian parameters (center, height, standard deviation)
+        n_peaks = len(self._track_gaussian_params)
+        lower = np.tile([self.freqs[0], 0, self._gauss_std_limits[0]], n_peaks)
+        upper = np.tile([self.freqs[-1], np.inf, self._gauss_std_limits[1]], 
+                        n_peaks)
+
+        with np.errstate(all='ignore'):
+            # refit gaussians to spectrum flattened by previous aperiodic fit
+            spectrum_flat = self.power_spectrum - \
+                gen_aperiodic(self.freqs, self._track_aperiodic_params)
+            gaussian_params = _gauss_newton(
+                _gaussian_residuals, _gaussian_jacobian, 
+                np.ravel(self._track_gaussian_params), 
+                (self.freqs, spectrum_flat), self.n_iter, lower, upper)
+
+            # refit aperiodic component to peak-removed spectrum
+            spectrum_peak_rm = self.power_spectrum - \
+                gen_periodic(self.freqs, gaussian_params)
+            aperiodic_params = _gauss_newton(
+                _aperiodic_residuals, _aperiodic_jacobian, 
+                self._track_aperiodic_params, (self.freqs, spectrum_peak_rm), 
+                self.n_iter)
+        if not (np.all(np.isfinite(aperiodic_params)) and 
+                np.all(np.isfinite(gaussian_params))):
+            return False
+
+        # check absolute change of aperiodic parameters (offset and exponent), 
+        # compared to last full fit
+        change = aperiodic_params[[0, -1]] - self._full_aperiodic_params[[0, -1]]
+        if np.any(np.abs(change) > self.max_ap_change):
+            return False
+
+        # set model results (see SpectralModel.fit)
+        gaussian_params = gaussian_params.reshape([-1, 3])
+        self.aperiodic_params_ = aperiodic_params
+        self.gaussian_params_ = gaussian_params[gaussian_params[:, 0].argsort()]
+        self._ap_fit = gen_aperiodic(self.freqs, self.aperiodic_params_)
+        self._peak_fit = gen_periodic(self.freqs, 
+                                      np.ndarray.flatten(self.gaussian_params_))
+        self._spectrum_flat = self.power_spectrum - self._ap_fit
+        self._spectrum_peak_rm = self.power_spectrum - self._peak_fit
+        self.modeled_spectrum_ = self._peak_fit + self._ap_fit
+        self.peak_params_ = self._create_peak_params(self.gaussian_params_)
+        self._calc_r_squared()
+        self._calc_error()
+
+        # check error, relative to last full fit
+        return self.error_ <= self.max_error_ratio * self._track_error
+
+
+def _gauss_newton(residuals, jacobian, params, args, n_iter, lower=None, 
+                  upper=None):
+    """
+    Gauss-Newton iterations of a least-squares fit, starting from params. Steps 
+    are clipped to bounds and halved until the residual sum of squares 
+    decreases (iterations stop if it does not).
+    """
+
+    params = np.array(params, dtype=float)
+    if lower is not None:
+        params = np.clip(params, lower, upper)
+    resid = residuals(params, *args)
+    for _ in range(n_iter):
+        try:
+            step = np.linalg.lstsq(jacobian(params, *args), -resid, 
+                                   rcond=None)[0]
+        except np.linalg.LinAlgError:
+            break
+
+        # backtracking line search
+        for _ in range(5):
+            params_new = params + step
+            if lower is not None:
+                params_new = np.clip(params_new, lower, upper)
+            resid_new = residuals(params_new, *args)
+            if np.sum(resid_new**2) < np.sum(resid**2):
+                params, resid = params_new, resid_new
+                break
+            step = step / 2
+        else:
+            break
+
+    return params
+
+
+def _aperiodic_residuals(params, freqs, power_spectrum):
+    """Residuals of an aperiodic fit ('fixed' or 'knee', from len(params))."""
+
+    if len(params) == 3:
+        return params[0] - np.log10(params[1] + freqs**params[2]) - power_spectrum
+    else:
+        return params[0] - params[1] * np.log10(freqs) - power_spectrum
+
+
+def _aperiodic_jacobian(params, freqs, power_spectrum):
+    """Jacobian of _aperiodic_residuals (offset, (knee), exponent)."""
+
+    jac = np.ones([len(freqs), len(params)])
+    if len(params) == 3:
+        denom = (params[1] + freqs**params[2]) * np.log(10)
+        jac[:, 1] = -1 / denom
+        jac[:, 2] = -freqs**params[2] * np.log(freqs) / denom
+    else:
+        jac[:, 1] = -np.log10(freqs)
+
+    return jac
+
+
+def _gaussian_residuals(params, freqs, spectrum_flat):
+    """Residuals of a sum of gaussians (center, height, standard deviation)."""
+
+    ctr, hgt, wid = np.reshape(params, [-1, 3]).T[:, :, None]
+    gaussians = hgt * np.exp(-(freqs - ctr)**2 / (2 * wid**2))
+
+    return gaussians.sum(axis=0) - spectrum_flat
+
+
+def _gaussian_jacobian(params, freqs, spectrum_flat):
+    """Jacobian of _gaussian_residuals."""
+
+    ctr, hgt, wid = np.reshape(params, [-1, 3]).T[:, :, None]
+    kernels = np.exp(-(freqs - ctr)**2 / (2 * wid**2))
+    jac = np.empty([len(freqs), len(params)])
+    jac[:, 0::3] = (hgt * kernels * (freqs - ctr) / wid**2).T
+    jac[:, 1::3] = kernels.T
+    jac[:, 2::3] = (hgt * kernels * (freqs - ctr)**2 / wid**3).T
+
+    return jac
+
+
+class SharedAperiodicGroupModel(SpectralGroupModel):
+    """
+    SpectralGroupModel that reuses precomputed initial (robust) aperiodic 
+    fits. The initial aperiodic fit does not depend on the peak settings 
+    (peak_width_limits, max_n_peaks, min_peak_height, peak_threshold), so it 
+    can be shared across models that differ only in these settings. Results 
+    are identical to SpectralGroupModel.
+
+    Parameters
+    ----------
+    initial_ap_fits : dict, optional
+        Initial aperiodic parameters, keyed by spectrum (see 
+        compute_initial_ap_fits). Spectra without an entry are fit as usual.
+    *args, **kwargs
+        Settings passed to SpectralGroupModel.
+    """
+
+    def __init__(self, *args, initial_ap_fits=None, **kwargs):
+        """Initialize object with desired settings."""
+
+        super().__init__(*args, **kwargs)
+        self.initial_ap_fits = dict() if initial_ap_fits is None else \
+            initial_ap_fits
+
+
+    def _robust_ap_fit(self, freqs, power_spectrum):
+        """Return precomputed initial aperiodic fit, if available."""
+
+        ap_params = self.initial_ap_fits.get(_hash_spectrum(power_spectrum))
+        if ap_params is None:
+            return super()._robust_ap_fit(freqs, power_spectrum)
+        
+        return ap_params.copy()
+
+
+def compute_initial_ap_fits(freq, spectra, freq_range=None, ap_mode='fixed'):
+    """
+    Compute the initial (robust) aperiodic fit of SpecParam for each power 
+    spectrum, for use with SharedAperiodicGroupModel.
+
+    Parameters
+    ----------
+    freq : 1d array
+        Frequency values.
+    spectra : 2d array
+        Power spectra, of shape (n_spectra, n_freqs).
+    freq_range : list of [float, float], optional
+        Frequency range to fit. If None, the full range is used.
+    ap_mode : {'fixed', 'knee'}, optional, default: 'fixed'
+        Aperiodic mode.
+
+    Returns
+    -------
+    initial_ap_fits : dict
+        Initial aperiodic parameters, keyed by spectrum. Spectra that cannot
+        be fit are omitted.
+    """
+
+    # init
+    sm = SpectralModel(aperiodic_mode=ap_mode, verbose=False)
+    sm.set_check_modes(check_freqs=False, check_data=False)
+    initial_ap_fits = dict()
+
+    # fit aperiodic component for each spectrum
+    for spectrum in spectra:
+        sm.add_data(freq, spectrum, freq_range)
+        if not np.all(np.isfinite(sm.power_spectrum)):
+            continue
+        try:
+            ap_params = sm._robust_ap_fit(sm.freqs, sm.power_spectrum)
+        except FitError:
+            continue
+        initial_ap_fits[_hash_spectrum(sm.power_spectrum)] = ap_params
+
+    return initial_ap_fits
+
+
+def _hash_spectrum(power_spectrum):
+    """
+    Hash power spectrum (used as key for initial aperiodic fits).
+    """
+
+    # imports
+    import hashlib
+
+    return hashlib.sha1(np.ascontiguousarray(power_spectrum).tobytes()).hexdigest()
+
+
+class SharedPeakGroupModel(SpectralGroupModel):
+    """
+    SpectralGroupModel that reuses the peaks of a fit with another aperiodic 
+    mode (e.g. 'fixed') as the peak guess, instead of running the iterative 
+    peak search. Used for joint fitting of both aperiodic modes: the data 
+    checks and log-transform are shared, and the gaussian parameters of the 
+    first fit are refined on the spectrum flattened by this model's aperiodic 
+    fit. Spectra without stored peaks (or for which the refined fit fails) are 
+    fit as usual.
+
+    Parameters
+    ----------
+    initial_peak_fits : dict, optional
+        Gaussian parameters, keyed by spectrum (see compute_peak_fits).
+    *args, **kwargs
+        Settings passed to SpectralGroupModel.
+    """
+
+    # results differ from SpectralGroupModel (see fit_cache.compute_cache_keys)
+    cache_tag = 'shared_peaks'
+
+    def __init__(self, *args, initial_peak_fits=None, **kwargs):
+        """Initialize object with desired settings."""
+
+        super().__init__(*args, **kwargs)
+        self.initial_peak_fits = dict() if initial_peak_fits is None else \
+            initial_peak_fits
+
+
+    def _fit_peaks(self, flat_iter):
+        """Fit peaks, using stored gaussian parameters as the guess."""
+
+        guess = self.initial_peak_fits.get(_hash_spectrum(self.power_spectrum))
+        if guess is None or len(guess) == 0:
+            return super()._fit_peaks(flat_iter)
+
+        try:
+            gaussian_params = self._fit_peak_guess(guess.copy())
+        except (FitError, ValueError):
+            return super()._fit_peaks(flat_iter)
+
+        return gaussian_params[gaussian_params[:, 0].argsort()]
+
+
+class SharedFitsGroupModel(SharedPeakGroupModel, SharedAperiodicGroupModel):
+    """
+    SpectralGroupModel that reuses both precomputed initial aperiodic fits 
+    (see SharedAperiodicGroupModel) and peaks from a fit with another 
+    aperiodic mode (see SharedPeakGroupModel).
+    """
+
+
+def compute_peak_fits(sgm):
+    """
+    Collect the gaussian parameters of a fit SpectralGroupModel, keyed by 
+    spectrum, for use with SharedPeakGroupModel.
+
+    Parameters
+    ----------
+    sgm : SpectralGroupModel object
+        Fit model object (with data).
+
+    Returns
+    -------
+    peak_fits : dict
+        Gaussian parameters, keyed by spectrum. Failed fits are omitted.
+    """
+
+    peak_fits = dict()
+    for power_spectrum, results in zip(sgm.power_spectra, sgm.group_results):
+        if np.isnan(results.aperiodic_params[0]):
+            continue
+        peak_fits[_hash_spectrum(power_spectrum)] = results.gaussian_params
+
+    return peak_fits
+
+
+def compute_information_criteria(sgm):
+    """
+    Compute the Akaike and Bayesian information criteria (AIC and BIC) of each
+    model fit, from the residual sum of squares in log-power.
+
+    AIC = n * ln(RSS / n) + 2 * k;  BIC = n * ln(RSS / n) + k * ln(n)
+    where n is the number of frequency values and k the number of parameters
+    (aperiodic parameters + 3 per peak).
+
+    Parameters
+    ----------
+    sgm : SpectralGroupModel object
+        Fit model object (with data).
+
+    Returns
+    -------
+    aic, bic : 1d array
+        Information criteria for each spectrum (NaN for failed fits).
+    """
+
+    # compute model spectra
+    freqs = sgm.freqs
+    ap_params, gaussian_params = get_group_params(sgm)
+    model = np.sum(gen_model_batch(freqs, ap_params, gaussian_params), axis=0)
+    n_peaks = np.sum(~np.isnan(gaussian_params[:, :, 0]), axis=1)
+    n_params = ap_params.shape[-1] + 3 * n_peaks
+
+    # compute information criteria
+    n_freqs = len(freqs)
+    rss = np.sum((sgm.power_spectra - model) ** 2, axis=1)
+    log_likelihood = n_freqs * np.log(rss / n_freqs)
+    aic = log_likelihood + 2 * n_params
+    bic = log_likelihood + n_params * np.log(n_freqs)
+
+    return aic, bic
+
+
+def compute_preferred_mode(criteria):
+    """
+    Select the preferred aperiodic mode for each spectrum (lowest criterion).
+
+    Parameters
+    ----------
+    criteria : dict
+        Information criterion (e.g. BIC) for each spectrum, keyed by aperiodic
+        mode, e.g. {'fixed' : bic_fixed, 'knee' : bic_knee}.
+
+    Returns
+    -------
+    preferred_mode : 1d array of str
+        Preferred aperiodic mode for each spectrum ('' if all fits failed).
+    """
+
+    modes = list(criteria.keys())
+    values = np.array([criteria[mode] for mode in modes], dtype=float)
+    values[np.isnan(values)] = np.inf
+    preferred_mode = np.array(modes)[np.argmin(values, axis=0)]
+    preferred_mode[np.all(np.isinf(values), axis=0)] = ''
+
+    return preferred_mode
+
+
+class FitInstrumentation():
+    """
+    Mixin for SpectralGroupModel classes that records statistics of each 
+    spectrum fit: wall time, number of optimizer calls and function 
+    evaluations (specparam curve_fit calls), number of peaks attempted (peak 
+    guesses passed to the optimizer), number of peaks fit, and outcome 
+    ('success' or 'failed'). Use instrument() to create an instrumented model 
+    class.
+
+    Statistics are recorded for serial fits and for the shared-memory 
+    parallel backend (see parallel_fit), but not for results loaded from the 
+    fit cache.
+
+    Attributes
+    ----------
+    fit_stats_ : list of dict
+        Statistics of each spectrum fit (see fit_stats_to_df).
+    """
+
+    def fit(self, *args, **kwargs):
+        """Fit a group of power spectra, recording fit statistics."""
+
+        self.fit_stats_ = []
+        super().fit(*args, **kwargs)
+
+
+    def _fit(self, *args, **kwargs):
+        """Fit power spectrum, recording fit statistics."""
+
+        # imports
+        from time import perf_counter
+
+        if not hasattr(self, 'fit_stats_'):
+            self.fit_stats_ = []
+        self._n_peaks_attempted = 0
+        self._n_optimizer_calls, self._n_fev = 0, 0
+
+        # record optimizer calls of this model in the current thread
+        _install_curve_fit()
+        previous = getattr(_optimizer_recorder, 'model', None)
+        _optimizer_recorder.model = self
+        try:
+            t_start = perf_counter()
+            super()._fit(*args, **kwargs)
+            duration = perf_counter() - t_start
+        finally:
+            _optimizer_recorder.model = previous
+
+        self.fit_stats_.append({
+            'index' : len(self.fit_stats_),
+            'time' : duration,
+            'n_optimizer_calls' : self._n_optimizer_calls,
+            'n_fev' : self._n_fev,
+            'n_peaks_attempted' : self._n_peaks_attempted,
+            'n_peaks' : len(self.gaussian_params_),
+            'outcome' : 'failed' if np.isnan(self.aperiodic_params_[0]) 
+                else 'success'})
+
+
+    def _fit_peak_guess(self, guess):
+        """Fit peaks, recording the number of peak guesses."""
+
+        self._n_peaks_attempted = max(self._n_peaks_attempted, len(guess))
+
+        return super()._fit_peak_guess(guess)
+
+
+    def _record_optimizer_call(self, n_fev):
+        """Record an optimizer (curve_fit) call of the current fit."""
+
+        self._n_optimizer_calls += 1
+        self._n_fev += n_fev
+
+
+_INSTRUMENTED_CLASSES = dict()
+
+
+def instrument(model_class):
+    """
+    Create a model class that records fit statistics (see 
+    FitInstrumentation).
+
+    Parameters
+    ----------
+    model_class : class
+        SpectralGroupModel class (or subclass).
+
+    Returns
+    -------
+    instrumented_class : class
+        Subclass of FitInstrumentation and model_class.
+    """
+
+    # create class, registered in this module so that it can be pickled (for 
+    # parallel fitting)
+    if model_class not in _INSTRUMENTED_CLASSES:
+        name = f"Instrumented{model_class.__name__}"
+        instrumented_class = type(name, (FitInstrumentation, model_class), 
+                                  {'__module__' : __name__})
+        globals()[name] = instrumented_class
+        _INSTRUMENTED_CLASSES[model_class] = instrumented_class
+
+    return _INSTRUMENTED_CLASSES[model_class]
+
+
+# instrumented versions of the model classes (importable in worker processes)
+for _model_class in [SpectralGroupModel, WarmStartGroupModel, 
+                     TrackingGroupModel, SharedAperiodicGroupModel, 
+                     SharedPeakGroupModel, SharedFitsGroupModel]:
+    instrument(_model_class)
+
+
+_optimizer_recorder = threading.local()
+
+
+def _curve_fit(*args, **kwargs):
+    """
+    scipy.optimize.curve_fit, recording the call and number of function 
+    evaluations with the instrumented model that is being fit in the current 
+    thread, if any (see FitInstrumentation). Otherwise, equivalent to 
+    curve_fit.
+    """
+
+    # imports
+    from scipy.optimize import curve_fit
+
+    model = getattr(_optimizer_recorder, 'model', None)
+    if model is None:
+        return curve_fit(*args, **kwargs)
+
+    popt, pcov, info, _, _ = curve_fit(*args, full_output=True, **kwargs)
+    model._record_optimizer_call(info['nfev'])
+
+    return popt, pcov
+
+
+def _install_curve_fit():
+    """
+    Route the curve_fit calls of specparam's fitting methods through 
+    _curve_fit. Installed once per process, on the first instrumented fit; 
+    fits of models that are not instrumented are unaffected.
+    """
+
+    # imports
+    import specparam.objs.fit as fit_module
+
+    if fit_module.curve_fit is not _curve_fit:
+        fit_module.curve_fit = _curve_fit
+
+
+def fit_stats_to_df(sgm, **labels):
+    """
+    Convert the fit statistics of an instrumented model to a dataframe.
+
+    Parameters
+    ----------
+    sgm : SpectralGroupModel object
+        Fit model object, created with instrument().
+    **labels
+        Columns to add to the dataframe (e.g. file name, aperiodic mode).
+
+    Returns
+    -------
+    df : pd.DataFrame
+        Fit statistics, one row for each spectrum.
+    """
+
+    # imports
+    import pandas as pd
+
+    df = pd.DataFrame(getattr(sgm, 'fit_stats_', []), 
+                      columns=['index', 'time', 'n_optimizer_calls', 'n_fev', 
+                               'n_peaks_attempted', 'n_peaks', 'outcome'])
+    for ii, (key, value) in enumerate(labels.items()):
+        df.insert(ii, key, value)
+
+    return df
+
+
+def summarize_fit_stats(df, by=None):
+    """
+    Summarize fit statistics by category, sorted by total fit time.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Fit statistics (see fit_stats_to_df).
+    by : list of str, optional
+        Columns defining the categories. Default: ['ap_mode', 
+        'n_peaks_attempted', 'outcome'].
+
+    Returns
+    -------
+    summary : pd.DataFrame
+        Number of spectra, total and mean fit time, fraction of the total fit 
+        time, and mean number of function evaluations for each category.
+    """
+
+    if by is None:
+        by = ['ap_mode', 'n_peaks_attempted', 'outcome']
+    summary = df.groupby(by).agg(n_spectra=('time', 'size'), 
+                                 total_time=('time', 'sum'),
+                                 mean_time=('time', 'mean'),
+                                 mean_n_fev=('n_fev', 'mean'))
+    summary['time_fraction'] = summary['total_time'] / df['time'].sum()
+
+    return summary.sort_values('total_time', ascending=False)
+
+
+def params_to_spectra(params, component='both'):
+    """
+    Simulate power spectra from SpectralGroupModel object. All spectra are 
+    generated at once (see gen_model_batch).
+
+    Parameters
+    ----------
+    params : SpectralGroupModel object
+        SpectralGroupModel object containing model parameters.
+    component : str
+        Component to simulate ('both', 'aperiodic', or 'peak'). Default: 'both'.
+
+    Returns
+    -------
+    spectra: array
+        Power spectra (linear power).
+
+    """
+
+    if component not in ['both', 'aperiodic', 'peak']:
+        raise ValueError('Invalid component specified. Must be "both", \
+                         "aperiodic", or "peak".')
+
+    # simulate spectra from aperiodic and gaussian parameters
+    ap_params, gaussian_params = get_group_params(params)
+    if component == 'both':
+        log_spectra = np.sum(gen_model_batch(params.freqs, ap_params, 
+                                             gaussian_params), axis=0)
+    elif component == 'aperiodic':
+        log_spectra = gen_aperiodic_batch(params.freqs, ap_params)
+    elif component == 'peak':
+        log_spectra = gen_periodic_batch(params.freqs, gaussian_params)
+    spectra = np.power(10, log_spectra)
+    
+    return spectra
+
+
+def params_to_spectrum(params, component='both'):
+    """
+    Simulate power spectrum from SpectralModel object.
+
+    Parameters
+    ----------
+    params : SpectralModel object
+        SpectralModel object containing model parameters.
+    component : str
+        Component to simulate ('both', 'aperiodic', or 'peak'). Default: 'both'.
+
+    Returns
+    -------
+    spectrum: array
+        Power spectrum (linear power).
+
+    """
+
+    return params_to_spectra(params, component)[0]
+
+
+def compute_adj_r2(params):
+    """Calculate the adjusted r-squared for an existing SpectralModel or 
+    SpectralGroupModel. For groups, the adjusted r-squared of every model is 
+    computed directly from the stored r-squared values and peak counts 
+    (models are not regenerated).
+    
+    Parameters
+    ----------
+    params : SpectralModel or SpectralGroupModel object
+        Model object that has been fit to data.
+
+    Returns
+    -------
+    adj_r2 : float or 1d array
+        Adjusted r-squared value(s). NaN for failed fits.
+    """
+    # imports
+    from utils import adjust_r_squared
+    
+    # count number of parameters (aperiodic + 3 per peak)
+    n_samples = len(params.freqs) # number of data points
+    n_ap = 3 if params.aperiodic_mode == 'knee' else 2
+    if isinstance(params, SpectralGroupModel):
+        n_peaks = np.array([len(res.peak_params) for res in params.group_results])
+    else:
+        n_peaks = len(params.peak_params_)
+    n_params = n_peaks * 3 + n_ap # number of parameters
+
+    # compute adjusted r-squared
+    r_squared = params.get_params('r_squared')
+    adj_r2 = adjust_r_squared(r_squared, n_params, n_samples)
+
+    return adj_r2
+
+
+def compute_ap_intersections(freq_range, ap_params_0, ap_params_1, n_iter=50):
+    """
+    Compute the intersection frequency of pairs of aperiodic components, 
+    directly from their parameters (without simulating the spectra).
+
+    In 'fixed' mode, the aperiodic components are lines in log-log space and 
+    the intersection is computed analytically. In 'knee' mode, the difference 
+    between the components, (10^b0 * (k1 + f^x1) - 10^b1 * (k0 + f^x0)), has 
+    at most one stationary point (computed analytically); it is monotonic on 
+    either side, so each side contains at most one intersection, which is 
+    found by bisection (in log-frequency) to machine precision.
+
+    Parameters
+    ----------
+    freq_range : list of [float, float]
+        Frequency range in which to search for intersections.
+    ap_params_0, ap_params_1 : 2d array
+        Aperiodic parameters of shape (n_spectra, 2) or (n_spectra, 3) (see 
+        gen_aperiodic_batch). If the modes differ, 'fixed' parameters are 
+        treated as 'knee' parameters with a knee of 0.
+    n_iter : int, optional, default: 50
+        Number of bisection iterations ('knee' mode).
+
+    Returns
+    -------
+    intersection : 1d array
+        Intersection frequency. NaN unless there is exactly one intersection.
+    status : 1d array of str
+        'single' : one intersection within the frequency range.
+        'none' : no intersection (including identical components).
+        'multiple' : two intersections ('knee' mode only).
+        'invalid' : parameters are not finite (e.g. failed fit).
+    """
+
+    # get parameters
+    ap_params_0 = np.atleast_2d(ap_params_0).astype(float)
+    ap_params_1 = np.atleast_2d(ap_params_1).astype(float)
+    if len(ap_params_0) != len(ap_params_1):
+        raise ValueError('Input must be same size.')
+    x_lo, x_hi = np.log10(freq_range)
+    invalid = ~(np.all(np.isfinite(ap_params_0), axis=1) & 
+                np.all(np.isfinite(ap_params_1), axis=1))
+
+    # 'fixed' mode: solve analytically (in log10-frequency)
+    if ap_params_0.shape[1] == ap_params_1.shape[1] == 2:
+        with np.errstate(invalid='ignore', divide='ignore'):
+            x = (ap_params_1[:, 0] - ap_params_0[:, 0]) / \
+                (ap_params_1[:, 1] - ap_params_0[:, 1])
+        roots = np.where((x >= x_lo) & (x <= x_hi), x, np.nan)[:, np.newaxis]
+
+    # 'knee' mode: bracket intersections at the stationary point and bisect
+    else:
+        offset_0, knee_0, exp_0 = _unpack_knee_params(ap_params_0)
+        offset_1, knee_1, exp_1 = _unpack_knee_params(ap_params_1)
+        diff = lambda x: _ap_difference(x, offset_0, knee_0, exp_0, offset_1, 
+                                        knee_1, exp_1)
+
+        # stationary point (limited to the frequency range)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            x_s = (offset_1 - offset_0 + np.log10(exp_0 / exp_1)) / \
+                (exp_1 - exp_0)
+        x_s = np.clip(np.nan_to_num(x_s[:, 0], nan=x_hi), x_lo, x_hi)
+
+        # intersections at the bounds of the two monotonic intervals
+        bounds = np.stack([np.full_like(x_s, x_lo), x_s, 
+                           np.full_like(x_s, x_hi)], axis=1)
+        d_bounds = diff(bounds)
+        unique = np.stack([np.ones_like(x_s, dtype=bool), 
+                           (x_s > x_lo) & (x_s < x_hi), 
+                           np.ones_like(x_s, dtype=bool)], axis=1)
+        roots_bounds = np.where((d_bounds == 0) & unique, bounds, np.nan)
+
+        # intersections within each interval (sign change): bisection
+        lower, upper = bounds[:, :2], bounds[:, 1:]
+        d_lower = d_bounds[:, :2]
+        bracket = np.sign(d_lower) * np.sign(d_bounds[:, 1:]) < 0
+        for _ in range(n_iter):
+            mid = (lower + upper) / 2
+            same = np.sign(diff(mid)) == np.sign(d_lower)
+            lower = np.where(same, mid, lower)
+            upper = np.where(same, upper, mid)
+        roots_within = np.where(bracket, (lower + upper) / 2, np.nan)
+        roots = np.concatenate([roots_bounds, roots_within], axis=1)
+
+    # classify intersections
+    n_roots = np.sum(np.isfinite(roots), axis=1)
+    status = np.full(len(roots), 'single', dtype='<U8')
+    status[n_roots == 0] = 'none'
+    status[n_roots > 1] = 'multiple'
+    if ap_params_0.shape == ap_params_1.shape:
+        status[np.all(ap_params_0 == ap_params_1, axis=1)] = 'none'
+    status[invalid] = 'invalid'
+    intersection = np.full(len(roots), np.nan)
+    single = status == 'single'
+    intersection[single] = 10 ** np.nanmax(roots[single], axis=1)
+
+    return intersection, status
+
+
+def _unpack_knee_params(ap_params):
+    """Get offset, knee, and exponent from aperiodic parameters (knee of 0 
+    for 'fixed' mode), each of shape (n_spectra, 1)."""
+
+    offset = ap_params[:, [0]]
+    exponent = ap_params[:, [-1]]
+    knee = ap_params[:, [1]] if ap_params.shape[1] == 3 else np.zeros_like(offset)
+
+    return offset, knee, exponent
+
+
+def _ap_difference(x, offset_0, knee_0, exp_0, offset_1, knee_1, exp_1):
+    """Difference between two aperiodic components (log10 power) at 
+    log10-frequency x (same as gen_aperiodic_batch, per-row frequencies)."""
+
+    with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+        diff = (offset_1 - np.log10(knee_1 + 10 ** (exp_1 * x))) - \
+            (offset_0 - np.log10(knee_0 + 10 ** (exp_0 * x)))
+
+    return diff
+
+
+def compute_intersection(params_0, params_1, return_spectra=False):
+    """ 
+    Calculate intersection of two spectra from SpectralModel objects (see 
+    compute_intersections).
+
+    Parameters
+    ----------
+    params_0, params_1 : SpectralModel
+        SpectralModel objects containing power spectra.
+    return_spectra : bool, optional, default: False
+        Whether to return the power spectra.    
+
+    Returns
+    -------
+    intersection : float
+        intersection frequency
+    intersection_idx : float
+        index of intersection frequency
+    spectra_0, spectra_1 : 1d array
+        Power spectra from each model, if requested.
+
+    """
+
+    return compute_intersections(params_0, params_1, return_spectra)
+
+
+def compute_intersections(params_0, params_1, return_spectra=False, 
+                          return_status=False):
+    """ 
+    Calculate intersection of the aperiodic components of two SpectralModel 
+    or SpectralGroupModel objects. All intersections are computed at once, 
+    from the aperiodic parameters (see compute_ap_intersections).
+
+    Parameters
+    ----------
+    params_0, params_1 : SpectralModel or SpectralGroupModel
+        SpectralModel or SpectralGroupModel objects. Must have data.
+    return_spectra : bool, optional, default: False
+        Whether to return the power spectra.    
+    return_status : bool, optional, default: False
+        Whether to return the intersection status ('single', 'none', 
+        'multiple', or 'invalid').
+
+    Returns
+    -------
+    intersection : 1d array
+        intersection frequency (NaN unless there is exactly one intersection)
+    intersection_idx : 1d array
+        index of the frequency bin containing the intersection (i.e. the
+        intersection lies between freqs[idx] and freqs[idx+1])
+    spectra_0, spectra_1 : 2d array
+        Aperiodic power spectra from each model, if requested.
+    status : 1d array of str
+        Intersection status, if requested.
+
+    """
+
+    # check input
+    is_group = isinstance(params_0, SpectralGroupModel)
+    if is_group != isinstance(params_1, SpectralGroupModel):
+        raise ValueError('Input must both be SpectralModel or SpectralGroupModel.')
+    if is_group and (len(params_0) != len(params_1)):
+        raise ValueError('Input must be same size.')
+
+    # compute intersections
+    freqs = params_0.freqs
+    intersection, status = compute_ap_intersections(
+        [freqs[0], freqs[-1]], get_group_params(params_0)[0], 
+        get_group_params(params_1)[0])
+    intersection_idx = _intersection_index(freqs, intersection)
+
+    # collect results (scalars for SpectralModel input)
+    results = [intersection, intersection_idx]
+    if return_spectra:
+        results += [params_to_spectra(params_0, 'aperiodic'), 
+                    params_to_spectra(params_1, 'aperiodic')]
+    if return_status:
+        results.append(status)
+    if not is_group:
+        results = [result[0] for result in results]
+
+    return tuple(results)
+
+
+def compute_store_intersections(store_0, store_1, return_status=False):
+    """
+    Calculate intersection of the aperiodic components of all models (e.g. 
+    trials) and spectra (e.g. channels) of two parameter stores at once. The 
+    aperiodic parameters are read from the stores directly, without rebuilding 
+    SpectralGroupModel objects (see compute_intersections).
+
+    Parameters
+    ----------
+    store_0, store_1 : ParamStore
+        Parameter stores (see param_store.py) of the same shape.
+    return_status : bool, optional, default: False
+        Whether to return the intersection status ('single', 'none', 
+        'multiple', or 'invalid').
+
+    Returns
+    -------
+    intersection : 2d array
+        intersection frequency, of shape (n_models, n_spectra).
+    intersection_idx : 2d array
+        index of the frequency bin containing the intersection.
+    status : 2d array of str
+        Intersection status, if requested.
+
+    """
+
+    # check input
+    shape = store_0.r_squared.shape
+    if shape != store_1.r_squared.shape:
+        raise ValueError('Input must be same size.')
+
+    # compute intersections of all models and spectra
+    freqs = store_0.get_freqs()
+    n_spectra = np.prod(shape)
+    intersection, status = compute_ap_intersections(
+        [freqs[0], freqs[-1]], 
+        np.reshape(store_0.aperiodic_params, [n_spectra, -1]), 
+        np.reshape(store_1.aperiodic_params, [n_spectra, -1]))
+    intersection_idx = _intersection_index(freqs, intersection)
+
+    # reshape results to (n_models, n_spectra)
+    results = [intersection, intersection_idx]
+    if return_status:
+        results.append(status)
+
+    return tuple(np.reshape(result, shape) for result in results)
+
+
+def _intersection_index(freqs, intersection):
+    """Index of the frequency bin containing each intersection (the 
+    intersection lies between freqs[idx] and freqs[idx+1]); NaN if there is 
+    no intersection."""
+
+    intersection_idx = np.full(len(intersection), np.nan)
+    found = np.isfinite(intersection)
+    intersection_idx[found] = np.clip(np.searchsorted(
+        freqs, intersection[found], side='right') - 1, 0, len(freqs) - 2)
+
+    return intersection_idx
 
 
 def save_report_sm(sm, file_name, file_path=None, plot_peaks=None, plot_aperiodic=True, plt_log=True, 
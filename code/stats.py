@@ -233,3 +233,185 @@ def resample_means(data1, data2, surrogate_runs):
     exact_p_value = np.count_nonzero(np.abs(real_difference) < np.abs(surr_difference)) / surrogate_runs
 
     return real_difference, surr_difference, exact_p_value
+
+
+def run_sequential_permutation_test(data_a, data_b, n_max, alpha=0.05, 
+                                    error=0.001, batch_size=50, 
+                                    random_state=None):
+    """
+    Run paired permutation test with sequential early stopping.
+
+    Permutations are drawn in batches by randomly swapping the elements of 
+    each pair (equivalent to scipy.stats.permutation_test with 
+    permutation_type='samples'). After each batch, a Clopper-Pearson 
+    confidence interval is computed for the p-value; sampling stops once the 
+    interval lies entirely above or below alpha (Besag & Clifford, 1991), or 
+    once n_max permutations have been drawn.
+
+    Parameters
+    ----------
+    data_a, data_b : numpy.ndarray
+        Paired data to compare (same length).
+    n_max : int
+        Maximum number of permutations.
+    alpha : float, optional, default: 0.05
+        Significance level.
+    error : float, optional, default: 0.001
+        Probability that early stopping yields a different decision (relative 
+        to alpha) than the exact permutation p-value.
+    batch_size : int, optional, default: 50
+        Number of permutations drawn between stopping checks.
+    random_state : None, int, or numpy.random.Generator, optional
+        Seed or generator for the random permutations.
+
+    Returns
+    -------
+    p_value : float
+        Two-sided p-value (computed as in scipy.stats.permutation_test).
+    n_perm : int
+        Number of permutations used.
+    """
+
+    # imports
+    from scipy.stats import beta
+
+    # check for all nan
+    if np.all(np.isnan(data_a)) or np.all(np.isnan(data_b)):
+        return np.nan, 0
+
+    # compute true difference
+    rng = np.random.default_rng(random_state)
+    diff = np.nanmean(data_b) - np.nanmean(data_a)
+    tol = np.abs(np.finfo(float).eps * 100 * diff)
+
+    # draw permutations in batches until decision is settled
+    n_perm, n_less, n_greater = 0, 0, 0
+    while n_perm < n_max:
+        # swap pairs and compute surrogate distribution
+        n_batch = min(batch_size, n_max - n_perm)
+        swaps = rng.random([n_batch, len(data_a)]) < 0.5
+        surrogate_0 = np.where(swaps, data_b, data_a)
+        surrogate_1 = np.where(swaps, data_a, data_b)
+        distr = np.nanmean(surrogate_1, axis=1) - np.nanmean(surrogate_0, axis=1)
+
+        # update counts
+        n_perm += n_batch
+        n_less += np.sum(distr <= diff + tol)
+        n_greater += np.sum(distr >= diff - tol)
+
+        # confidence interval for the two-sided p-value
+        n_tail = min(n_less, n_greater)
+        ci_low = beta.ppf(error/2, n_tail, n_perm - n_tail + 1) if n_tail else 0
+        ci_high = beta.ppf(1 - error/2, n_tail + 1, n_perm - n_tail) \
+            if n_tail < n_perm else 1
+        if (2 * ci_high < alpha) or (2 * ci_low > alpha):
+            break
+
+    # compute p-value
+    p_value = min(2 * (min(n_less, n_greater) + 1) / (n_perm + 1), 1)
+
+    return p_value, n_perm
+
+
+def run_batched_permutation_test(data_a, data_b, n_iter, batch_size=100, 
+                                 random_state=None):
+    """
+    Run paired permutation test for multiple tests at once, with family-wise 
+    error rate (FWER) and false discovery rate (FDR) correction computed from 
+    the same permutations.
+
+    Each permutation randomly swaps the elements of each pair (equivalent to 
+    scipy.stats.permutation_test with permutation_type='samples') and is 
+    applied jointly to all tests, preserving the dependence between them. 
+    FWER-corrected p-values are computed from the null distribution of the 
+    maximum absolute statistic across tests (each test standardized by the 
+    standard deviation of its null distribution), and are bounded below by 
+    the uncorrected p-values. FDR-corrected p-values are 
+    computed with the Benjamini-Hochberg procedure.
+
+    Parameters
+    ----------
+    data_a, data_b : numpy.ndarray
+        Paired data to compare, of shape (n_samples, n_tests).
+    n_iter : int
+        Number of permutations.
+    batch_size : int, optional, default: 100
+        Number of permutations computed at once (limits memory usage).
+    random_state : None, int, or numpy.random.Generator, optional
+        Seed or generator for the random permutations.
+
+    Returns
+    -------
+    p_values : numpy.ndarray
+        Two-sided p-values (computed as in scipy.stats.permutation_test).
+    p_fwer : numpy.ndarray
+        FWER-corrected p-values (max-statistic).
+    p_fdr : numpy.ndarray
+        FDR-corrected p-values (Benjamini-Hochberg).
+    """
+
+    # compute true difference for each test
+    rng = np.random.default_rng(random_state)
+    diff = np.nanmean(data_b, axis=0) - np.nanmean(data_a, axis=0)
+    tol = np.abs(np.finfo(float).eps * 100 * diff)
+
+    # swap pairs and compute surrogate distribution, in batches
+    distr = np.zeros([n_iter, data_a.shape[1]])
+    for i_start in range(0, n_iter, batch_size):
+        n_batch = min(batch_size, n_iter - i_start)
+        swaps = rng.random([n_batch, data_a.shape[0], 1]) < 0.5
+        surrogate_0 = np.where(swaps, data_b, data_a)
+        surrogate_1 = np.where(swaps, data_a, data_b)
+        distr[i_start:i_start+n_batch] = np.nanmean(surrogate_1, axis=1) - \
+            np.nanmean(surrogate_0, axis=1)
+
+    # compute p-value for each test
+    n_less = np.sum(distr <= diff + tol, axis=0)
+    n_greater = np.sum(distr >= diff - tol, axis=0)
+    p_values = np.minimum(2 * (np.minimum(n_less, n_greater) + 1) / (n_iter + 1), 1)
+
+    # compute FWER-corrected p-values (max-statistic across tests)
+    valid = ~np.isnan(diff)
+    p_fwer = np.full(len(diff), np.nan)
+    if valid.any():
+        scale = np.std(distr[:, valid], axis=0)
+        scale[scale == 0] = np.nan # exclude constant tests
+        distr_max = np.nanmax(np.abs(distr[:, valid]) / scale, axis=1)
+        stat = np.abs(diff[valid]) / scale
+        n_more = np.sum(distr_max[:, None] >= stat - tol[valid] / scale, axis=0)
+        p_fwer[valid] = np.maximum((n_more + 1) / (n_iter + 1), p_values[valid])
+
+    # compute FDR-corrected p-values
+    p_values[~valid] = np.nan
+    p_fdr = adjust_pvalues_fdr(p_values)
+
+    return p_values, p_fwer, p_fdr
+
+
+def adjust_pvalues_fdr(p_values):
+    """
+    Adjust p-values for false discovery rate (Benjamini-Hochberg). NaN values 
+    are ignored.
+
+    Parameters
+    ----------
+    p_values : numpy.ndarray
+        P-values to adjust.
+
+    Returns
+    -------
+    p_fdr : numpy.ndarray
+        FDR-adjusted p-values.
+    """
+
+    # imports
+    from statsmodels.stats.multitest import multipletests
+
+    # adjust non-nan p-values
+    p_values = np.asarray(p_values, dtype=float)
+    valid = ~np.isnan(p_values)
+    p_fdr = np.full(p_values.shape, np.nan)
+    if valid.any():
+        p_fdr[valid] = multipletests(p_values[valid], method='fdr_bh')[1]
+
+    return p_fdr
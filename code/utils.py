@@ -140,3 +140,40 @@ def combine_images(dir_fig, fname_out):
     ax.axis('off')
     fig.savefig(fname_out, bbox_inches='tight', dpi=300)  
 
+
+
+def get_excluded_channels(fname, column, patients, chan_idx):
+    """
+    Get channels to exclude from parameterization: channels that are not 
+    selected (False) in a column of the channel results of step3 (e.g. 
+    'sig_all' of ieeg_modulated_channels.csv). Channels missing from the 
+    results are excluded.
+
+    Parameters
+    ----------
+    fname : str
+        Filename of channel results (with columns 'patient' and 'chan_idx').
+    column : str
+        Column selecting the channels to include.
+    patients : 1d array of str
+        Patient of each channel.
+    chan_idx : 1d array of int
+        Index of each channel.
+
+    Returns
+    -------
+    exclude : 1d array of bool
+        Whether each channel is excluded.
+    """
+
+    # imports
+    import pandas as pd
+
+    # look up channels in results
+    results = pd.read_csv(fname, index_col=0)
+    selected = results.set_index(['patient', 'chan_idx'])[column].astype(bool)
+    index = pd.MultiIndex.from_arrays([np.asarray(patients), 
+                                       np.asarray(chan_idx)])
+    exclude = ~selected.reindex(index, fill_value=False).values
+
+    return exclude
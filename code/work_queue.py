@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+Resumable work queue for long-running analyses.
+
+Each task is an independent unit of work, identified by a unique key. Tasks
+are dispatched to a pool of worker processes, and the key of each completed
+task is appended to a journal file. When the queue is run again (e.g. after an
+interruption), tasks recorded in the journal are skipped.
+"""
+
+# Imports
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from time import time as timer
+from utils import hour_min_sec
+
+
+def run_task_queue(func, tasks, fname_journal, n_workers=1, callback=None):
+    """
+    Run tasks in a pool of worker processes, skipping tasks that were already
+    completed (recorded in the journal).
+
+    Parameters
+    ----------
+    func : callable
+        Function to run for each task, called as func(*args). Must be
+        picklable (defined at module level).
+    tasks : dict
+        Tasks to run, as {key : args}, where key is a unique string and args
+        is a tuple of arguments for func.
+    fname_journal : str
+        Filename of the journal of completed tasks.
+    n_workers : int, optional, default: 1
+        Number of worker processes. -1 uses all available cores. If 1, tasks
+        are run in the current process.
+    callback : callable, optional
+        Function called in the current process after each task completes, as
+        callback(key, result).
+
+    Returns
+    -------
+    failed : dict
+        Tasks that raised an error, as {key : error}.
+    """
+
+    # skip completed tasks
+    completed = load_journal(fname_journal)
+    todo = {key : args for key, args in tasks.items() if key not in completed}
+    print(f"Tasks: {len(tasks)} total, {len(tasks) - len(todo)} already "
+          f"completed, {len(todo)} to run")
+    if len(todo) == 0:
+        return dict()
+
+    # run tasks
+    t_start = timer()
+    failed = dict()
+    with open(fname_journal, 'a') as journal:
+        for i_task, (key, result, error) in enumerate(
+                _run_tasks(func, todo, n_workers)):
+            # record completed task (or error)
+            if error is None:
+                if callback is not None:
+                    callback(key, result)
+                journal.write(f"{key}\n")
+                journal.flush()
+            else:
+                print(f"    Task failed: {key} ({error!r})")
+                failed[key] = error
+
+            # display progress
+            print_progress(key, i_task + 1, len(todo), timer() - t_start)
+
+    return failed
+
+
+def load_journal(fname_journal):
+    """
+    Load the keys of completed tasks from a journal.
+
+    Parameters
+    ----------
+    fname_journal : str
+        Filename of the journal.
+
+    Returns
+    -------
+    completed : set of str
+        Keys of completed tasks (empty if the journal does not exist).
+    """
+
+    if not os.path.exists(fname_journal):
+        return set()
+    with open(fname_journal, 'r') as f:
+        completed = set([line.strip() for line in f if line.strip()])
+
+    return completed
+
+
+def print_progress(key, n_done, n_total, duration):
+    """
+    Display progress of the queue: tasks completed, throughput, and estimated
+    time remaining.
+
+    Parameters
+    ----------
+    key : str
+        Key of the last completed task.
+    n_done, n_total : int
+        Number of tasks completed and total number of tasks to run.
+    duration : float
+        Time elapsed (seconds).
+    """
+
+    rate = n_done / duration
+    hour, min, sec = hour_min_sec((n_total - n_done) / rate)
+    print(f"    [{n_done}/{n_total}] {key} - {rate * 60:0.1f} tasks/min, "
+          f"ETA: {hour} hour, {min} min, and {sec:0.1f} s")
+
+
+def _run_tasks(func, tasks, n_workers):
+    """Run tasks, yielding (key, result, error) as tasks complete."""
+
+    # run tasks in current process
+    if n_workers == 1:
+        for key, args in tasks.items():
+            try:
+                yield key, func(*args), None
+            except Exception as error:
+                yield key, None, error
+        return
+
+    # run tasks in worker processes
+    n_workers = os.cpu_count() if n_workers == -1 else n_workers
+    executor = ProcessPoolExecutor(max_workers=n_workers)
+    try:
+        futures = {executor.submit(func, *args) : key
+                   for key, args in tasks.items()}
+        for future in as_completed(futures):
+            error = future.exception()
+            result = None if error is not None else future.result()
+            yield futures[future], result, error
+
+    # on interruption, cancel pending tasks (they are run on resume)
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,131 @@
+"""
+This script benchmarks log-frequency resampling of power spectra before
+SpecParam fitting (LOG_FREQ_POINTS in settings.py). The PSDs from
+step2_time_frequency_analysis.py are fit at full resolution and after
+resampling onto log-spaced grids of increasing size. For each grid size, the
+fit time and the error of the parameters relative to the full-resolution fits
+are reported, along with the smallest grid size for which the 95th percentile
+of the aperiodic parameter error is within tolerance.
+
+When resampling is enabled, step4 and step7 fit the resampled spectra, then
+evaluate the fits on the native grid (specparam_utils.set_group_data), as saved
+SpecParam results store only the frequency range and resolution.
+
+"""
+
+# Imports - standard
+import os
+import numpy as np
+import pandas as pd
+from time import time as timer
+from specparam import SpectralGroupModel
+
+# Imports - custom
+import sys
+sys.path.append("code")
+from paths import PROJECT_PATH
+from settings import SPEC_PARAM_SETTINGS, FREQ_RANGE, N_JOBS
+from utils import get_start_time, print_time_elapsed
+from specparam_utils import resample_log_freq, extract_ap_params
+from parallel_fit import fit_group
+
+# settings
+N_FREQS = [25, 50, 100, 200] # grid sizes to test (number of log-spaced values)
+AP_MODES = ['fixed', 'knee']
+TOLERANCE = {'offset' : 0.05, 'exponent' : 0.05} # max. 95th percentile error
+
+
+def main():
+
+    # display progress
+    t_start = get_start_time()
+
+    # identify / create directories
+    dir_input = f"{PROJECT_PATH}/data/ieeg_spectral_results"
+    dir_output = f"{PROJECT_PATH}/data/results"
+    if not os.path.exists(dir_output):
+        os.makedirs(f"{dir_output}")
+
+    # load PSDs (all conditions)
+    files = [f for f in os.listdir(dir_input) if f.startswith('psd') &
+             (not 'epoch' in f)]
+    spectra = np.concatenate([np.load(f"{dir_input}/{f}")['spectra']
+                              for f in files])
+    freq = np.load(f"{dir_input}/{files[0]}")['freq']
+    print(f"Spectra: {len(spectra)}, frequency values: "
+          f"{np.sum((freq >= FREQ_RANGE[0]) & (freq <= FREQ_RANGE[1]))}")
+
+    # compare fits at each grid size to full-resolution fits
+    df_list = []
+    for ap_mode in AP_MODES:
+        print(f"\nAperiodic mode: {ap_mode}")
+        sgm_full, time_full = fit_spectra(freq, spectra, FREQ_RANGE, ap_mode)
+        for n_freqs in N_FREQS:
+            freq_log, spectra_log = resample_log_freq(freq, spectra, n_freqs,
+                                                      FREQ_RANGE)
+            sgm, time_fit = fit_spectra(freq_log, spectra_log, None, ap_mode)
+            df = compute_errors(sgm_full, sgm)
+            df.insert(0, 'ap_mode', ap_mode)
+            df.insert(1, 'n_freqs', n_freqs)
+            df.insert(2, 'speedup', time_full / time_fit)
+            df_list.append(df)
+            print(f"    {n_freqs} frequencies: {time_full / time_fit:0.1f}x "
+                  f"faster; 95th percentile error: offset "
+                  f"{df['offset_error'].quantile(0.95):0.3f}, exponent "
+                  f"{df['exponent_error'].quantile(0.95):0.3f}")
+
+    # save results
+    results = pd.concat(df_list, ignore_index=True)
+    results.to_csv(f"{dir_output}/benchmark_log_freq_resampling.csv",
+                   index=False)
+
+    # report smallest grid size within tolerance
+    print("\nSmallest grid size within tolerance (95th percentile error):")
+    columns = [f"{param}_error" for param in TOLERANCE]
+    summary = results.groupby(['ap_mode', 'n_freqs'])[columns].quantile(0.95)
+    for ap_mode in AP_MODES:
+        within = np.all([summary.loc[ap_mode, f"{param}_error"] <= tol
+                         for param, tol in TOLERANCE.items()], axis=0)
+        n_freqs = summary.loc[ap_mode].index[within]
+        print(f"    {ap_mode}: {n_freqs.min() if len(n_freqs) else 'none'}")
+
+    # display progress
+    print(f"\n\nTotal analysis time:")
+    print_time_elapsed(t_start)
+
+
+def fit_spectra(freq, spectra, freq_range, ap_mode):
+    # fit spectra and time it
+    sgm = SpectralGroupModel(**SPEC_PARAM_SETTINGS, aperiodic_mode=ap_mode,
+                             verbose=False)
+    sgm.set_check_modes(check_freqs=False, check_data=False)
+    t_start = timer()
+    fit_group(sgm, freq, spectra, freq_range=freq_range, n_jobs=N_JOBS)
+
+    return sgm, timer() - t_start
+
+
+def compute_errors(sgm_ref, sgm):
+    # aperiodic parameters and goodness-of-fit
+    df = pd.DataFrame({'chan_idx' : np.arange(len(sgm))})
+    for param, ref, value in zip(['offset', 'knee', 'exponent'],
+                                 extract_ap_params(sgm_ref),
+                                 extract_ap_params(sgm)):
+        df[f"{param}_error"] = np.abs(np.asarray(value) - np.asarray(ref))
+    df['r_squared_diff'] = sgm.get_params('r_squared') - \
+        sgm_ref.get_params('r_squared')
+
+    # number of peaks and center frequency of the largest peak
+    n_peaks = [[len(res.peak_params) for res in model.group_results]
+               for model in [sgm_ref, sgm]]
+    df['n_peaks_match'] = np.equal(*n_peaks)
+    cf = [[res.peak_params[np.argmax(res.peak_params[:, 1]), 0]
+           if len(res.peak_params) else np.nan for res in model.group_results]
+          for model in [sgm_ref, sgm]]
+    df['cf_error'] = np.abs(np.subtract(*cf))
+
+    return df
+
+
+if __name__ == "__main__":
+    main()
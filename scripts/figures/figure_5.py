@@ -52,10 +52,13 @@ def main():
 
     # load rotation analysis results
     intersection = dict()
+    status = dict()
     for df, material in zip([df_w, df_f], MATERIALS):
         fname = f"intersection_results_{material}_hit_knee.npz"
         data_in = np.load(f"{PROJECT_PATH}/data/ieeg_intersection_results/{fname}")
         intersection[material] = data_in['intersection'][df['sig_all']]
+        if 'status' in data_in:
+            status[material] = data_in['status'][df['sig_all']]
     
     # load spectal results
     psd = dict()
@@ -152,6 +155,9 @@ def main():
         print(f"    Mean:\t{np.nanmean(f_intersection):.3f} Hz")
         print(f"    Median:\t{np.nanmedian(f_intersection):.3f} Hz")
         print(f"    STD:\t{np.nanstd(f_intersection):.3f} Hz")
+        if material in status:
+            for label in ['single', 'none', 'multiple', 'invalid']:
+                print(f"    N {label}:\t{np.sum(status[material]==label)}")
 
     # display progress
     print(f"\n\nTotal analysis time:")
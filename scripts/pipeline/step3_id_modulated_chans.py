@@ -10,17 +10,19 @@ import numpy as np
 import pandas as pd
 from time import time as timer
 from time import ctime as time_now
-from specparam.utils import trim_spectrum
 from specparam.bands import Bands
 from scipy.stats import permutation_test
+from joblib import Parallel, delayed
 
 # Imports - custom
 import sys
 sys.path.append("code")
 from paths import PROJECT_PATH
-from settings import BANDS
+from settings import BANDS, N_JOBS
 from utils import hour_min_sec
-from stats import mean_difference
+from specparam_utils import compute_power_index, compute_indexed_band_powers
+from stats import (mean_difference, run_sequential_permutation_test, 
+                   run_batched_permutation_test, adjust_pvalues_fdr)
 
 # ignore mean of empty slice warnings
 import warnings
@@ -29,8 +31,18 @@ warnings.filterwarnings("ignore")
 # analysis parameters
 N_ITER = 1000 # random permutation iterations/shuffles
 ALPHA = 0.05 # significance level
+SEQUENTIAL = False # stop permutations early once decision is settled
+SEQ_ERROR = 0.001 # probability of early stopping changing the decision
+BATCHED = False # share permutations across all channels and bands (required for 'fwer')
+PER_CHANNEL_SEEDS = False # default test: seed each channel from SEED (False: random_state=0 for every test, as in the original analysis)
+CORRECTION = None # multiple comparison correction: None, 'fwer', or 'fdr'
+SEED = 0 # master random seed; seeds per file are spawned from it, and per channel for SEQUENTIAL or PER_CHANNEL_SEEDS
 
 def main():
+    # check settings (FWER correction requires shared permutations)
+    if CORRECTION == 'fwer' and not (BATCHED and not SEQUENTIAL):
+        raise ValueError("CORRECTION='fwer' requires BATCHED=True and SEQUENTIAL=False.")
+
    # time it
     t_start = timer()
 
@@ -43,79 +55,30 @@ def main():
 
     # create bands object
     bands = Bands(BANDS)
-        
-    # init dataframe
-    results = pd.DataFrame()
-
-    # loop through files
-    fnames = [f for f in files if "prestim" in f]
-    for i_file, file in enumerate(fnames):
-        # display progress - every 100 files
-        hours, minutes, seconds = hour_min_sec(timer() - t_start)
-        print(f"\nAnalyzing file {i_file} of {len(fnames)}...")
-        print(f"    Current time: \t{time_now()}")
-        print(f"    Elapsed time: \t{hours}h {minutes}m {seconds}s")      
-        
-        # init dataframe
-        columns=['patient', 'material', 'memory', 'chan_idx']
-        df = pd.DataFrame(columns=columns)
-        
-        # load pre- and post-stim psd
-        data_pre = np.load(f"{dir_input}/{file}")
-        data_post = np.load(f"{dir_input}/{file.replace('pre', 'post')}")
-        psd_pre = data_pre['psd']
-        psd_post = data_post['psd']
-        freq = data_pre['freq']
-
-        # loop through channels
-        for i_chan in range(psd_pre.shape[1]):
-            # save metadata
-            f_parts = file.split('_')
-            df.loc[i_chan, 'patient'] = f_parts[0]
-            df.loc[i_chan, 'material'] = f_parts[1]
-            df.loc[i_chan, 'memory'] = f_parts[2]
-            df.loc[i_chan, 'chan_idx'] = i_chan
-
-            # loop through bands of interst
-            for band, f_range in zip(bands.labels, bands.definitions):
-                # trim psd in frequency bands of interest and average across freqs
-                power_pre = np.mean(trim_spectrum(freq, psd_pre[:, i_chan], 
-                                                 f_range)[1], axis=1)
-                power_post = np.mean(trim_spectrum(freq, psd_post[:, i_chan],
-                                                  f_range)[1], axis=1)
-
-                # correct for nan
-                if (np.isnan(power_pre).all()) | (np.isnan(power_post).all()):
-                    # save results
-                    df.loc[i_chan, f'{band}_pre'] = np.nan
-                    df.loc[i_chan, f'{band}_post'] = np.nan
-                    df.loc[i_chan, f'{band}_pval'] = np.nan
-                    df.loc[i_chan, f'{band}_sign'] = np.nan
-                    continue
-
-                # determine whether bandpower was task modulation
-                stats = permutation_test([power_pre, power_post], 
-                                         statistic=mean_difference, 
-                                         permutation_type='samples',
-                                         n_resamples=N_ITER,
-                                         alternative='two-sided',
-                                         random_state=0)
 
-                # determine sign of effect
-                sign = np.sign(np.nanmean(power_post) - np.nanmean(power_pre))
+    # spawn independent random seeds for each file from master seed (files are
+    # sorted so that results are reproducible regardless of number of workers)
+    fnames = sorted([f for f in files if "prestim" in f])
+    seeds = np.random.SeedSequence(SEED).spawn(len(fnames))
 
-                # save results
-                df.loc[i_chan, f'{band}_pre'] = np.nanmean(power_pre)
-                df.loc[i_chan, f'{band}_post'] = np.nanmean(power_post)
-                df.loc[i_chan, f'{band}_pval'] = stats.pvalue
-                df.loc[i_chan, f'{band}_sign'] = sign
+    # analyze files in parallel
+    print(f"\nAnalyzing {len(fnames)} files...")
+    print(f"    Current time: \t{time_now()}")
+    df_list = Parallel(n_jobs=N_JOBS, verbose=10)(
+        delayed(analyze_file)(dir_input, file, bands, seed) 
+        for file, seed in zip(fnames, seeds))
 
-        # aggreate results
-        results = pd.concat([results, df], ignore_index=True)
+    # aggreate results
+    results = pd.concat(df_list, ignore_index=True)
 
     # find significant results (p-value < alpha)
     for band in bands.labels:
-        results[f'{band}_sig'] = results[f'{band}_pval'] < ALPHA # determine significance within condition
+        pval = f'{band}_pval' if CORRECTION is None else f'{band}_pval_{CORRECTION}'
+        results[f'{band}_sig'] = results[pval] < ALPHA # determine significance within condition
+
+    # display number of permutations used
+    n_perm = results[[f'{band}_n_perm' for band in bands.labels]].values.sum()
+    print(f"\nPermutations used: {n_perm:.0f} ({len(results) * len(bands) * N_ITER} max)")
 
     # # save intermediate results
     results.to_csv(f"{dir_output}/band_power_statistics.csv")
@@ -128,7 +91,8 @@ def main():
     for band in bands.labels: # drop unnecessary columns
         results_s.rename(columns={f'{band}_sig' : f'sig_{band}'}, inplace=True)
         results_s.drop(columns=[f'{band}_pre', f'{band}_post', f'{band}_pval', 
-                                f'{band}_sign'], inplace=True)
+                                f'{band}_pval_fwer', f'{band}_pval_fdr',
+                                f'{band}_sign', f'{band}_n_perm'], inplace=True)
 
     # find channels that are task modulated in all/any frequency bands
     results_s['sig_all'] = results_s[[f'sig_{band}' for band in bands.labels]].all(axis=1)
@@ -142,6 +106,114 @@ def main():
     print(f"\n\nTotal Time: \t {hour} hours, {min} minutes, {sec:0.1f} seconds")
 
 
+def analyze_file(dir_input, file, bands, seed):
+    """
+    Run permutation test for each channel and band of a pre-/post-stimulus 
+    PSD file. By default, each channel and band is tested with 
+    scipy.stats.permutation_test, with random_state=0 (reproduces the original
+    analysis), or, if PER_CHANNEL_SEEDS, with an independent random generator 
+    for each channel spawned from seed (numpy.random.SeedSequence). In 
+    sequential mode, each channel is tested with an independent random 
+    generator spawned from seed, stopping early once the decision is settled.
+    In batched mode, all channels and bands share the same permutations, 
+    drawn with a random generator seeded by seed, and FWER-corrected p-values 
+    are computed across them. FDR-corrected p-values are computed in all 
+    modes.
+    """
+    # ignore mean of empty slice warnings (worker processes)
+    warnings.filterwarnings("ignore")
+
+    # load pre- and post-stim psd
+    data_pre = np.load(f"{dir_input}/{file}")
+    data_post = np.load(f"{dir_input}/{file.replace('pre', 'post')}")
+    psd_pre = data_pre['psd']
+    psd_post = data_post['psd']
+    freq = data_pre['freq']
+    n_chans = psd_pre.shape[1]
+
+    # compute band power for all trials and channels (averaged across freqs)
+    powers_pre = compute_indexed_band_powers(
+        compute_power_index(freq, psd_pre), BANDS)
+    powers_post = compute_indexed_band_powers(
+        compute_power_index(freq, psd_post), BANDS)
+
+    # stack bands - array of shape (n_trials, n_bands * n_chans)
+    power_pre = np.concatenate([powers_pre[band] for band in bands.labels], 1)
+    power_post = np.concatenate([powers_post[band] for band in bands.labels], 1)
+    is_nan = np.isnan(power_pre).all(0) | np.isnan(power_post).all(0)
+
+    # determine whether bandpower was task modulated
+    if SEQUENTIAL:
+        # run test for each channel and band, with channel-specific seeds
+        pval = np.full(power_pre.shape[1], np.nan)
+        n_perm = np.zeros(power_pre.shape[1])
+        chan_seeds = seed.spawn(n_chans)
+        for i_chan in range(n_chans):
+            rng = np.random.default_rng(chan_seeds[i_chan])
+            for i_test in range(i_chan, power_pre.shape[1], n_chans):
+                if is_nan[i_test]:
+                    continue
+                pval[i_test], n_perm[i_test] = run_sequential_permutation_test(
+                    power_pre[:, i_test], power_post[:, i_test], N_ITER, 
+                    alpha=ALPHA, error=SEQ_ERROR, random_state=rng)
+        pval_fwer = np.full(power_pre.shape[1], np.nan) # requires shared permutations
+        pval_fdr = adjust_pvalues_fdr(pval)
+    elif BATCHED:
+        # run test for all channels and bands at once
+        pval, pval_fwer, pval_fdr = run_batched_permutation_test(
+            power_pre, power_post, N_ITER, random_state=np.random.default_rng(seed))
+        n_perm = np.where(is_nan, 0, N_ITER)
+    else:
+        # run test for each channel and band (with channel-specific seeds, if
+        # PER_CHANNEL_SEEDS)
+        pval = np.full(power_pre.shape[1], np.nan)
+        chan_seeds = seed.spawn(n_chans)
+        for i_chan in range(n_chans):
+            rng = np.random.default_rng(chan_seeds[i_chan]) \
+                if PER_CHANNEL_SEEDS else 0
+            for i_test in range(i_chan, power_pre.shape[1], n_chans):
+                if is_nan[i_test]:
+                    continue
+                stats = permutation_test([power_pre[:, i_test], 
+                                          power_post[:, i_test]], 
+                                         statistic=mean_difference, 
+                                         permutation_type='samples',
+                                         n_resamples=N_ITER,
+                                         alternative='two-sided',
+                                         random_state=rng)
+                pval[i_test] = stats.pvalue
+        pval_fwer = np.full(power_pre.shape[1], np.nan) # requires shared permutations
+        pval_fdr = adjust_pvalues_fdr(pval)
+        n_perm = np.where(is_nan, 0, N_ITER)
+
+    # compute mean band power and sign of effect
+    mean_pre = np.nanmean(power_pre, axis=0)
+    mean_post = np.nanmean(power_post, axis=0)
+    sign = np.sign(mean_post - mean_pre)
+
+    # split results by band
+    results = dict()
+    for i_band, band in enumerate(bands.labels):
+        band_idx = slice(i_band * n_chans, (i_band + 1) * n_chans)
+        results[f'{band}_pre'] = mean_pre[band_idx]
+        results[f'{band}_post'] = mean_post[band_idx]
+        results[f'{band}_pval'] = pval[band_idx]
+        results[f'{band}_pval_fwer'] = pval_fwer[band_idx]
+        results[f'{band}_pval_fdr'] = pval_fdr[band_idx]
+        results[f'{band}_sign'] = sign[band_idx]
+        results[f'{band}_n_perm'] = n_perm[band_idx].astype(float)
+
+    # create dataframe
+    f_parts = file.split('_')
+    df = pd.DataFrame({'patient' : f_parts[0], 
+                       'material' : f_parts[1],
+                       'memory' : f_parts[2],
+                       'chan_idx' : np.arange(n_chans),
+                       **results})
+
+    return df
+
+
 if __name__ == "__main__":
     main()
 
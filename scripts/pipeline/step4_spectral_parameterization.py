@@ -14,12 +14,25 @@ from time import time as timer
 import sys
 sys.path.append("code")
 from paths import PROJECT_PATH
-from settings import N_JOBS, SPEC_PARAM_SETTINGS, FREQ_RANGE
-from utils import hour_min_sec
+from settings import (N_JOBS, SPEC_PARAM_SETTINGS, FREQ_RANGE, FIT_CACHE_SIZE,
+                      FIT_BACKEND, JOINT_AP_FIT, REPORT_MODE, N_REPORT_WORKERS,
+                      FIT_INSTRUMENTATION, EXCLUDE_CHANNELS, LOG_FREQ_POINTS)
+from utils import hour_min_sec, get_excluded_channels
+from specparam_utils import (WarmStartGroupModel, TrackingGroupModel,
+                             SharedPeakGroupModel, compute_peak_fits, 
+                             compute_information_criteria,
+                             compute_preferred_mode, instrument, 
+                             fit_stats_to_df, summarize_fit_stats,
+                             resample_log_freq, set_group_data)
+from fit_cache import fit_group_cached
+from report_utils import ReportPool, strip_data
+from work_queue import run_task_queue
 
 # Settings
 RUN_TFR = False # run TFR parameterization (takes a long time)
 AP_MODE = ['fixed', 'knee'] # aperiodic mode for SpecParam
+WARM_START = False # initialize TFR fits from previous time bin (serial fitting)
+TRACKING = False # track TFR fits across time bins, full refit only on large changes
 
 
 def main():
@@ -37,12 +50,30 @@ def param_group_psd_results():
     # identify / create directories
     dir_input = f"{PROJECT_PATH}/data/ieeg_spectral_results"
     dir_output = f"{PROJECT_PATH}/data/ieeg_psd_param"
+    dir_cache = f"{PROJECT_PATH}/data/fit_cache"
+    dir_results = f"{PROJECT_PATH}/data/results"
     if not os.path.exists(dir_output): 
         os.makedirs(f"{dir_output}/reports")
+    if not os.path.exists(dir_results): 
+        os.makedirs(dir_results)
     
     # display progress
     t_start = timer()
     
+    # init report rendering
+    reports = ReportPool(REPORT_MODE, n_workers=N_REPORT_WORKERS)
+    fit_stats = []
+
+    # optionally exclude channels not selected in step3 (spectra are ordered 
+    # as the channel info, see step2_time_frequency_analysis.aggregate_spectra)
+    exclude = None
+    if EXCLUDE_CHANNELS is not None:
+        chan_info = pd.read_csv(f"{PROJECT_PATH}/data/ieeg_metadata/ieeg_channel_info.csv", 
+                                index_col=0)
+        exclude = get_excluded_channels(
+            f"{dir_results}/ieeg_modulated_channels.csv", EXCLUDE_CHANNELS,
+            chan_info['patient'], chan_info['chan_idx'])
+
     # loop through conditions
     files = [f for f in os.listdir(dir_input) if f.startswith('psd') & (not 'epoch' in f)]
     for i_file, fname in enumerate(files):
@@ -54,23 +85,73 @@ def param_group_psd_results():
         data_in =  np.load(f"{dir_input}/{fname}")
         spectra = data_in['spectra']
         freq = data_in['freq']
+
+        # resample to log-spaced frequencies for fitting (optional)
+        freq_fit, spectra_fit, freq_range = freq, spectra, FREQ_RANGE
+        if LOG_FREQ_POINTS is not None:
+            freq_fit, spectra_fit = resample_log_freq(freq, spectra, 
+                                                      LOG_FREQ_POINTS, FREQ_RANGE)
+            freq_range = None
         
         # parameterize (fit both with and without knee parametere)
+        df_ic = pd.DataFrame({'chan_idx' : np.arange(len(spectra))})
+        peak_fits = None
         for ap_mode in AP_MODE:
-            fg = SpectralGroupModel(**SPEC_PARAM_SETTINGS, aperiodic_mode=ap_mode, verbose=False)
+            if ap_mode == 'knee' and JOINT_AP_FIT:
+                # use peaks from fixed fit as peak guesses
+                model_class = SharedPeakGroupModel
+                kwargs = {'initial_peak_fits' : peak_fits}
+            else:
+                model_class = SpectralGroupModel
+                kwargs = {}
+            if FIT_INSTRUMENTATION:
+                model_class = instrument(model_class)
+            fg = model_class(**SPEC_PARAM_SETTINGS, aperiodic_mode=ap_mode, 
+                             verbose=False, **kwargs)
             fg.set_check_modes(check_freqs=False, check_data=False)
-            fg.fit(freq, spectra, n_jobs=N_JOBS, freq_range=FREQ_RANGE)
+            fit_group_cached(fg, freq_fit, spectra_fit, freq_range=freq_range, 
+                             n_jobs=N_JOBS, 
+                             cache_dir=None if FIT_INSTRUMENTATION else dir_cache, 
+                             max_size=FIT_CACHE_SIZE, backend=FIT_BACKEND,
+                             exclude=exclude)
+            if FIT_INSTRUMENTATION:
+                fit_stats.append(fit_stats_to_df(fg, file=fname, 
+                                                 ap_mode=ap_mode))
+            if ap_mode == 'fixed' and JOINT_AP_FIT:
+                peak_fits = compute_peak_fits(fg)
+
+            # evaluate fits on the native grid (saved results store only the 
+            # frequency range and resolution)
+            if LOG_FREQ_POINTS is not None:
+                set_group_data(fg, freq, spectra, FREQ_RANGE)
+
+            # compute information criteria for model comparison
+            df_ic[f"aic_{ap_mode}"], df_ic[f"bic_{ap_mode}"] = \
+                compute_information_criteria(fg)
             
             # save results 
             fname_out = fname.replace('.npz', f'_params_{ap_mode}')
             fg.save(f"{dir_output}/{fname_out}", save_results=True, 
                     save_settings=True, save_data=True)
-            fg.save_report(f"{dir_output}/reports/{fname_out}")
+            reports.submit(fg, f"{dir_output}/reports/{fname_out}")
+
+        # save model comparison (preferred aperiodic mode: lowest BIC)
+        df_ic['preferred_mode'] = compute_preferred_mode(
+            {ap_mode : df_ic[f"bic_{ap_mode}"].values for ap_mode in AP_MODE})
+        df_ic.to_csv(f"{dir_output}/{fname.replace('.npz', '_model_comparison.csv')}", 
+                     index=False)
 
         # display progress
         hour, min, sec = hour_min_sec(timer() - t_start_c)
         print(f"\t\tCondition completed in {hour} hour, {min} min, and {sec:0.1f} s")
 
+    # save fit statistics and display slowest categories
+    if FIT_INSTRUMENTATION:
+        save_fit_stats(fit_stats, f"{dir_results}/fit_stats_step4.csv")
+
+    # wait for reports to finish
+    reports.close()
+
     # display progress
     hour, min, sec = hour_min_sec(timer() - t_start)
     print(f"Total PSD analysis time: {hour} hour, {min} min, and {sec:0.1f} s")
@@ -89,51 +170,92 @@ def parameterize_tfr():
     # load alpha/beta bandpower modulation results (resampling ananlysis)
     results = load_stats()
     df = results.loc[results['sig_either_both']].reset_index(drop=True)
-    
-    # loop through significant channels
-    for i_chan, row in df.iterrows():
-        # display progress
-        print(f"    Analyzing file {i_chan}/{len(df)}") 
-        t_start_c = timer()
 
-        # loop through materials and conditions
+    # create tasks for significant channels (one for each material, 
+    # memory condition, and aperiodic mode)
+    tasks = dict()
+    for _, row in df.iterrows():
         for material in ['words', 'faces']:
             for memory in ['hit', 'miss']:
-
-                # check if output file already exists
                 fname = f"{row['patient']}_{material}_{memory}_chan{row['chan_idx']}_tfr.npz"
-                temp = f"{dir_output}/{fname.replace('.npz','_param_knee.json')}"
-                if os.path.exists(temp):
-                    continue
-
-                # load tfr
-                data_in = np.load(f"{dir_input}/{fname}")
-                tfr_in = data_in['tfr']
-                freq = data_in['freq']
-                
-                # average over trials
-                tfr = np.squeeze(np.nanmean(tfr_in, axis=0))
-                
-                # parameterize
                 for ap_mode in AP_MODE:
-                    fg = SpectralGroupModel(**SPEC_PARAM_SETTINGS, 
-                                            aperiodic_mode=ap_mode, verbose=False)
-                    fg.set_check_modes(check_freqs=False, check_data=False)
-                    fg.fit(freq, tfr.T, n_jobs=N_JOBS, freq_range=FREQ_RANGE)
-                    
-                    # save results and report
                     fname_out = fname.replace('.npz','_param_%s' %ap_mode)
-                    fg.save(f"{dir_output}/{fname_out}", save_results=True, 
-                            save_settings=True)
-                    fg.save_report(f"{dir_output}/reports/{fname_out}")
+                    tasks[fname_out] = (f"{dir_input}/{fname}", 
+                                        f"{dir_output}/{fname_out}", ap_mode)
 
-        # display progress
-        hour, min, sec = hour_min_sec(timer() - t_start_c)
-        print(f"\tFile completed in {hour} hour, {min} min, and {sec :0.1f} s")
+    # run tasks in parallel (completed tasks are recorded in the journal and 
+    # skipped when resuming)
+    reports = ReportPool(REPORT_MODE, n_workers=N_REPORT_WORKERS)
+    failed = run_task_queue(
+        param_tfr, tasks, f"{dir_output}/tfr_param_journal.txt", 
+        n_workers=N_JOBS, 
+        callback=lambda key, fg: reports.submit(fg, f"{dir_output}/reports/{key}"))
+    if failed:
+        print(f"{len(failed)} tasks failed; run again to retry")
+
+    # save fit statistics of all tasks (incl. tasks completed in earlier runs)
+    if FIT_INSTRUMENTATION:
+        fnames = [f"{fname_out}_fit_stats.csv" for _, fname_out, _ in tasks.values()]
+        fit_stats = [pd.read_csv(f) for f in fnames if os.path.exists(f)]
+        if fit_stats:
+            save_fit_stats(fit_stats, 
+                           f"{PROJECT_PATH}/data/results/fit_stats_step4_tfr.csv")
+
+    # wait for reports to finish
+    reports.close()
 
     # display progress
     hour, min, sec = hour_min_sec(timer() - t_start)
     print(f"Total TFR analysis time: {hour} hour, {min} min, and {sec :0.1f} s")
+
+
+def param_tfr(fname_in, fname_out, ap_mode):
+    """
+    Parameterize the trial-averaged TFR of one channel and condition (one 
+    task of parameterize_tfr). Returns the fit model without data.
+    """
+
+    # load tfr and average over trials
+    data_in = np.load(fname_in)
+    tfr = np.squeeze(np.nanmean(data_in['tfr'], axis=0))
+    freq = data_in['freq']
+
+    # parameterize (serially; tasks are run in parallel)
+    if TRACKING:
+        group_model = TrackingGroupModel
+    elif WARM_START:
+        group_model = WarmStartGroupModel
+    else:
+        group_model = SpectralGroupModel
+    if FIT_INSTRUMENTATION:
+        group_model = instrument(group_model)
+    fg = group_model(**SPEC_PARAM_SETTINGS, aperiodic_mode=ap_mode, 
+                     verbose=False)
+    fg.set_check_modes(check_freqs=False, check_data=False)
+    fg.fit(freq, tfr.T, n_jobs=1, freq_range=FREQ_RANGE)
+
+    # save results (and which time bins were fully refit, if tracking)
+    fg.save(fname_out, save_results=True, save_settings=True)
+    if TRACKING:
+        np.save(f"{fname_out}_refit_mask.npy", fg.refit_mask_)
+    if FIT_INSTRUMENTATION:
+        fit_stats_to_df(fg, file=os.path.basename(fname_in), 
+                        ap_mode=ap_mode).to_csv(f"{fname_out}_fit_stats.csv", 
+                                                index=False)
+
+    return strip_data(fg)
+
+
+def save_fit_stats(fit_stats, fname):
+    """
+    Combine and save fit statistics (list of dataframes; see 
+    specparam_utils.fit_stats_to_df), and display the slowest categories.
+    """
+
+    fit_stats = pd.concat(fit_stats, ignore_index=True)
+    fit_stats.to_csv(fname, index=False)
+    print("\nFit time by category (slowest first):")
+    print(summarize_fit_stats(fit_stats).head(10).to_string())
      
 
 def load_stats():
@@ -1,26 +1,36 @@
 """
 Sensitivity analysis for SpecParam hyperparameters.
 
+Inputs are loaded once, and the initial aperiodic fit of each spectrum (which
+does not depend on the peak hyperparameters) is shared across all runs. Runs
+are executed in parallel.
+
 """
 
 # Imports
 import os
 import numpy as np
 import pandas as pd
-from specparam import SpectralGroupModel
+from joblib import Parallel, delayed
 
 # Imports - custom
 import sys
 sys.path.append("code")
 from paths import PROJECT_PATH
-from settings import N_JOBS, SPEC_PARAM_SETTINGS, FREQ_RANGE, BANDS
+from settings import (N_JOBS, SPEC_PARAM_SETTINGS, FREQ_RANGE, BANDS, 
+                      FIT_CACHE_SIZE, JOINT_AP_FIT)
 from utils import get_start_time, print_time_elapsed
 from specparam_utils import (compute_band_power, compute_adjusted_band_power, 
-                             compute_adj_r2)
+                             compute_adj_r2, compute_initial_ap_fits,
+                             SharedAperiodicGroupModel, SharedFitsGroupModel,
+                             compute_peak_fits, compute_information_criteria,
+                             compute_preferred_mode)
+from fit_cache import fit_group_cached
 
 # analysis settings - compute band power
 BAND_POWER_METHOD = 'mean'
 LOG_POWER = True
+AP_MODE = ['fixed', 'knee'] # aperiodic mode for SpecParam
 
 
 def main():
@@ -28,6 +38,7 @@ def main():
     t_start = get_start_time()
 
     # identify / create directories
+    dir_input = f"{PROJECT_PATH}/data/ieeg_spectral_results"
     dir_output = f"{PROJECT_PATH}/data/specparam_sensitivity_analysis"
     dir_results = f"{PROJECT_PATH}/data/results"
     for path in [dir_output, dir_results]:
@@ -39,22 +50,41 @@ def main():
     peak_width_limits = [[2, 4], [2, 8], [2, 12], [2, 16], [2, 20]]
     max_n_peaks = [0, 2, 4, 6, 8]
     peak_threshold = [1, 2, 3, 4, 5]
-    
-    # run step 4 with each hyperparameter value
-    i_run = 0
-    n_runs = len(peak_width_limits) + len(max_n_peaks) + len(peak_threshold)
+
+    # create grid of settings (one hyperparameter varied at a time)
+    grid = []
     for hyperparameter in hyperparameters:
         for value in locals()[hyperparameter]:
-            print(f"\n\nSensitivity analysis, run {i_run+1}/{n_runs}") # display progress
             specparam_settings = SPEC_PARAM_SETTINGS.copy() # copy settings
             specparam_settings[hyperparameter] = value # update settings
-            step_4(specparam_settings, i_run, dir_output) # run main
-            i_run += 1
+            grid.append(specparam_settings)
+
+    # load stats - analyze only task-modulated channels
+    df_stats = load_stats()
+    df_info = df_stats.loc[df_stats['sig_both'], ['patient', 'chan_idx']].reset_index(drop=True)
+
+    # load spectra once, and compute initial aperiodic fits (independent of 
+    # the peak hyperparameters) to share across all runs
+    print("\nLoading spectra and computing initial aperiodic fits...")
+    data = []
+    initial_ap_fits = {ap_mode : dict() for ap_mode in AP_MODE}
+    files = [f for f in os.listdir(dir_input) if f.startswith('psd') & (not 'epoch' in f)]
+    for fname in files:
+        data_in = np.load(f"{dir_input}/{fname}")
+        spectra = data_in['spectra'][df_stats['sig_both']]
+        data.append([fname, data_in['freq'], spectra])
+        for ap_mode in AP_MODE:
+            initial_ap_fits[ap_mode].update(compute_initial_ap_fits(
+                data_in['freq'], spectra, FREQ_RANGE, ap_mode))
+    
+    # run step 4 with each hyperparameter value, in parallel
+    print(f"\nRunning sensitivity analysis ({len(grid)} runs)...")
+    df_list = Parallel(n_jobs=N_JOBS, verbose=10)(
+        delayed(step_4)(specparam_settings, i_run, data, df_info, 
+                        initial_ap_fits, dir_output) 
+        for i_run, specparam_settings in enumerate(grid))
 
     # combine results across runs
-    df_list = []
-    for f in os.listdir(dir_output):
-        df_list.append(pd.read_csv(f"{dir_output}/{f}"))
     results = pd.concat(df_list)
     results.to_csv(f"{dir_results}/spectral_parameters_sa.csv", index=False)
 
@@ -63,37 +93,39 @@ def main():
     print_time_elapsed(t_start, "Total analysis time: ")
 
 
-def step_4(specparam_settings, i_run, dir_output):
+def step_4(specparam_settings, i_run, data, df_info, initial_ap_fits, 
+           dir_output):
     # display progress
     t_start_c = get_start_time()
 
     # identify / create directories
-    dir_input = f"{PROJECT_PATH}/data/ieeg_spectral_results"
+    dir_cache = f"{PROJECT_PATH}/data/fit_cache"
     
     # loop through conditions
     df_list = []
-    files = [f for f in os.listdir(dir_input) if f.startswith('psd') & (not 'epoch' in f)]
-    for i_file, fname in enumerate(files):
-        # display progress
-        print(f"\tAnalyzing file {i_file+1}/{len(files)}: {fname}")
-
-        # load results for condition
-        data_in =  np.load(f"{dir_input}/{fname}")
-        spectra = data_in['spectra']
-        freq = data_in['freq']
-
-        # load stats - analyze only task-modulated channels
-        df_stats = load_stats()
-        spectra = spectra[df_stats['sig_both']]
-        df_info = df_stats.loc[df_stats['sig_both'], ['patient', 'chan_idx']].reset_index(drop=True)
-        
+    for fname, freq, spectra in data:
         # parameterize (fit both with and without knee parametere)
-        for ap_mode in ['fixed', 'knee']:
-            # fit model
-            sgm = SpectralGroupModel(**specparam_settings, 
-                                     aperiodic_mode=ap_mode, verbose=False)
+        df_modes = dict()
+        peak_fits = None
+        for ap_mode in AP_MODE:
+            # fit model (knee: optionally use peaks from fixed fit)
+            if ap_mode == 'knee' and JOINT_AP_FIT:
+                sgm = SharedFitsGroupModel(**specparam_settings, 
+                                           aperiodic_mode=ap_mode, 
+                                           verbose=False,
+                                           initial_ap_fits=initial_ap_fits[ap_mode],
+                                           initial_peak_fits=peak_fits)
+            else:
+                sgm = SharedAperiodicGroupModel(**specparam_settings, 
+                                                aperiodic_mode=ap_mode, 
+                                                verbose=False,
+                                                initial_ap_fits=initial_ap_fits[ap_mode])
             sgm.set_check_modes(check_freqs=False, check_data=False)
-            sgm.fit(freq, spectra, n_jobs=N_JOBS, freq_range=FREQ_RANGE)
+            fit_group_cached(sgm, freq, spectra, freq_range=FREQ_RANGE, 
+                             n_jobs=1, cache_dir=dir_cache, 
+                             max_size=FIT_CACHE_SIZE)
+            if ap_mode == 'fixed' and JOINT_AP_FIT:
+                peak_fits = compute_peak_fits(sgm)
 
             # convert results to dataframe and store
             df_params = sgm.to_df(0)
@@ -108,27 +140,30 @@ def step_4(specparam_settings, i_run, dir_output):
             df.insert(8, 'peak_threshold', specparam_settings['peak_threshold'])
 
             # add adjusted r-squared
-            r2_adj = []
-            for i_model in range(len(sgm)):
-                sm = sgm.get_model(i_model, regenerate=True)
-                if np.isnan(sm.r_squared_):
-                    r2_adj.append(np.nan)
-                else:
-                    r2_adj.append(compute_adj_r2(sm))
-            df.insert(len(df.columns), 'r2_adj', r2_adj)
+            df.insert(len(df.columns), 'r2_adj', compute_adj_r2(sgm))
+            aic, bic = compute_information_criteria(sgm)
+            df.insert(len(df.columns), 'aic', aic)
+            df.insert(len(df.columns), 'bic', bic)
 
             # compute toatl and aperiodic-adjusted power and add to dataframe
             for band in BANDS:
                 total_power = compute_band_power(freq, spectra,
                                             BANDS[band], log_power=LOG_POWER,
                                             method=BAND_POWER_METHOD)
-                adjusted_power = compute_adjusted_band_power(sm, BANDS[band], 
+                adjusted_power = compute_adjusted_band_power(sgm, BANDS[band], 
                                                     method=BAND_POWER_METHOD,
                                                     log_power=LOG_POWER)
                 df.insert(len(df.columns), f'{band}_total_power', total_power)
                 df.insert(len(df.columns), f'{band}_adjusted_power', 
                           adjusted_power)
             # store
+            df_modes[ap_mode] = df
+
+        # add preferred aperiodic mode (lowest BIC) and store
+        preferred_mode = compute_preferred_mode({ap_mode : df['bic'].values 
+                                                 for ap_mode, df in df_modes.items()})
+        for df in df_modes.values():
+            df.insert(len(df.columns), 'preferred_mode', preferred_mode)
             df_list.append(df)
 
     # combine results and save
@@ -136,7 +171,9 @@ def step_4(specparam_settings, i_run, dir_output):
     results.to_csv(f"{dir_output}/spectral_parameters_{i_run}.csv", index=False)
 
     # display progress
-    print_time_elapsed(t_start_c, "\n\tRun completed in: ")
+    print_time_elapsed(t_start_c, f"\n\tRun {i_run} completed in: ")
+
+    return results
      
 
 def load_stats():
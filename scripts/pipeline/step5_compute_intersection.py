@@ -39,13 +39,14 @@ def main():
                 param_post.load(join(dir_input, 'psd_%s_%s_poststim_params_%s.json' %(material, memory, ap_mode)))
         
                 # calc intersection 
-                results = compute_intersections(param_pre, param_post)
-                intersection, intersection_idx = results
+                results = compute_intersections(param_pre, param_post, 
+                                                return_status=True)
+                intersection, intersection_idx, status = results
                 
                 # save results
                 fname_out = f"intersection_results_{material}_{memory}_{ap_mode}"
                 np.savez(join(dir_output, fname_out), intersection=intersection, 
-                         intersection_idx=intersection_idx)
+                         intersection_idx=intersection_idx, status=status)
 
     
 if __name__ == "__main__":
@@ -1,79 +1,76 @@
 """
-This script computes the intersection frequency of the baseline and encoding  
-power spectra. It analyzes the spectral results from 
+This script computes the intersection frequency of the baseline and encoding
+power spectra. It analyzes the spectral results from
 scripts.ieeg_7_single_trial_parameterization.py
 
+The aperiodic parameters of all trials and channels of each patient and
+condition are read from the parameter stores at once, and the intersections
+are computed in a single vectorized step. Results are saved as one row per
+trial and channel.
+
 """
 
 
 # Imports - general
 import os
+import numpy as np
 import pandas as pd
-from specparam import SpectralGroupModel
 
 # import - custom
 import sys
 sys.path.append("code")
 from paths import PROJECT_PATH
 from info import PATIENTS
-from specparam_utils import compute_intersections
+from specparam_utils import compute_store_intersections
+from param_store import ParamStore
 
 # settings
-AP_MODE = ['knee'] # array. aperiodic modes for SpecParam. 
+AP_MODE = ['knee'] # array. aperiodic modes for SpecParam.
 
 def main():
     # identify / create directories
     dir_input = f"{PROJECT_PATH}/data/ieeg_psd_trial_params"
     dir_output = f"{PROJECT_PATH}/data/results"
-    if not os.path.exists(dir_output): 
+    if not os.path.exists(dir_output):
         os.makedirs(dir_output)
-        
+
     df_list = []
     # loop through all patients and conditions
     for patient in PATIENTS:
         for material in ['words', 'faces']:
             for memory in ['hit', 'miss']:
                 for ap_mode in AP_MODE:
-                    i_trial = 0
-                    while True:
-                        try:
-                            # load parameterization results
-                            param_pre = SpectralGroupModel()
-                            param_pre.load(f"{dir_input}/{patient}_{material}_{memory}_prestim_psd_params_{ap_mode}_{i_trial}.json")
-                            param_post = SpectralGroupModel()
-                            param_post.load(f"{dir_input}/{patient}_{material}_{memory}_poststim_psd_params_{ap_mode}_{i_trial}.json")
-                        except FileNotFoundError:
-                            print(f"File not found: {dir_input}/{patient}_{material}_{memory}_poststim_psd_params_{ap_mode}_{i_trial}.json")
-                            break
+                    # load parameterization results
+                    fname_pre = f"{dir_input}/{patient}_{material}_{memory}_prestim_psd_params_{ap_mode}.pstore"
+                    fname_post = f"{dir_input}/{patient}_{material}_{memory}_poststim_psd_params_{ap_mode}.pstore"
+                    try:
+                        store_pre = ParamStore(fname_pre)
+                        store_post = ParamStore(fname_post)
+                    except FileNotFoundError:
+                        print(f"File not found: {fname_pre}")
+                        continue
+
+                    # calc intersection (all trials and channels)
+                    intersection, intersection_idx, status = \
+                        compute_store_intersections(store_pre, store_post,
+                                                    return_status=True)
+
+                    # store results
+                    n_trials, n_chans = intersection.shape
+                    df_list.append(pd.DataFrame({
+                        'patient': patient,
+                        'material': material,
+                        'memory': memory,
+                        'ap_mode': ap_mode,
+                        'i_trial': np.repeat(np.arange(n_trials), n_chans),
+                        'chan_idx': np.tile(np.arange(n_chans), n_trials),
+                        'intersection': intersection.ravel(),
+                        'intersection_idx': intersection_idx.ravel(),
+                        'status': status.ravel()}))
 
-                        # calc intersection 
-                        results = compute_intersections(param_pre, param_post)
-                        
-                        # store results
-                        df_list.append({'patient': patient,
-                                        'material': material,
-                                        'memory': memory, 
-                                        'ap_mode': ap_mode,
-                                        'i_trial': i_trial,
-                                        'intersection': results[0],
-                                        'intersection_idx': results[1]})
-                        
-                        # iterate trial
-                        i_trial += 1
-                    
     # save results
-    df = pd.DataFrame(df_list)
+    df = pd.concat(df_list, ignore_index=True)
     df.to_csv(os.path.join(dir_output, 'trial_intersection_results.csv'), index=False)
-    
+
 if __name__ == "__main__":
     main()
-
-
-
-
-
-
-
-
-
-
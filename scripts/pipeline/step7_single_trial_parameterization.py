@@ -11,16 +11,27 @@ rather than the average PSDs.
 import os
 import numpy as np
 import pandas as pd
-from specparam import SpectralGroupModel, fit_models_3d
+from specparam import SpectralGroupModel
 
 # Imports - custom
 import sys
 sys.path.append("code")
 from paths import PROJECT_PATH
-from settings import N_JOBS, SPEC_PARAM_SETTINGS, FREQ_RANGE, BANDS
-from utils import get_start_time, print_time_elapsed
-from specparam_utils import (compute_band_power, compute_adjusted_band_power,
-                             compute_adj_r2)
+from settings import (N_JOBS, SPEC_PARAM_SETTINGS, FREQ_RANGE, BANDS, 
+                      FIT_CACHE_SIZE, FIT_BACKEND, JOINT_AP_FIT, 
+                      REPORT_MODE, N_REPORT_WORKERS, FIT_INSTRUMENTATION, 
+                      EXCLUDE_CHANNELS, LOG_FREQ_POINTS)
+from utils import get_start_time, print_time_elapsed, get_excluded_channels
+from specparam_utils import (compute_group_band_powers,
+                             compute_adj_r2, SharedPeakGroupModel, 
+                             compute_peak_fits, compute_information_criteria,
+                             compute_preferred_mode, resample_log_freq,
+                             set_group_data, instrument, fit_stats_to_df, 
+                             summarize_fit_stats)
+from fit_cache import fit_models_3d_cached
+from report_utils import ReportPool
+from param_store import save_param_store, ParamStore
+from partitioned_results import write_partition, combine_partitions
 
 # settings
 BAND_POWER_METHOD = 'mean'
@@ -29,8 +40,10 @@ LOG_POWER = True
 def main():
     # identify / create directories
     dir_input = f"{PROJECT_PATH}/data/ieeg_psd"
+    dir_cache = f"{PROJECT_PATH}/data/fit_cache"
     dir_output = f"{PROJECT_PATH}/data/ieeg_psd_trial_params"
     dir_results = f"{PROJECT_PATH}/data/results"
+    dir_partitions = f"{dir_results}/psd_trial_params"
     if not os.path.exists(dir_output): 
         os.makedirs(f"{dir_output}/reports")
     if not os.path.exists(dir_results): 
@@ -40,7 +53,8 @@ def main():
     t_start = get_start_time()
     
     # init
-    df_list = []
+    reports = ReportPool(REPORT_MODE, n_workers=N_REPORT_WORKERS)
+    fit_stats = []
 
     # loop files
     files = [f for f in os.listdir(dir_input) if not 'epoch' in f]
@@ -53,25 +67,72 @@ def main():
         data_in =  np.load(f"{dir_input}/{fname}")
         spectra = data_in['psd']
         freq = data_in['freq']
+
+        # optionally exclude channels not selected in step3 (all trials)
+        exclude = None
+        if EXCLUDE_CHANNELS is not None:
+            n_chans = spectra.shape[1]
+            exclude = get_excluded_channels(
+                f"{dir_results}/ieeg_modulated_channels.csv", EXCLUDE_CHANNELS,
+                np.repeat(fname.split('_')[0], n_chans), np.arange(n_chans))
+
+        # resample to log-spaced frequencies for fitting (optional)
+        freq_fit, spectra_fit, freq_range = freq, spectra, FREQ_RANGE
+        if LOG_FREQ_POINTS is not None:
+            freq_fit, spectra_fit = resample_log_freq(freq, spectra, 
+                                                      LOG_FREQ_POINTS, FREQ_RANGE)
+            freq_range = None
         
         # parameterize (fit both with and without knee parametere)
+        df_modes = dict()
+        peak_fits = None
         for ap_mode in ['fixed', 'knee']:
-            # apply SpecParam
-            sgm = SpectralGroupModel(**SPEC_PARAM_SETTINGS, 
-                                     aperiodic_mode=ap_mode, verbose=False)
-            sgm.set_check_modes(check_data=False)
-            params = fit_models_3d(sgm, freq, spectra, 
-                                   n_jobs=N_JOBS, freq_range=FREQ_RANGE)
+            # apply SpecParam (knee: optionally use peaks from fixed fit)
+            # (optionally record fit statistics; fits are not cached)
+            if ap_mode == 'knee' and JOINT_AP_FIT:
+                model_class = SharedPeakGroupModel
+                kwargs = {'initial_peak_fits' : peak_fits}
+            else:
+                model_class, kwargs = SpectralGroupModel, dict()
+            if FIT_INSTRUMENTATION:
+                model_class = instrument(model_class)
+            sgm = model_class(**SPEC_PARAM_SETTINGS, aperiodic_mode=ap_mode, 
+                              verbose=False, **kwargs)
+            sgm.set_check_modes(check_freqs=LOG_FREQ_POINTS is None, 
+                                check_data=False)
+            params = fit_models_3d_cached(sgm, freq_fit, spectra_fit, 
+                                          freq_range=freq_range, n_jobs=N_JOBS,
+                                          cache_dir=None if FIT_INSTRUMENTATION 
+                                          else dir_cache, 
+                                          max_size=FIT_CACHE_SIZE, 
+                                          backend=FIT_BACKEND, 
+                                          exclude=exclude)
+            if FIT_INSTRUMENTATION:
+                fit_stats.append(fit_stats_to_df(sgm, file=fname, 
+                                                 ap_mode=ap_mode))
+            if ap_mode == 'fixed' and JOINT_AP_FIT:
+                peak_fits = compute_peak_fits(sgm)
+
+            # evaluate fits on the native grid (optional resampling)
+            if LOG_FREQ_POINTS is not None:
+                set_group_data(sgm, freq, 
+                               np.reshape(spectra, [-1, spectra.shape[-1]]), 
+                               FREQ_RANGE)
+                params = [sgm.get_group(range(ii * spectra.shape[1], 
+                                              (ii + 1) * spectra.shape[1]))
+                          for ii in range(spectra.shape[0])]
+            aic, bic = compute_information_criteria(sgm)
             
-            # save results
-            for i_trial, sgm in enumerate(params):
-                fname_out = fname.replace('.npz', f'_params_{ap_mode}_{i_trial}')
-                sgm.save(f"{dir_output}/{fname_out}", save_results=True, 
-                        save_settings=True, save_data=True)
-                sgm.save_report(f"{dir_output}/reports/{fname_out}")
+            # save results (single parameter store for all trials)
+            fname_out = fname.replace('.npz', f'_params_{ap_mode}')
+            save_param_store(f"{dir_output}/{fname_out}.pstore", params, 
+                             freq, spectra, freq_range=FREQ_RANGE)
+            for i_trial, sgm_trial in enumerate(params):
+                reports.submit(sgm_trial, 
+                               f"{dir_output}/reports/{fname_out}_{i_trial}")
 
             # convert results to dataframe and store
-            df = pd.concat([sm.to_df(0) for sm in params])
+            df = ParamStore(f"{dir_output}/{fname_out}.pstore").to_df(0)
             f_parts = fname.split('_')
             df.insert(0, 'patient', f_parts[0])
             df.insert(1, 'trial', np.repeat(np.arange(spectra.shape[0]), spectra.shape[1]))
@@ -82,46 +143,46 @@ def main():
             df.insert(6, 'ap_mode', ap_mode)
 
             # add adjusted r-squared
-            r2_adj = []
-            for sgm in params:
-                for i_model in range(len(sgm)):
-                    sm = sgm.get_model(i_model, regenerate=True)
-                    if np.isnan(sm.r_squared_):
-                        r2_adj.append(np.nan)
-                    else:
-                        r2_adj.append(compute_adj_r2(sm))
-            df['r2_adj'] = r2_adj
-
-            # compute power and add to dataframe
-            for band in BANDS:
-                power_total = []
-                power_adjusted = []
-                for ii, sm in enumerate(params):
-                    # compute total band power 
-                    power = compute_band_power(freq, spectra[ii], BANDS[band], 
-                                               method=BAND_POWER_METHOD,
-                                               log_power=LOG_POWER)
-                    power_total.append(power)
-
-                    # compute adjusted band power
-                    power = compute_adjusted_band_power(sm, BANDS[band], 
-                                                        method=BAND_POWER_METHOD,
-                                                        log_power=LOG_POWER)
-                    power_adjusted.append(power)
-                
-                # add to dataframe
-                df[f"{band}"] = np.concatenate(power_total)
-                df[f"{band}_adj"] = np.concatenate(power_adjusted)
+            df['r2_adj'] = compute_adj_r2(sgm)
+            df['aic'] = aic
+            df['bic'] = bic
+
+            # compute total and adjusted power for all trials and add to 
+            # dataframe (aperiodic component shared across bands)
+            powers = compute_group_band_powers(
+                sgm, BANDS, freq, np.reshape(spectra, [-1, spectra.shape[-1]]), 
+                method=BAND_POWER_METHOD, log_power=LOG_POWER)
+            for column, power in powers.items():
+                df[column] = power
 
             # store
-            df_list.append(df)
+            df_modes[ap_mode] = df
+
+        # add preferred aperiodic mode (lowest BIC)
+        preferred_mode = compute_preferred_mode({ap_mode : df['bic'].values 
+                                                 for ap_mode, df in df_modes.items()})
+        for df in df_modes.values():
+            df['preferred_mode'] = preferred_mode
+
+        # save results for file (partitioned by patient/material/memory)
+        write_partition(dir_partitions, pd.concat(df_modes.values()), 
+                        fname.replace('.npz', ''))
 
         # display progress
         print_time_elapsed(t_start_c)
 
-    # combine results and save
-    results = pd.concat(df_list)
-    results.to_csv(f"{dir_results}/psd_trial_params_.csv", index=False)
+    # combine results and save (streamed from partitions)
+    combine_partitions(dir_partitions, f"{dir_results}/psd_trial_params_.csv")
+
+    # save fit statistics and display slowest categories
+    if FIT_INSTRUMENTATION:
+        fit_stats = pd.concat(fit_stats, ignore_index=True)
+        fit_stats.to_csv(f"{dir_results}/fit_stats_step7.csv", index=False)
+        print("\nFit time by category (slowest first):")
+        print(summarize_fit_stats(fit_stats).head(10).to_string())
+
+    # wait for reports to finish
+    reports.close()
 
     # display progress
     print("\n\nAnalysis complete!")
@@ -13,16 +13,20 @@ for each hyperparameter value, and then combined into a single csv file.
 import os
 import numpy as np
 import pandas as pd
-from specparam import SpectralGroupModel, fit_models_3d
+from specparam import SpectralGroupModel
 
 # Imports - custom
 import sys
 sys.path.append("code")
 from paths import PROJECT_PATH
-from settings import N_JOBS, SPEC_PARAM_SETTINGS, FREQ_RANGE, BANDS
+from settings import (N_JOBS, SPEC_PARAM_SETTINGS, FREQ_RANGE, BANDS, 
+                      FIT_CACHE_SIZE, FIT_BACKEND, JOINT_AP_FIT)
 from utils import get_start_time, print_time_elapsed
-from specparam_utils import (compute_band_power, compute_adjusted_band_power,
-                             compute_adj_r2)
+from specparam_utils import (compute_group_band_powers,
+                             compute_adj_r2, SharedPeakGroupModel, 
+                             compute_peak_fits, compute_information_criteria,
+                             compute_preferred_mode)
+from fit_cache import fit_models_3d_cached
 
 # settings
 BAND_POWER_METHOD = 'mean'
@@ -31,6 +35,7 @@ LOG_POWER = True
 def main(specparam_settings, i_run):
     # identify / create directories
     dir_input = f"{PROJECT_PATH}/data/ieeg_psd"
+    dir_cache = f"{PROJECT_PATH}/data/fit_cache"
     dir_output = f"{PROJECT_PATH}/data/specparam_sensitivity_analysis"
     if not os.path.exists(dir_output): 
         os.makedirs(f"{dir_output}")
@@ -54,13 +59,27 @@ def main(specparam_settings, i_run):
         freq = data_in['freq']
         
         # parameterize (fit both with and without knee parametere)
+        df_modes = dict()
+        peak_fits = None
         for ap_mode in ['fixed', 'knee']:
-            # apply SpecParam
-            sgm = SpectralGroupModel(**specparam_settings, 
-                                     aperiodic_mode=ap_mode, verbose=False)
+            # apply SpecParam (knee: optionally use peaks from fixed fit)
+            if ap_mode == 'knee' and JOINT_AP_FIT:
+                sgm = SharedPeakGroupModel(**specparam_settings, 
+                                           aperiodic_mode=ap_mode, 
+                                           verbose=False, 
+                                           initial_peak_fits=peak_fits)
+            else:
+                sgm = SpectralGroupModel(**specparam_settings, 
+                                         aperiodic_mode=ap_mode, verbose=False)
             sgm.set_check_modes(check_data=False)
-            params = fit_models_3d(sgm, freq, spectra, 
-                                   n_jobs=N_JOBS, freq_range=FREQ_RANGE)
+            params = fit_models_3d_cached(sgm, freq, spectra, 
+                                          freq_range=FREQ_RANGE, n_jobs=N_JOBS,
+                                          cache_dir=dir_cache, 
+                                          max_size=FIT_CACHE_SIZE, 
+                                          backend=FIT_BACKEND)
+            aic, bic = compute_information_criteria(sgm)
+            if ap_mode == 'fixed' and JOINT_AP_FIT:
+                peak_fits = compute_peak_fits(sgm)
 
             # convert results to dataframe and store
             df = pd.concat([sm.to_df(0) for sm in params])
@@ -77,38 +96,26 @@ def main(specparam_settings, i_run):
             df.insert(9, 'peak_threshold', specparam_settings['peak_threshold'])
 
             # add adjusted r-squared
-            r2_adj = []
-            for sgm in params:
-                for i_model in range(len(sgm)):
-                    sm = sgm.get_model(i_model, regenerate=True)
-                    if np.isnan(sm.r_squared_):
-                        r2_adj.append(np.nan)
-                    else:
-                        r2_adj.append(compute_adj_r2(sm))
-            df['r2_adj'] = r2_adj
-
-            # compute power and add to dataframe
-            for band in BANDS:
-                power_total = []
-                power_adjusted = []
-                for ii, sm in enumerate(params):
-                    # compute total band power 
-                    power = compute_band_power(freq, spectra[ii],
-                                                BANDS[band], method=BAND_POWER_METHOD,
-                                                log_power=LOG_POWER)
-                    power_total.append(power)
-
-                    # compute adjusted band power
-                    power = compute_adjusted_band_power(sm, BANDS[band], 
-                                                        method=BAND_POWER_METHOD,
-                                                        log_power=LOG_POWER)
-                    power_adjusted.append(power)
-                
-                # add to dataframe
-                df[f"{band}"] = np.concatenate(power_total)
-                df[f"{band}_adj"] = np.concatenate(power_adjusted)
+            df['r2_adj'] = compute_adj_r2(sgm)
+            df['aic'] = aic
+            df['bic'] = bic
+
+            # compute total and adjusted power for all trials and add to 
+            # dataframe (aperiodic component shared across bands)
+            powers = compute_group_band_powers(
+                sgm, BANDS, freq, np.reshape(spectra, [-1, spectra.shape[-1]]), 
+                method=BAND_POWER_METHOD, log_power=LOG_POWER)
+            for column, power in powers.items():
+                df[column] = power
 
             # store
+            df_modes[ap_mode] = df
+
+        # add preferred aperiodic mode (lowest BIC) and store
+        preferred_mode = compute_preferred_mode({ap_mode : df['bic'].values 
+                                                 for ap_mode, df in df_modes.items()})
+        for df in df_modes.values():
+            df['preferred_mode'] = preferred_mode
             df_list.append(df)
 
         # display progress
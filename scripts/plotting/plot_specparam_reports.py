@@ -0,0 +1,47 @@
+"""
+This script renders SpecParam reports on demand from saved parameterization
+results (step4 and step7). It is used when reports are not generated during
+fitting (REPORT_MODE = 'on_demand' in settings.py). Reports that already exist
+are skipped.
+
+Usage: python scripts/plotting/plot_specparam_reports.py [pattern]
+    pattern : filename pattern of the results to render (default: all results)
+    e.g. python scripts/plotting/plot_specparam_reports.py "pat02_words_*_knee"
+
+"""
+
+# Imports - standard
+from glob import glob
+
+# Imports - custom
+import sys
+sys.path.append("code")
+from paths import PROJECT_PATH
+from report_utils import render_report, render_store_reports
+
+# Settings
+DIRS = ['ieeg_psd_param', 'ieeg_tfr_param', 'ieeg_psd_trial_params']
+
+
+def main():
+    # get filename pattern
+    pattern = sys.argv[1] if len(sys.argv) > 1 else '*'
+
+    # loop through results directories
+    for dir_name in DIRS:
+        dir_input = f"{PROJECT_PATH}/data/{dir_name}"
+        files = sorted(glob(f"{dir_input}/{pattern}.json"))
+        stores = sorted(glob(f"{dir_input}/{pattern}.pstore"))
+        if len(files) + len(stores) == 0:
+            continue
+
+        # render reports
+        print(f"Rendering reports: {dir_name}")
+        for fname in files:
+            render_report(fname)
+        for fname in stores: # one report for each trial
+            render_store_reports(fname)
+
+
+if __name__ == "__main__":
+    main()
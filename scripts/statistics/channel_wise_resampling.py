@@ -20,8 +20,9 @@ import sys
 sys.path.append("code")
 from paths import PROJECT_PATH
 from info import PATIENTS
-from settings import AP_MODE, BANDS, SPEC_PARAM_SETTINGS, N_JOBS
+from settings import AP_MODE, BANDS, SPEC_PARAM_SETTINGS, N_JOBS, FIT_BACKEND
 from stats import gen_random_order, comp_resampling_pval
+from parallel_fit import fit_group
 
 # analysis/statistical settings
 N_ITER = 100 # number of iterations for permutation test
@@ -198,8 +199,8 @@ def calc_param_change(freq, spectra_0, spectra_1, ap_mode):
     sp_1 = sp_0.copy()
 
     # fit
-    sp_0.fit(freq, spectra_0, n_jobs=N_JOBS)
-    sp_1.fit(freq, spectra_1, n_jobs=N_JOBS)
+    fit_group(sp_0, freq, spectra_0, n_jobs=N_JOBS, backend=FIT_BACKEND)
+    fit_group(sp_1, freq, spectra_1, n_jobs=N_JOBS, backend=FIT_BACKEND)
     
     # calc difference in exponent of shuffled spectra
     exp_diff = sp_1.get_params('aperiodic', 'exponent') - \
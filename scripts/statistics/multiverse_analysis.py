@@ -0,0 +1,212 @@
+"""
+Multiverse analysis: test the pre- vs. post-stimulus difference in spectral
+features (hierarchical bootstrap) across combinations of analysis settings -
+aperiodic mode, frequency range, band power method, log-power, channel
+selection, and SpecParam hyperparameters.
+
+The analysis is run as a chain of stages (PSD -> fit -> band power ->
+statistics; see code/multiverse.py). Each distinct intermediate result is
+computed once and shared by all branches that depend on it, e.g. the SpecParam
+fits are shared across band power methods and channel selections. Results of
+all branches are saved to a single table.
+
+"""
+
+# Imports - standard
+import os
+import numpy as np
+import pandas as pd
+from specparam import SpectralGroupModel
+
+# Imports - custom
+import sys
+sys.path.append("code")
+from paths import PROJECT_PATH
+from settings import (N_JOBS, SPEC_PARAM_SETTINGS, FREQ_RANGE, BANDS, 
+                      FIT_CACHE_SIZE)
+from utils import get_start_time, print_time_elapsed
+from specparam_utils import compute_group_band_powers
+from fit_cache import fit_group_cached
+from paired_hierarchical_bootstrap import hierarchical_bootstrap
+from multiverse import expand_grid, run_multiverse, collect_results
+
+# settings - multiverse (all combinations)
+ANALYSIS_GRID = {
+    'ap_mode'           :   ['fixed', 'knee'],
+    'freq_range'        :   [FREQ_RANGE],
+    'band_power_method' :   ['mean', 'max'],
+    'log_power'         :   [True, False],
+    'channel_selection' :   ['sig_all', 'sig_any'], # see load_psd()
+}
+
+# settings - SpecParam hyperparameters (varied one at a time, as in step4sa)
+HYPERPARAMETER_GRID = {
+    'peak_width_limits' :   [[2, 4], [2, 8], [2, 12], [2, 16], [2, 20]],
+    'max_n_peaks'       :   [0, 2, 4, 6, 8],
+    'peak_threshold'    :   [1, 2, 3, 4, 5],
+}
+
+# settings - statistics
+FEATURES = ['exponent', 'alpha_adj', 'gamma_adj']
+N_ITERATIONS = 1000 # number of iterations for hierarchical bootstrap
+
+
+def main():
+
+    # display progress
+    t_start = get_start_time()
+
+    # identify / create directories
+    dir_input = f"{PROJECT_PATH}/data/ieeg_spectral_results"
+    dir_output = f"{PROJECT_PATH}/data/results"
+    if not os.path.exists(dir_output):
+        os.makedirs(f"{dir_output}")
+
+    # create branches: all combinations of analysis settings, for each
+    # hyperparameter setting
+    branches = [{**analysis, **hyperparameters} for analysis
+                in expand_grid(ANALYSIS_GRID) for hyperparameters
+                in expand_grid(HYPERPARAMETER_GRID, SPEC_PARAM_SETTINGS,
+                               one_at_a_time=True)]
+    print(f"Running multiverse analysis ({len(branches)} branches)...\n")
+
+    # define stages (each depends on the previous stage)
+    stages = [
+        ('psd', load_psd, []),
+        ('fit', fit_spectra, ['ap_mode', 'freq_range', 'peak_width_limits',
+                              'max_n_peaks', 'peak_threshold']),
+        ('band_power', compute_features, ['band_power_method', 'log_power']),
+        ('statistics', run_statistics, ['channel_selection'])
+    ]
+
+    # run multiverse and save results
+    results = run_multiverse(stages, branches, data=dir_input, n_jobs=N_JOBS)
+    results = collect_results(branches, results,
+                              list(ANALYSIS_GRID) + list(HYPERPARAMETER_GRID))
+    results.to_csv(f"{dir_output}/multiverse_analysis.csv", index=False)
+
+    # display progress
+    print(f"\n\nTotal analysis time:")
+    print_time_elapsed(t_start)
+
+
+def load_psd(dir_input):
+    """
+    Load PSDs (successful trials) of all channels that are task-modulated
+    within either material, with channel selections:
+    'sig_all': alpha and gamma modulated, 'sig_any': alpha or gamma modulated
+    (within material).
+    """
+
+    # load stats and identify task-modulated channels within each material
+    fname = f"{PROJECT_PATH}/data/results/band_power_statistics.csv"
+    df_stats = pd.read_csv(fname, index_col=0)
+    df_stats = df_stats.loc[df_stats['memory']=='hit']
+    df_stats['sig_all'] = df_stats['alpha_sig'] & df_stats['gamma_sig']
+    df_stats['sig_any'] = df_stats['alpha_sig'] | df_stats['gamma_sig']
+    df_stats = df_stats.pivot_table(index=['patient', 'chan_idx'],
+                                    columns='material',
+                                    values=['sig_all', 'sig_any'])
+    df_stats.columns = [f"{col[0]}_{col[1]}" for col in df_stats.columns]
+    df_stats = df_stats.astype(bool).reset_index()
+    mask = df_stats['sig_any_words'] | df_stats['sig_any_faces']
+
+    # load spectra
+    spectra = dict()
+    for material in ['words', 'faces']:
+        for epoch in ['pre', 'post']:
+            fname = f"psd_{material}_hit_{epoch}stim.npz"
+            data_in = np.load(f"{dir_input}/{fname}")
+            spectra[fname] = (data_in['freq'], data_in['spectra'][mask])
+
+    return {'info' : df_stats.loc[mask].reset_index(drop=True),
+            'spectra' : spectra}
+
+
+def fit_spectra(psd, ap_mode, freq_range, peak_width_limits, max_n_peaks,
+                peak_threshold):
+    """
+    Parameterize the PSDs of each condition.
+    """
+
+    # SpecParam settings
+    specparam_settings = {**SPEC_PARAM_SETTINGS,
+                          'peak_width_limits' : peak_width_limits,
+                          'max_n_peaks' : max_n_peaks,
+                          'peak_threshold' : peak_threshold}
+
+    # fit each condition
+    fits = dict()
+    for fname, (freq, spectra) in psd['spectra'].items():
+        sgm = SpectralGroupModel(**specparam_settings, aperiodic_mode=ap_mode,
+                                 verbose=False)
+        sgm.set_check_modes(check_freqs=False, check_data=False)
+        fit_group_cached(sgm, freq, spectra, freq_range=freq_range, n_jobs=1,
+                         cache_dir=f"{PROJECT_PATH}/data/fit_cache",
+                         max_size=FIT_CACHE_SIZE)
+        fits[fname] = sgm
+
+    return {**psd, 'fits' : fits}
+
+
+def compute_features(fit, band_power_method, log_power):
+    """
+    Create dataframe of aperiodic parameters and total and adjusted band power
+    of each channel and condition.
+    """
+
+    df_list = []
+    for fname, sgm in fit['fits'].items():
+        # aperiodic parameters
+        df = fit['info'].copy()
+        f_parts = fname.split('_')
+        df.insert(2, 'material', f_parts[1])
+        df.insert(3, 'memory', f_parts[2])
+        df.insert(4, 'epoch', f_parts[3].replace('stim.npz', ''))
+        df['offset'] = sgm.get_params('aperiodic', 'offset')
+        df['exponent'] = sgm.get_params('aperiodic', 'exponent')
+
+        # total and adjusted band power
+        freq, spectra = fit['spectra'][fname]
+        powers = compute_group_band_powers(sgm, BANDS, freq, spectra,
+                                           method=band_power_method,
+                                           log_power=log_power)
+        for column, power in powers.items():
+            df[column] = power
+        df_list.append(df)
+
+    return pd.concat(df_list, ignore_index=True)
+
+
+def run_statistics(df, channel_selection):
+    """
+    Test the difference between pre- and post-stimulus epochs for each
+    feature and material, across selected channels (hierarchical bootstrap).
+    """
+
+    rows = []
+    for material in ['words', 'faces']:
+        for feature in FEATURES:
+            # get selected channels
+            df_i = df.loc[(df['material']==material) &
+                          df[f"{channel_selection}_{material}"]]
+            df_i = df_i.dropna(subset=feature)
+            row = {'material' : material, 'feature' : feature,
+                   'n_channels' : len(df_i[['patient', 'chan_idx']].drop_duplicates()),
+                   'p_value' : np.nan, 'sign' : np.nan, 'true_mean' : np.nan}
+
+            # apply hierarchical bootstrap (reassign p-value of zero to 1/N)
+            if len(df_i) > 0:
+                p_value, sign, _, true_mean = hierarchical_bootstrap(
+                    df_i[['patient', 'chan_idx', 'epoch', feature]], feature,
+                    'epoch', 'patient', 'chan_idx', N_ITERATIONS,
+                    verbose=False, plot=False)
+                row.update({'p_value' : max(p_value, 1 / N_ITERATIONS),
+                            'sign' : sign, 'true_mean' : true_mean})
+            rows.append(row)
+
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    main()
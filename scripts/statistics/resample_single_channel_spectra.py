@@ -18,12 +18,15 @@ sys.path.append("code")
 from paths import PROJECT_PATH
 from info import PATIENTS
 from settings import (AP_MODE, BANDS, SPEC_PARAM_SETTINGS, N_JOBS, 
-                        BAND_POWER_METHOD, LOG_POWER)
+                        BAND_POWER_METHOD, LOG_POWER, FIT_BACKEND)
 from stats import gen_random_order, comp_resampling_pval
-from specparam_utils import compute_band_power, compute_adjusted_band_power
+from parallel_fit import fit_group
+from specparam_utils import (compute_band_power, compute_adjusted_band_power,
+                             fit_aperiodic_batch, gen_aperiodic_batch)
 
 # analysis/statistical settings
 N_ITER = 1000 # number of iterations for permutation test
+AP_FIT = 'specparam' # 'specparam' (full model) or 'batch' (aperiodic-only, vectorized; observed change is recomputed the same way)
 
 def main():
     # display progress
@@ -117,20 +120,35 @@ def resampling_analysis(freq, spectra_pre, spectra_post, df_true):
         spectra_0s, spectra_1s = shuffle_spectra(spectra_pre[:, i_chan], 
                                                  spectra_post[:, i_chan], order)
 
-        # parameterize shuffled spectra
-        sgm_0 = run_specparam(freq, spectra_0s)
-        sgm_1 = run_specparam(freq, spectra_1s)
-
-        # get spectral features and compute evoked change in each parameter
-        features_0 = get_spectral_features(freq, spectra_0s, sgm_0, BANDS)
-        features_1 = get_spectral_features(freq, spectra_1s, sgm_1, BANDS)
+        # parameterize shuffled spectra and get spectral features
+        if AP_FIT == 'batch':
+            features_0 = get_aperiodic_features(freq, spectra_0s, BANDS)
+            features_1 = get_aperiodic_features(freq, spectra_1s, BANDS)
+        else:
+            sgm_0 = run_specparam(freq, spectra_0s)
+            sgm_1 = run_specparam(freq, spectra_1s)
+            features_0 = get_spectral_features(freq, spectra_0s, sgm_0, BANDS)
+            features_1 = get_spectral_features(freq, spectra_1s, sgm_1, BANDS)
+
+        # compute evoked change in each parameter
         df_shuff = features_1 - features_0
 
+        # compute observed change in each parameter. For aperiodic-only fits,
+        # features of the observed (median) spectra are computed as for the
+        # shuffled spectra, rather than taken from the full model fits
+        if AP_FIT == 'batch':
+            spectra_true = np.array([np.nanmedian(spectra_pre[:, i_chan], 0),
+                                     np.nanmedian(spectra_post[:, i_chan], 0)])
+            features_true = get_aperiodic_features(freq, spectra_true, BANDS)
+            true_diffs = features_true.iloc[1] - features_true.iloc[0]
+        else:
+            true_diffs = {feature : np.squeeze(np.diff(
+                df_true.loc[i_chan, feature].values)) for feature in features}
+
         # compute p-values
         for i_feat, feature in enumerate(features):
-            true_diff = np.squeeze(np.diff(df_true.loc[i_chan, feature].values))
             pvalues[i_chan, i_feat] = comp_resampling_pval(df_shuff[feature], 
-                                                           true_diff)
+                                                           true_diffs[feature])
         # time it
         end = timer()
         print(f"\tcomplete in: {end-start:0.0f} seconds")
@@ -161,7 +179,7 @@ def run_specparam(freq, spectra):
     sgm = SpectralGroupModel(**SPEC_PARAM_SETTINGS, aperiodic_mode=AP_MODE, 
                               verbose=False)
     sgm.set_check_data_mode(False)
-    sgm.fit(freq, spectra, n_jobs=N_JOBS)
+    fit_group(sgm, freq, spectra, n_jobs=N_JOBS, backend=FIT_BACKEND)
     
     return sgm
 
@@ -188,6 +206,35 @@ def get_spectral_features(freq, spectra, sgm, bands):
     return df
         
 
+def get_aperiodic_features(freq, spectra, bands):
+
+    # fit aperiodic component (no peaks)
+    offset, knee, exponent, ap_params = fit_aperiodic_batch(
+        freq, spectra, ap_mode=AP_MODE, return_params=True)
+    df = pd.DataFrame({'offset' : offset, 'knee' : knee, 'exponent' : exponent})
+
+    # remove aperiodic component from spectra
+    spectra_ap = gen_aperiodic_batch(freq, ap_params)
+    if LOG_POWER:
+        spectra_adjusted = np.log10(spectra) - spectra_ap
+    else:
+        spectra_adjusted = spectra - 10**spectra_ap
+
+    # get band power results
+    for band in bands:
+        # add band power 
+        df[band] = compute_band_power(freq, spectra, bands[band], 
+                                      method=BAND_POWER_METHOD, 
+                                      log_power=LOG_POWER)
+
+        # add adjusted band power
+        df[f"{band}_adj"] = compute_band_power(freq, spectra_adjusted, 
+                                               bands[band], 
+                                               method=BAND_POWER_METHOD)
+
+    return df
+
+
 if __name__ == "__main__":
     main()
 